@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Benchmark finding the package of a path in a GPG space.
+
+Fills a fresh database with packages and compares the time taken to find the
+package of a path inside an encrypted package using the previous
+``LIKE CONCAT('%', current_path, '%')`` query and ``_encr_path2key_fingerprint``.
+
+Run from the repository root against the test settings (in-memory SQLite), or
+any other settings module with a disposable database:
+
+    PYTHONPATH=./storage_service \
+    DJANGO_SETTINGS_MODULE=storage_service.settings.test \
+    DJANGO_SECRET_KEY=1234 \
+    python scripts/benchmark_gpg_package_lookup.py --packages 100000
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+from uuid import uuid4
+
+import django
+
+
+def uuid_path(uuid):
+    tmp = uuid.replace('-', '')
+    return '/'.join(tmp[i:i + 4] for i in range(0, len(tmp), 4))
+
+
+def create_packages(count):
+    from locations.models import Location, Package, Space
+
+    space = Space.objects.create(
+        access_protocol=Space.GPG, path='/var/archivematica/gpg',
+        staging_path='/var/archivematica/gpg/staging')
+    location = Location.objects.create(
+        space=space, purpose=Location.AIP_STORAGE, relative_path='aips')
+    paths = []
+    batch = []
+    for _i in range(count):
+        uuid = str(uuid4())
+        path = '{}/transfer-{}'.format(uuid_path(uuid), uuid)
+        paths.append(path)
+        batch.append(Package(
+            uuid=uuid, current_location=location, current_path=path,
+            package_type=Package.AIP, status=Package.UPLOADED,
+            encryption_key_fingerprint=uuid))
+        if len(batch) == 1000:
+            Package.objects.bulk_create(batch)
+            batch = []
+    Package.objects.bulk_create(batch)
+    return location, paths
+
+
+def like_lookup(encr_path):
+    """The query used before the index on current_path."""
+    from django.db import connection
+    from locations.models import Package
+
+    sql = ('SELECT * FROM locations_package WHERE %s LIKE CONCAT(\'%%\','
+           ' current_path, \'%%\')')
+    if connection.vendor == 'sqlite':
+        sql = ('SELECT * FROM locations_package WHERE %s LIKE "%" ||'
+               ' current_path || "%"')
+    return list(Package.objects.raw(sql, [encr_path]))[0].encryption_key_fingerprint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packages', type=int, default=100000,
+                        help='Number of packages to create.')
+    parser.add_argument('--lookups', type=int, default=20,
+                        help='Number of lookups timed per method.')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'storage_service'))
+    django.setup()
+    from django.test.utils import setup_test_environment
+    from django.db import connection
+    from locations.models import gpg
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print('Creating {} packages...'.format(args.packages))
+        location, paths = create_packages(args.packages)
+        # Paths of files inside packages spread over the table
+        step = max(1, len(paths) // args.lookups)
+        encr_paths = [
+            os.path.join(location.full_path, path, 'data/objects/file.jpg')
+            for path in paths[::step][:args.lookups]]
+        for encr_path in encr_paths:
+            assert like_lookup(encr_path) == gpg._encr_path2key_fingerprint(encr_path)
+        for name, lookup in (('LIKE query', like_lookup),
+                             ('_encr_path2key_fingerprint', gpg._encr_path2key_fingerprint)):
+            elapsed = timeit.timeit(
+                lambda: [lookup(encr_path) for encr_path in encr_paths],
+                number=1)
+            print('{}: {:.2f} ms per lookup'.format(
+                name, 1000 * elapsed / len(encr_paths)))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""Benchmark indexing the files of a transfer from its METS.
+
+Writes a synthetic transfer METS listing many files, some of them missing
+from the processed structMap or renamed by a name cleanup event, and times
+``Package._parse_mets`` and ``Package.index_file_data_from_transfer_mets``.
+The previous implementation, which looked up the structMap and the amdSecs
+of each file with XPath and saved the files one at a time, is timed on a
+smaller METS since it takes quadratic time.
+
+Run from the repository root against the test settings (in-memory SQLite), or
+any other settings module with a disposable database:
+
+    PYTHONPATH=./storage_service \\
+    DJANGO_SETTINGS_MODULE=storage_service.settings.test \\
+    DJANGO_SECRET_KEY=1234 \\
+    python scripts/benchmark_transfer_mets_indexing.py --files 100000
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from uuid import uuid4
+
+import django
+from lxml import etree
+
+TRANSFER_UUID = 'de1b31fa-97dd-48e0-8417-03be78359531'
+DASHBOARD_UUID = '23879cf0-a21a-40ee-bc50-357186746d15'
+
+HEADER = """<?xml version='1.0' encoding='UTF-8'?>
+<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:premis="info:lc/xmlns/premis-v2" xmlns:xlink="http://www.w3.org/1999/xlink" OBJID="{transfer}">
+  <mets:metsHdr CREATEDATE="2018-01-01T00:00:00">
+    <mets:agent TYPE="OTHER" ROLE="CREATOR" OTHERTYPE="SOFTWARE">
+      <mets:name>{dashboard}</mets:name>
+      <mets:note>Archivematica dashboard UUID</mets:note>
+    </mets:agent>
+  </mets:metsHdr>
+"""
+
+AMDSEC = """  <mets:amdSec ID="digiprov-{uuid}">
+    <mets:digiprovMD ID="digiprovMD_{uuid}">
+      <mets:mdWrap MDTYPE="PREMIS:EVENT">
+        <mets:xmlData>
+          <premis:event>
+            <premis:eventType>{event_type}</premis:eventType>
+            <premis:eventOutcomeInformation>
+              <premis:eventOutcomeDetail>
+                <premis:eventOutcomeDetailNote>{note}</premis:eventOutcomeDetailNote>
+              </premis:eventOutcomeDetail>
+            </premis:eventOutcomeInformation>
+          </premis:event>
+        </mets:xmlData>
+      </mets:mdWrap>
+    </mets:digiprovMD>
+  </mets:amdSec>
+"""
+
+FILE = """      <mets:file ID="file-{uuid}" ADMID="digiprov-{uuid}">
+        <mets:FLocat xlink:href="objects/{name}" LOCTYPE="OTHER" OTHERLOCTYPE="SYSTEM"/>
+      </mets:file>
+"""
+
+FPTR = """      <mets:div LABEL="{name}" TYPE="Item"><mets:fptr FILEID="file-{uuid}"/></mets:div>
+"""
+
+
+def write_mets(path, count):
+    """Write a transfer METS of count files. Every 10th file is missing from
+    the processed structMap and every 20th was renamed."""
+    files = [(str(uuid4()), 'file {}.txt'.format(i)) for i in range(count)]
+    with open(path, 'w') as mets:
+        mets.write(HEADER.format(transfer=TRANSFER_UUID, dashboard=DASHBOARD_UUID))
+        for i, (uuid, name) in enumerate(files):
+            if i % 20 == 0:
+                note = ('Original name="%transferDirectory%objects/{}"; cleaned'
+                        ' up name="%transferDirectory%objects/{}"').format(
+                            name, name.replace(' ', '_'))
+                mets.write(AMDSEC.format(uuid=uuid, event_type='name cleanup', note=note))
+            else:
+                mets.write(AMDSEC.format(uuid=uuid, event_type='ingestion', note=''))
+        mets.write('  <mets:fileSec>\n    <mets:fileGrp USE="original">\n')
+        for uuid, name in files:
+            mets.write(FILE.format(uuid=uuid, name=name))
+        mets.write('    </mets:fileGrp>\n  </mets:fileSec>\n')
+        mets.write('  <mets:structMap TYPE="physical" LABEL="processed">\n'
+                   '    <mets:div LABEL="objects" TYPE="Directory">\n')
+        for i, (uuid, name) in enumerate(files):
+            if i % 10 != 9:
+                mets.write(FPTR.format(uuid=uuid, name=name))
+        mets.write('    </mets:div>\n  </mets:structMap>\n</mets:mets>\n')
+
+
+def legacy_parse_mets(package, mets_path):
+    """The files returned by the previous Package._parse_mets."""
+    from common import utils
+
+    doc = etree.parse(mets_path)
+    namespaces = {'m': utils.NSMAP['mets'],
+                  'p': utils.NSMAP['premis']}
+    mets = doc.xpath('/m:mets', namespaces=namespaces)[0]
+    package_basename = os.path.basename(package.current_path)
+    files_data = []
+    for f in mets.xpath('.//m:FLocat', namespaces=namespaces):
+        file_id = f.getparent().attrib['ID']
+        if mets.find('./m:structMap[@LABEL="processed"]//m:fptr[@FILEID="{}"]'.format(file_id), namespaces=namespaces) is None:
+            continue
+        relative_path = f.attrib['{' + utils.NSMAP['xlink'] + '}href']
+        uuid = file_id[-36:]
+        cleanup_events = mets.xpath('m:amdSec[@ID="digiprov-{}"]/m:digiprovMD/m:mdWrap/m:xmlData/p:event/p:eventType[text()="name cleanup"]/../p:eventOutcomeInformation/p:eventOutcomeDetail/p:eventOutcomeDetailNote/text()'.format(uuid), namespaces=namespaces, smart_strings=False)
+        if cleanup_events:
+            cleaned_up_name = re.match(r'.*cleaned up name="(.*)"$', cleanup_events[0])
+            if cleaned_up_name:
+                relative_path = cleaned_up_name.groups()[0].replace('%transferDirectory%', '', 1)
+        files_data.append({
+            "path": os.path.join(package_basename, relative_path),
+            "file_uuid": uuid
+        })
+    return files_data
+
+
+def legacy_index(package, files):
+    """The previous Package.index_file_data_from_transfer_mets."""
+    from locations.models import File
+
+    for f in files:
+        File.objects.update_or_create(source_id=f['file_uuid'],
+                                      source_package=TRANSFER_UUID,
+                                      accessionid='',
+                                      package=package,
+                                      name=f['path'],
+                                      origin=DASHBOARD_UUID)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def timed(name, function, *args):
+    start = time.time()
+    result = function(*args)
+    print('{}: {:.2f} s (peak RSS {:.0f} MB)'.format(
+        name, time.time() - start, max_rss_mb()))
+    return result
+
+
+def create_package():
+    from locations.models import Location, Package, Space
+
+    space = Space.objects.create(
+        access_protocol=Space.LOCAL_FILESYSTEM, path='/var/archivematica',
+        staging_path='/var/archivematica/staging')
+    location = Location.objects.create(
+        space=space, purpose=Location.BACKLOG, relative_path='backlog')
+    return Package.objects.create(
+        current_location=location, current_path='images-transfer-' + TRANSFER_UUID,
+        package_type=Package.TRANSFER, status=Package.UPLOADED)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100000,
+                        help='Number of files in the METS.')
+    parser.add_argument('--legacy-files', type=int, default=5000,
+                        help='Number of files in the METS indexed with the'
+                             ' previous implementation (0 to skip it).')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'storage_service'))
+    django.setup()
+    from django.test.utils import setup_test_environment
+    from django.db import connection
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        package = create_package()
+        for count, legacy in ((args.files, False), (args.legacy_files, True)):
+            if not count:
+                continue
+            prefix = os.path.join(tmp_dir, str(count))
+            mets_dir = os.path.join(prefix, 'metadata', 'submissionDocumentation')
+            os.makedirs(mets_dir)
+            mets_path = os.path.join(mets_dir, 'METS.xml')
+            write_mets(mets_path, count)
+            print('METS of {} files ({:.0f} MB), peak RSS {:.0f} MB'.format(
+                count, os.path.getsize(mets_path) / 1024.0 ** 2, max_rss_mb()))
+
+            files = timed('_parse_mets', lambda: package._parse_mets(prefix=prefix)['files'])
+            timed('index_file_data_from_transfer_mets',
+                  package.index_file_data_from_transfer_mets, prefix)
+            assert package.file_set.count() == len(files)
+            package.file_set.all().delete()
+            if legacy:
+                legacy_files = timed('previous _parse_mets', legacy_parse_mets, package, mets_path)
+                assert legacy_files == files
+                timed('previous indexing', legacy_index, package, legacy_files)
+                package.file_set.all().delete()
+    finally:
+        shutil.rmtree(tmp_dir)
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Pagination and caching of the results of Space.browse.
+
+Browse requests may ask for one page of a directory: at most ``limit``
+entries, ordered by name (``order_by='name'``, or ``'-name'`` for descending
+order), starting after the position in ``cursor`` and only including the
+entries whose name starts with ``name_prefix``. The page includes a
+``'next_cursor'`` key with the cursor of the following page, or None if it
+is the last one. Cursors are opaque strings: their format depends on the
+Space that returned them.
+
+Names are ordered by their bytes, which is the order object stores list
+their keys in.
+
+``BrowseCache`` keeps browse results in the Django cache, so they are shared
+by the Storage Service processes if the cache backend is.
+"""
+from __future__ import absolute_import
+
+# stdlib, alphabetical
+import hashlib
+import heapq
+import uuid
+
+# Core Django, alphabetical
+from django.core.cache import cache as default_cache
+
+# This project, alphabetical
+from common import utils
+
+ORDERINGS = ('name', '-name')
+
+# Sorts after all the keys in a directory: listing the keys after
+# prefix + name + AFTER_DIRECTORY skips everything in the directory ``name``.
+AFTER_DIRECTORY = b'/' + u'\U0010ffff'.encode('utf-8')
+
+
+def check_options(limit=None, cursor=None, order_by='name', name_prefix=None):
+    """
+    Validate pagination options.
+
+    :raises: ValueError if they are not valid.
+    """
+    if limit is not None and limit < 1:
+        raise ValueError('limit must be a positive integer')
+    if order_by not in ORDERINGS:
+        raise ValueError('order_by must be one of {}'.format(', '.join(ORDERINGS)))
+
+
+def paginate(names, limit=None, cursor=None, order_by='name', name_prefix=None):
+    """
+    Return one page of ``names``, where the cursor is the last name of the
+    previous page.
+
+    Only the names in the page are sorted, so names can be a large iterable.
+
+    :param names: Iterable of entry names, in any order.
+    :returns: Tuple of the list of names in the page and the next cursor.
+    """
+    check_options(limit, cursor, order_by, name_prefix)
+    reverse = order_by == '-name'
+    if name_prefix:
+        names = (name for name in names if name.startswith(name_prefix))
+    if cursor is not None:
+        if reverse:
+            names = (name for name in names if name < cursor)
+        else:
+            names = (name for name in names if name > cursor)
+    if limit is None:
+        return sorted(names, reverse=reverse), None
+    if reverse:
+        page = heapq.nlargest(limit + 1, names)
+    else:
+        page = heapq.nsmallest(limit + 1, names)
+    if len(page) > limit:
+        return page[:limit], page[limit - 1]
+    return page, None
+
+
+def paginate_results(results, **options):
+    """
+    Return one page of the complete ``results`` of Space.browse.
+
+    Used for Spaces that cannot list a directory one page at a time.
+    """
+    entries, next_cursor = paginate(results['entries'], **options)
+    directories = set(results['directories'])
+    properties = results.get('properties', {})
+    return {
+        'directories': [name for name in entries if name in directories],
+        'entries': entries,
+        'properties': dict((name, properties[name])
+                           for name in entries if name in properties),
+        'next_cursor': next_cursor,
+    }
+
+
+class BrowseCache(object):
+    """
+    Cache of the browse results of one Space.
+
+    Results are stored under keys including version tokens of the directory
+    listed and of each of its ancestors. ``invalidate`` replaces the tokens
+    affected by a change to a path, so that only the listings of that path,
+    of its ancestors and of the directories under it are missed afterwards.
+    Tokens are random, so a token evicted from the cache cannot bring back
+    older results.
+    """
+
+    def __init__(self, namespace, cache=None):
+        self.namespace = namespace
+        self.cache = cache or default_cache
+
+    @staticmethod
+    def _directories(path):
+        """Return the path of each ancestor of path, and of path itself."""
+        components = [c for c in utils.coerce_str(path).split('/')
+                      if c and c != '.']
+        return ['/'.join(components[:i]) for i in range(len(components) + 1)]
+
+    def _key(self, kind, value):
+        digest = hashlib.sha1(repr(value).encode('utf-8')).hexdigest()
+        return 'browse:{}:{}:{}'.format(self.namespace, kind, digest)
+
+    def _versions(self, keys):
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                self.cache.add(key, uuid.uuid4().hex, None)
+                versions[key] = self.cache.get(key)
+        return [versions[key] for key in keys]
+
+    def key(self, path, options):
+        """Return the key of the results of browsing path with options."""
+        directories = self._directories(path)
+        version_keys = [self._key('listing', directories[-1])]
+        version_keys += [self._key('subtree', d) for d in directories]
+        versions = self._versions(version_keys)
+        return self._key(
+            'results', (directories[-1], sorted(options.items()), versions))
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, results, ttl):
+        self.cache.set(key, results, ttl)
+
+    def invalidate(self, path):
+        """
+        Forget the results that may include path: the listings of its
+        ancestors, of path itself and of everything under it.
+        """
+        directories = self._directories(path)
+        versions = dict((self._key('listing', d), uuid.uuid4().hex)
+                        for d in directories)
+        versions[self._key('subtree', directories[-1])] = uuid.uuid4().hex
+        self.cache.set_many(versions, None)
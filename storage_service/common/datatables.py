@@ -0,0 +1,68 @@
+"""
+Server-side processing of the tables of the web UI.
+
+Tables displayed with DataTables in server-side mode request one page of
+rows at a time, with the ``iDisplayStart``, ``iDisplayLength``, ``sSearch``,
+``iSortCol_0``, ``sSortDir_0`` and ``sEcho`` parameters, and expect a JSON
+object with the cells of the rows of the page in ``aaData``.
+``page_response`` answers these requests from a queryset, so only the rows
+displayed are loaded whatever the size of the table.
+"""
+from __future__ import absolute_import
+
+# stdlib, alphabetical
+from functools import reduce
+import operator
+
+# Core Django, alphabetical
+from django.db.models import Q
+from django.http import HttpResponseBadRequest, JsonResponse
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+
+def page_response(request, queryset, columns, search_fields, render_rows):
+    """
+    Return the page of rows of queryset requested by DataTables.
+
+    :param queryset: Objects of all the rows of the table.
+    :param columns: For each column of the table, the field to sort it by,
+        or None if it cannot be sorted.
+    :param search_fields: Fields that are searched, case-insensitively,
+        for the search term.
+    :param render_rows: Function returning the list of cells of each object
+        of the page, given the list of objects.
+    """
+    try:
+        echo = int(request.GET.get('sEcho', 0))
+        start = int(request.GET.get('iDisplayStart', 0))
+        length = int(request.GET.get('iDisplayLength', DEFAULT_PAGE_SIZE))
+        sort_column = int(request.GET.get('iSortCol_0', 0))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid DataTables parameters')
+    start = max(start, 0)
+    # DataTables requests all the rows with -1
+    if length < 1 or length > MAX_PAGE_SIZE:
+        length = MAX_PAGE_SIZE
+
+    total = queryset.count()
+    filtered_total = total
+    search = request.GET.get('sSearch', '').strip()
+    if search and search_fields:
+        queryset = queryset.filter(reduce(operator.or_, (
+            Q(**{field + '__icontains': search}) for field in search_fields)))
+        filtered_total = queryset.count()
+
+    ordering = ['pk']
+    if 0 <= sort_column < len(columns) and columns[sort_column]:
+        prefix = '-' if request.GET.get('sSortDir_0') == 'desc' else ''
+        ordering = [prefix + columns[sort_column], prefix + 'pk']
+    page = list(queryset.order_by(*ordering)[start:start + length])
+
+    return JsonResponse({
+        'sEcho': echo,
+        'iTotalRecords': total,
+        'iTotalDisplayRecords': filtered_total,
+        'aaData': render_rows(page),
+    })
@@ -0,0 +1,371 @@
+"""
+Parallel, in-process copies of local files and directories.
+
+``copy_tree`` copies with the same semantics as the
+``rsync -t -O -r --chmod=Fug+rw,o-rwx,Dug+rwx,o-rwx`` command used by
+``Space.move_rsync`` for local paths:
+
+- a source directory with a trailing slash has its contents copied into the
+  destination, otherwise the directory itself is copied into it;
+- modification times of files are preserved, and files whose size and
+  modification time already match at the destination are skipped;
+- symbolic links and special files are skipped;
+- the permissions set by ``--chmod`` are applied when creating the files.
+
+Files are copied by a pool of threads. When the source and the destination
+are on the same filesystem, files are cloned with the ``FICLONE`` ioctl on
+filesystems supporting reflinks (Btrfs, XFS), so the copy is immediate and
+shares its blocks with the source until either is modified. Otherwise, or if
+cloning is not supported, files are copied with ``copy_file_range`` or
+``sendfile`` when the platform provides them so the data does not go through
+Python, and with buffered reads and writes as a last resort.
+
+``copy_tree`` can also hard link the files instead of copying them, for
+copies that are never modified.
+"""
+from __future__ import absolute_import, division
+
+# stdlib, alphabetical
+from concurrent import futures
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import stat
+import threading
+import time
+
+# Core Django, alphabetical
+from django.conf import settings
+
+LOGGER = logging.getLogger(__name__)
+
+BUFFER_SIZE = 1024 * 1024  # 1 MB
+
+# Permission bits set and cleared like rsync --chmod=Fug+rw,o-rwx,Dug+rwx,o-rwx
+FILE_MODE_SET = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP
+DIR_MODE_SET = FILE_MODE_SET | stat.S_IXUSR | stat.S_IXGRP
+MODE_CLEAR = stat.S_IRWXO
+
+# ioctl cloning a whole file, _IOW(0x94, 9, int) in linux/fs.h
+FICLONE = 0x40049409
+
+# Errors meaning a file cannot be cloned or linked, rather than a failure
+UNSUPPORTED_ERRNOS = frozenset(
+    getattr(errno, name) for name in (
+        'EBADF', 'EINVAL', 'EMLINK', 'ENOSYS', 'ENOTSUP', 'ENOTTY',
+        'EOPNOTSUPP', 'EPERM', 'EXDEV')
+    if hasattr(errno, name))
+
+# Seconds between progress log messages
+PROGRESS_INTERVAL = 30
+
+
+class CopyError(Exception):
+    """Raised when copying a tree fails."""
+
+    def __init__(self, message, errors=None):
+        super(CopyError, self).__init__(message)
+        self.errors = errors or []
+
+
+class CopyStats(object):
+    """Thread-safe counters of a copy, passed to the progress callback."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = 0
+        self.files_skipped = 0
+        self.files_cloned = 0
+        self.files_linked = 0
+        self.bytes = 0
+        self.directories = 0
+
+    def add_file(self, size, skipped=False, cloned=False, linked=False):
+        with self._lock:
+            if skipped:
+                self.files_skipped += 1
+                return
+            self.files += 1
+            self.bytes += size
+            self.files_cloned += int(cloned)
+            self.files_linked += int(linked)
+
+    def add_directory(self):
+        with self._lock:
+            self.directories += 1
+
+    def __str__(self):
+        return ('{} files ({} bytes) copied ({} cloned, {} linked), {} skipped,'
+                ' {} directories'.format(
+                    self.files, self.bytes, self.files_cloned,
+                    self.files_linked, self.files_skipped, self.directories))
+
+
+def copy_tree(source, destination, concurrency=None, verify=False,
+              progress=None, link=False, throttle=None):
+    """Copy the file or directory ``source`` to ``destination``, following
+    the rsync semantics described in the module docstring.
+
+    :param str source: Local path of a file or directory.
+    :param str destination: Local path to copy to. Its parent directories
+        must exist.
+    :param int concurrency: Number of files copied at the same time. Defaults
+        to settings.COPY_CONCURRENCY.
+    :param bool verify: If True, compare the MD5 of every copied file with its
+        source.
+    :param progress: Optional callable, called with a ``CopyStats`` at most
+        every PROGRESS_INTERVAL seconds and when the copy ends.
+    :param bool link: If True, hard link the files when the source and the
+        destination are on the same filesystem. The permissions of linked
+        files are left unchanged, since they are shared with the source, and
+        the copy must not be modified in place.
+    :param throttle: Optional callable, called with the number of bytes about
+        to be copied and returning when they can be, to limit the bandwidth.
+        Cloned and linked files are not throttled.
+    :returns: CopyStats of the copy.
+    :raises CopyError: if any file could not be copied.
+    """
+    if concurrency is None:
+        concurrency = settings.COPY_CONCURRENCY
+    stats = CopyStats()
+    target = _target_path(source, destination)
+    options = {
+        'verify': verify,
+        'same_fs': same_filesystem(source, os.path.dirname(
+            os.path.normpath(target))),
+        'link': link,
+        'throttle': throttle,
+    }
+    if not os.path.isdir(source):
+        _copy_file(source, target, stats, **options)
+        _report(progress, stats)
+        return stats
+
+    errors = []
+    last_report = time.time()
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        jobs = []
+        for src_path, dst_path in _walk(source, target, stats):
+            jobs.append(executor.submit(
+                _copy_file, src_path, dst_path, stats, **options))
+        for job in futures.as_completed(jobs):
+            try:
+                job.result()
+            except (IOError, OSError, CopyError) as err:
+                LOGGER.warning('Error copying: %s', err)
+                errors.append(err)
+            if progress and time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                _report(progress, stats)
+    _report(progress, stats)
+    if errors:
+        raise CopyError(
+            'Failed to copy {} files from {} to {}: {}'.format(
+                len(errors), source, destination, errors[0]),
+            errors)
+    LOGGER.info('Copied %s to %s: %s', source, destination, stats)
+    return stats
+
+
+def _report(progress, stats):
+    if progress is not None:
+        progress(stats)
+
+
+def same_filesystem(path, other_path):
+    """Return True if the existing paths are on the same filesystem."""
+    try:
+        return os.stat(path).st_dev == os.stat(other_path or '.').st_dev
+    except OSError:
+        return False
+
+
+def _target_path(source, destination):
+    """Return the path ``source`` is copied to, as rsync would."""
+    if os.path.isdir(source):
+        if source.endswith('/'):
+            return destination
+        return os.path.join(destination, os.path.basename(source))
+    if destination.endswith('/') or os.path.isdir(destination):
+        return os.path.join(destination, os.path.basename(source))
+    return destination
+
+
+def _walk(source, target, stats):
+    """Create the directories of the tree ``source`` under ``target`` and
+    yield the (source, destination) paths of its regular files.
+    """
+    for dirpath, dirnames, filenames in os.walk(source):
+        relative = os.path.relpath(dirpath, source)
+        dst_dir = os.path.normpath(os.path.join(target, relative))
+        _make_dir(dirpath, dst_dir)
+        stats.add_directory()
+        # os.walk lists symbolic links to directories in dirnames, but does
+        # not walk them; rsync skips them like other symbolic links.
+        for dirname in dirnames:
+            if os.path.islink(os.path.join(dirpath, dirname)):
+                LOGGER.debug('Skipping symbolic link %s',
+                             os.path.join(dirpath, dirname))
+        for filename in filenames:
+            src_path = os.path.join(dirpath, filename)
+            if not stat.S_ISREG(os.lstat(src_path).st_mode):
+                LOGGER.debug('Skipping non-regular file %s', src_path)
+                continue
+            yield src_path, os.path.join(dst_dir, filename)
+
+
+def _make_dir(src_dir, dst_dir):
+    mode = (os.stat(src_dir).st_mode | DIR_MODE_SET) & ~MODE_CLEAR
+    try:
+        os.mkdir(dst_dir, mode)
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+    os.chmod(dst_dir, stat.S_IMODE(mode))
+
+
+def _copy_file(src_path, dst_path, stats, verify=False, same_fs=False,
+               link=False, throttle=None):
+    src_stat = os.stat(src_path)
+    try:
+        dst_stat = os.stat(dst_path)
+    except OSError:
+        dst_stat = None
+    if (dst_stat is not None and dst_stat.st_size == src_stat.st_size and
+            int(dst_stat.st_mtime) == int(src_stat.st_mtime)):
+        stats.add_file(src_stat.st_size, skipped=True)
+        return
+    if same_fs and link and _link(src_path, dst_path, dst_stat is not None):
+        stats.add_file(src_stat.st_size, linked=True)
+        return
+    mode = stat.S_IMODE((src_stat.st_mode | FILE_MODE_SET) & ~MODE_CLEAR)
+    cloned = _copy_data(src_path, dst_path, src_stat.st_size, mode, same_fs,
+                        throttle)
+    os.chmod(dst_path, mode)
+    os.utime(dst_path, (src_stat.st_atime, src_stat.st_mtime))
+    if verify and _md5(src_path) != _md5(dst_path):
+        raise CopyError('Checksum mismatch copying {} to {}'.format(
+            src_path, dst_path))
+    stats.add_file(src_stat.st_size, cloned=cloned)
+
+
+def _link(src_path, dst_path, replace):
+    """Hard link ``src_path`` to ``dst_path``. Returns False if the
+    filesystem does not support it.
+    """
+    if replace:
+        os.remove(dst_path)
+    try:
+        os.link(src_path, dst_path)
+    except OSError as err:
+        if err.errno in UNSUPPORTED_ERRNOS:
+            return False
+        raise
+    return True
+
+
+def _copy_data(src_path, dst_path, size, mode, same_fs=False, throttle=None):
+    """Copy the contents of ``src_path`` to ``dst_path``, created with
+    ``mode``, in the kernel if possible. Throttled copies are made in chunks
+    of BUFFER_SIZE.
+
+    :returns: True if the file was cloned.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    with open(src_path, 'rb') as src:
+        dst_fd = os.open(dst_path, flags, mode)
+        with os.fdopen(dst_fd, 'wb') as dst:
+            if same_fs and _clone(src.fileno(), dst.fileno()):
+                return True
+            if throttle is not None or not _copy_in_kernel(
+                    src.fileno(), dst.fileno(), size):
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+                while True:
+                    data = src.read(BUFFER_SIZE)
+                    if not data:
+                        break
+                    if throttle is not None:
+                        throttle(len(data))
+                    dst.write(data)
+    return False
+
+
+def _clone(src_fd, dst_fd):
+    """Clone the file ``src_fd`` into ``dst_fd`` with the FICLONE ioctl.
+    Returns False if the filesystem does not support reflinks.
+    """
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except (IOError, OSError) as err:
+        if err.errno in UNSUPPORTED_ERRNOS:
+            return False
+        raise
+    return True
+
+
+def has_links(path):
+    """Return True if ``path`` or any file in it has other hard links."""
+    if not os.path.isdir(path):
+        return os.lstat(path).st_nlink > 1
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            file_stat = os.lstat(os.path.join(dirpath, filename))
+            if stat.S_ISREG(file_stat.st_mode) and file_stat.st_nlink > 1:
+                return True
+    return False
+
+
+def _copy_in_kernel(src_fd, dst_fd, size):
+    """Copy ``size`` bytes between file descriptors with copy_file_range or
+    sendfile. Returns False if neither is available or supported.
+    """
+    for name in ('copy_file_range', 'sendfile'):
+        func = getattr(os, name, None)
+        if func is None:
+            continue
+        offset = 0
+        try:
+            while offset < size:
+                if name == 'sendfile':
+                    sent = func(dst_fd, src_fd, offset, size - offset)
+                else:
+                    sent = func(src_fd, dst_fd, size - offset, offset, offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError as err:
+            if offset == 0 and err.errno in (errno.EINVAL, errno.ENOSYS,
+                                             errno.EXDEV, errno.ENOTSUP,
+                                             errno.EBADF):
+                continue
+            raise
+        return offset == size
+    return False
+
+
+def _md5(path):
+    checksum = hashlib.md5()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(BUFFER_SIZE), b''):
+            checksum.update(data)
+    return checksum.hexdigest()
+
+
+def chmod_tree(path, mode_set):
+    """Add the permission bits ``mode_set`` to ``path`` and, if it is a
+    directory, to everything in it, like ``chmod --recursive``.
+    """
+    paths = [path]
+    if os.path.isdir(path):
+        for dirpath, dirnames, filenames in os.walk(path):
+            paths.extend(os.path.join(dirpath, name)
+                         for name in dirnames + filenames)
+    for item in paths:
+        if os.path.islink(item):
+            continue
+        mode = os.stat(item).st_mode
+        os.chmod(item, stat.S_IMODE(mode | mode_set))
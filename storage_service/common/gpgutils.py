@@ -6,11 +6,19 @@ and decrypting things. It is in its own utility because this functionality is
 needed by both the GPG space and the administration view which can be used to
 manage (i.e., list, created, import, delete) GPG keys.
 
+Listing keys spawns a ``gpg`` process, so the list of keys is cached for
+``KEY_CACHE_TTL`` seconds and invalidated whenever keys are created, imported
+or deleted through this module. Encryption and decryption run in at most
+``settings.GPG_CONCURRENCY`` ``gpg`` processes at the same time.
+
 """
 
 from __future__ import absolute_import
 # stdlib, alphabetical
+from contextlib import contextmanager
 import logging
+import threading
+import time
 
 # Third party dependencies, alphabetical
 import gnupg
@@ -34,45 +42,92 @@ IMPORT_ERROR = 'import error'
 ENCR_WORKS = 'yes'
 ENCR_FAILS = 'no'
 
+# Seconds the list of keys is reused. Keys changed by other processes, e.g.,
+# other Storage Service workers, are seen after at most this time.
+KEY_CACHE_TTL = 60
+
 
 class GPG(object):
 
     def __init__(self):
         self._gpg = None
+        self._lock = threading.Lock()
 
     def __call__(self):
-        if not self._gpg:
-            gnupg_home_path = settings.GNUPG_HOME_PATH
-            if not gnupg_home_path:
-                Location = apps.get_model(app_label='locations',
-                                          model_name='Location')
-                ss_internal = Location.active.get(
-                    purpose=Location.STORAGE_SERVICE_INTERNAL)
-                gnupg_home_path = ss_internal.full_path
-            self._gpg = gnupg.GPG(gnupghome=gnupg_home_path)
+        with self._lock:
+            if not self._gpg:
+                gnupg_home_path = settings.GNUPG_HOME_PATH
+                if not gnupg_home_path:
+                    Location = apps.get_model(app_label='locations',
+                                              model_name='Location')
+                    ss_internal = Location.active.get(
+                        purpose=Location.STORAGE_SERVICE_INTERNAL)
+                    gnupg_home_path = ss_internal.full_path
+                self._gpg = gnupg.GPG(gnupghome=gnupg_home_path)
         return self._gpg
 
 
 gpg = GPG()
 
 
+class KeyCache(object):
+    """Thread-safe cache of the list of private keys in the keyring."""
+
+    def __init__(self, ttl=KEY_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._keys = None
+        self._expires = 0
+
+    def get(self):
+        """Return the cached ``gnupg.ListKeys``, listing the keys if needed."""
+        with self._lock:
+            if self._keys is None or time.time() >= self._expires:
+                self._keys = gpg().list_keys(True)  # ``True`` means return private keys
+                self._expires = time.time() + self.ttl
+            return self._keys
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+
+
+key_cache = KeyCache()
+
+_gpg_slots = None
+_gpg_slots_lock = threading.Lock()
+
+
+@contextmanager
+def gpg_slot():
+    """Wait until fewer than ``settings.GPG_CONCURRENCY`` encryption or
+    decryption processes are running in this process, and hold a slot while
+    running one.
+    """
+    global _gpg_slots
+    with _gpg_slots_lock:
+        if _gpg_slots is None:
+            _gpg_slots = threading.BoundedSemaphore(settings.GPG_CONCURRENCY)
+    with _gpg_slots:
+        yield
+
+
 def get_gpg_key(fingerprint):
     """Return the GPG key with fingerprint ``fingerprint`` or None if there is
     no such key in the SS's GPG keyring.
     """
-    key_map = gpg().list_keys(True).key_map  # ``True`` means return private keys
-    return key_map.get(fingerprint)
+    return key_cache.get().key_map.get(fingerprint)
 
 
 def get_gpg_key_list():
     """Return a list of all GPG keys as dicts. If the Storage Service default
     key does not exist, we create it here before returning the list.
     """
-    keys = gpg().list_keys(True)
+    keys = key_cache.get()
     default_key = get_default_gpg_key(keys)
     if not default_key:
         generate_default_gpg_key()
-        keys = gpg().list_keys(True)
+        keys = key_cache.get()
     return keys
 
 
@@ -104,6 +159,7 @@ def generate_default_gpg_key():
     )
     LOGGER.info('Creating default AM SS key with name %s', DFLT_KEY_REAL_NAME)
     gpg().gen_key(input_data)
+    key_cache.invalidate()
     LOGGER.info('Finished creating default AM SS key with name %s',
                 DFLT_KEY_REAL_NAME)
 
@@ -117,7 +173,9 @@ def generate_gpg_key(name_real, name_email):
         name_email=name_email,
         passphrase=DFLT_KEY_PASSPHRASE
     )
-    return gpg().gen_key(input_data)
+    key = gpg().gen_key(input_data)
+    key_cache.invalidate()
+    return key
 
 
 def import_gpg_key(ascii_armor):
@@ -126,6 +184,7 @@ def import_gpg_key(ascii_armor):
     indicating why and delete any key created in the process.
     """
     import_result = gpg().import_keys(ascii_armor)
+    key_cache.invalidate()
     if import_result.count == 1:
         fingerprint = import_result.fingerprints[0]
         it_works = encryption_works(fingerprint)
@@ -177,6 +236,7 @@ def export_gpg_key(fingerprint):
 def delete_gpg_key(fingerprint):
     """Delete the GPG key with fingerprint ``fingerprint``.  """
     result = gpg().delete_keys(fingerprint, True)
+    key_cache.invalidate()
     try:
         assert str(result) == 'ok'
         return True
@@ -188,7 +248,7 @@ def gpg_decrypt_file(path, decr_path):
     """Use GPG to decrypt the file at ``path`` and save the decrypted file to
     ``decr_path``.
     """
-    with open(path, 'rb') as stream:
+    with open(path, 'rb') as stream, gpg_slot():
         return gpg().decrypt_file(stream, output=decr_path)
 
 
@@ -200,10 +260,20 @@ def gpg_encrypt_file(path, recipient_fingerprint):
     """
     encr_path = path + '.gpg'
     with open(path, 'rb') as stream:
-        result = gpg().encrypt_file(
+        result = gpg_encrypt_stream(stream, recipient_fingerprint, encr_path)
+    return encr_path, result
+
+
+def gpg_encrypt_stream(stream, recipient_fingerprint, encr_path):
+    """Use GPG to encrypt the data read from the file-like object ``stream``
+    (e.g., the stdout of a ``tar`` process) and write it to ``encr_path``,
+    decryptable only with the key with fingerprint ``recipient_fingerprint``.
+    Returns the Python-GnuPG encryption result <gnupg.Crypt> object.
+    """
+    with gpg_slot():
+        return gpg().encrypt_file(
             stream,
             [recipient_fingerprint],
             armor=False,
             always_trust=True,  # so we can use imported keys
             output=encr_path)
-    return encr_path, result
@@ -0,0 +1,179 @@
+"""
+Shared HTTP sessions for the integrations with remote services.
+
+Integrations get a ``requests.Session`` per remote host and credentials from
+``get_session`` instead of calling the module-level ``requests`` functions,
+so connections are kept alive and reused between calls. Sessions apply the
+default connect/read timeouts, retry idempotent requests with backoff and
+record how long requests take in ``METRICS``, which logs a summary per
+integration every ``settings.HTTP_METRICS_LOG_INTERVAL`` seconds.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils.six.moves import http_cookiejar
+from django.utils.six.moves.urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+LOGGER = logging.getLogger(__name__)
+
+# Methods that are retried on connection errors and RETRY_STATUSES. PUT and
+# POST are not retried because their body may be a stream that was already
+# consumed, and Space integrations handle those retries themselves.
+RETRY_METHODS = frozenset(['DELETE', 'GET', 'HEAD', 'OPTIONS', 'TRACE'])
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+
+class _NoCookiesPolicy(http_cookiejar.DefaultCookiePolicy):
+    """Cookie policy that never stores cookies received in responses."""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+class Session(requests.Session):
+    """
+    ``requests.Session`` with a default timeout that records timing metrics.
+
+    Sessions are shared between callers, so cookies set by the servers are
+    not kept: like with the module-level ``requests`` functions, each request
+    only sends the cookies it is given.
+    """
+
+    def __init__(self, integration, timeout=None):
+        super(Session, self).__init__()
+        self.integration = integration
+        self.timeout = timeout
+        self.cookies.set_policy(_NoCookiesPolicy())
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.time()
+        try:
+            response = super(Session, self).request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            METRICS.record(self.integration, time.time() - start, error=True)
+            raise
+        elapsed = time.time() - start
+        METRICS.record(self.integration, elapsed, error=response.status_code >= 500)
+        LOGGER.debug('%s %s %s: %s in %.3fs', self.integration, method, url,
+                     response.status_code, elapsed)
+        return response
+
+
+class RequestMetrics(object):
+    """
+    Thread-safe counters of the requests made by each integration.
+
+    The counters cover the requests made by this process since the last
+    summary. When a request is recorded more than
+    settings.HTTP_METRICS_LOG_INTERVAL seconds after the last summary, the
+    counters are logged and reset. Nothing is recorded if the interval is 0.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._since = time.time()
+
+    def record(self, integration, duration, error=False):
+        interval = settings.HTTP_METRICS_LOG_INTERVAL
+        if interval <= 0:
+            return
+        with self._lock:
+            stats = self._stats.setdefault(integration, {
+                'requests': 0,
+                'errors': 0,
+                'total_time': 0.0,
+                'max_time': 0.0,
+            })
+            stats['requests'] += 1
+            stats['errors'] += int(error)
+            stats['total_time'] += duration
+            stats['max_time'] = max(stats['max_time'], duration)
+            now = time.time()
+            if now - self._since < interval:
+                return
+            summary, self._stats = self._stats, {}
+            elapsed, self._since = now - self._since, now
+        self._log(summary, elapsed)
+
+    @staticmethod
+    def _log(summary, elapsed):
+        for integration, stats in sorted(summary.items()):
+            LOGGER.info(
+                '%s: %d requests in the last %.0fs, %d errors, %.3fs average,'
+                ' %.3fs max', integration, stats['requests'], elapsed,
+                stats['errors'], stats['total_time'] / stats['requests'],
+                stats['max_time'])
+
+    def snapshot(self):
+        """Return a copy of the counters, keyed by integration."""
+        with self._lock:
+            return {integration: dict(stats) for integration, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._since = time.time()
+
+
+METRICS = RequestMetrics()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(integration, url, auth=None, pool_size=None):
+    """
+    Return the shared session of ``integration`` for the host of ``url``.
+
+    :param str integration: Name of the integration, e.g. 'arkivum'. Used to
+        keep separate pools and metrics per integration.
+    :param str url: Any URL on the remote host; only scheme and host are used.
+    :param auth: Optional (user, password) tuple used for all the requests
+        made with the session.
+    :param int pool_size: Maximum number of connections kept open to the
+        host. Defaults to settings.HTTP_POOL_SIZE.
+    :returns: A Session
+    """
+    parsed = urlparse(url)
+    key = (integration, parsed.scheme, parsed.netloc, auth)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _create_session(integration, auth, pool_size)
+            _sessions[key] = session
+    return session
+
+
+def _create_session(integration, auth, pool_size):
+    session = Session(
+        integration,
+        timeout=(settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+    session.auth = auth
+    retries = Retry(
+        total=settings.HTTP_MAX_RETRIES,
+        backoff_factor=settings.HTTP_RETRY_BACKOFF,
+        method_whitelist=RETRY_METHODS,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False)
+    adapter = HTTPAdapter(
+        pool_maxsize=pool_size or settings.HTTP_POOL_SIZE,
+        max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def clear_sessions():
+    """Close and forget all the shared sessions."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
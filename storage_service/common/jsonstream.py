@@ -0,0 +1,88 @@
+"""
+Incremental parsing of JSON lists.
+
+``iter_list`` yields the items of a JSON list read from a file-like object
+one at a time, so request bodies listing many objects can be processed
+without loading the whole document and all its items in memory.
+"""
+from __future__ import absolute_import
+
+# stdlib, alphabetical
+import codecs
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# What may follow the part of a number decoded so far, before the delimiter
+_NUMBER_REST = re.compile(r'[0-9.eE+\-]*[ \t\n\r]*')
+
+
+def iter_list(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield the items of the UTF-8 encoded JSON list read from stream.
+
+    Only the item being parsed and one chunk of the stream are kept in
+    memory. Errors are raised when they are reached, so items before an
+    error may already have been yielded.
+
+    :param stream: File-like object with a read method.
+    :raises: ValueError if the stream is not valid JSON, TypeError if the
+        document is not a list.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    def read(text, position):
+        """ Return the unparsed text with the next chunk, and whether the
+        stream ended. """
+        data = stream.read(chunk_size)
+        return text[position:] + utf8.decode(data, final=not data), not data
+
+    text, position, eof = u'', 0, False
+    expected = '['
+    while True:
+        position = _WHITESPACE.match(text, position).end()
+        if position == len(text):
+            if eof:
+                raise ValueError('No JSON object could be decoded')
+            (text, eof), position = read(text, position), 0
+            continue
+
+        char = text[position]
+        if expected == '[':
+            if char != '[':
+                # Not a list, but it may be valid JSON
+                rest = text[position:] + utf8.decode(stream.read(), final=True)
+                json.loads(rest)
+                raise TypeError('JSON document is not a list')
+            position += 1
+            expected = 'first item'
+        elif char == ']' and expected in ('first item', ','):
+            rest = text[position + 1:] + utf8.decode(stream.read(), final=True)
+            if rest.strip():
+                raise ValueError('Extra data after the JSON list')
+            return
+        elif expected == ',':
+            if char != ',':
+                raise ValueError('Expecting , delimiter in the JSON list')
+            position += 1
+            expected = 'item'
+        else:
+            try:
+                item, end = decoder.raw_decode(text, position)
+            except ValueError:
+                if eof:
+                    raise
+                end = None
+            # A number may continue in the next chunk (1|.5 or 1|e3), so wait
+            # for the delimiter after the item
+            if end is None or (
+                    not eof and
+                    _NUMBER_REST.match(text, end).end() == len(text)):
+                (text, eof), position = read(text, position), 0
+                continue
+            yield item
+            position = end
+            expected = ','
@@ -0,0 +1,176 @@
+"""
+Shared SSH connections to remote hosts.
+
+The rsync and ssh commands run against a remote host reuse one SSH
+connection per user, host and key through OpenSSH connection multiplexing
+(``ControlMaster``), instead of paying the SSH handshake and authentication on
+every call. The master connection is started in the background by the first
+command and is closed by ssh ``settings.SSH_CONTROL_PERSIST`` seconds after
+the last one.
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from django.conf import settings
+
+LOGGER = logging.getLogger(__name__)
+
+# Matches rsync remote shell paths like user@host:/path or host:/path, but not
+# rsync daemon paths like user@host::module
+REMOTE_PATH_RE = re.compile(r'^(?:(?P<user>[^@/:]+)@)?(?P<host>[^@/:]+):(?!:)')
+
+
+class Connection(object):
+    """
+    A multiplexed SSH connection to ``user@host``, authenticated with
+    ``ssh_key`` or the default identity if None.
+    """
+
+    def __init__(self, user, host, ssh_key, control_path):
+        self.user = user
+        self.host = host
+        self.ssh_key = ssh_key
+        self.control_path = control_path
+        self._lock = threading.Lock()
+
+    @property
+    def destination(self):
+        if self.user:
+            return '{}@{}'.format(self.user, self.host)
+        return self.host
+
+    def options(self, master=False):
+        """Return the ssh options to use the shared connection."""
+        options = ['-o', 'ControlPath=' + self.control_path]
+        if master:
+            options += [
+                '-o', 'ControlMaster=yes',
+                '-o', 'ControlPersist={}'.format(settings.SSH_CONTROL_PERSIST),
+            ]
+        else:
+            options += ['-o', 'ControlMaster=no']
+        if self.ssh_key:
+            options += ['-i', self.ssh_key]
+        return options
+
+    def rsh(self, shared=True):
+        """Return the remote shell command to pass to ``rsync --rsh``.
+
+        Starts the master connection if it is not running.
+
+        :param bool shared: If False, the command opens its own connection
+            instead, e.g. for parallel transfers that must not share one TCP
+            stream.
+        """
+        if not shared:
+            options = ['-o', 'ControlPath=none']
+            if self.ssh_key:
+                options += ['-i', self.ssh_key]
+            return ' '.join(['ssh'] + options)
+        self.open()
+        return ' '.join(['ssh'] + self.options())
+
+    def command(self, remote_command):
+        """Return the ssh command running ``remote_command`` on the host.
+
+        Starts the master connection if it is not running.
+        """
+        self.open()
+        return ['ssh'] + self.options() + [self.destination, remote_command]
+
+    def is_open(self):
+        if not os.path.exists(self.control_path):
+            return False
+        command = ['ssh', '-o', 'ControlPath=' + self.control_path,
+                   '-O', 'check', self.destination]
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(command, stdout=devnull, stderr=devnull) == 0
+
+    def open(self):
+        """Start the master connection in the background if needed.
+
+        If it cannot be started, commands connect to the host directly.
+        """
+        with self._lock:
+            if self.is_open():
+                return
+            command = ['ssh', '-f', '-N'] + self.options(master=True) + [
+                self.destination]
+            LOGGER.info('Opening SSH master connection: %s', command)
+            # The master keeps its standard streams open, so they must not be
+            # pipes that subprocess would wait for.
+            with open(os.devnull, 'r+') as devnull:
+                returncode = subprocess.call(
+                    command, stdin=devnull, stdout=devnull, stderr=devnull,
+                    close_fds=True)
+            if returncode != 0:
+                LOGGER.warning('Could not open SSH master connection to %s,'
+                               ' status %s', self.destination, returncode)
+
+    def close(self):
+        if not os.path.exists(self.control_path):
+            return
+        command = ['ssh', '-o', 'ControlPath=' + self.control_path,
+                   '-O', 'exit', self.destination]
+        with open(os.devnull, 'w') as devnull:
+            subprocess.call(command, stdout=devnull, stderr=devnull)
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+_control_dir = None
+
+
+def get_connection(user, host, ssh_key=None):
+    """
+    Return the shared connection to ``host`` as ``user``.
+
+    :param str user: User on the remote host, or None for the default.
+    :param str host: Name or IP of the remote host.
+    :param str ssh_key: Path to the identity file, or None for the default.
+    :returns: A Connection
+    """
+    global _control_dir
+    key = (user, host, ssh_key)
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None:
+            if _control_dir is None:
+                _control_dir = tempfile.mkdtemp(prefix='ss-ssh-')
+            # Sockets are named after a hash because their paths are limited
+            # to about 100 characters.
+            name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+            connection = Connection(
+                user, host, ssh_key, os.path.join(_control_dir, name))
+            _connections[key] = connection
+    return connection
+
+
+def get_path_connection(path, ssh_key=None):
+    """
+    Return the shared connection to the host of the rsync remote path
+    ``path``, e.g. user@host:/path, or None if it is local or an rsync daemon
+    path.
+    """
+    match = REMOTE_PATH_RE.match(path)
+    if match is None:
+        return None
+    return get_connection(match.group('user'), match.group('host'), ssh_key)
+
+
+def close_connections():
+    """Close and forget all the shared connections."""
+    global _control_dir
+    with _connections_lock:
+        for connection in _connections.values():
+            connection.close()
+        _connections.clear()
+        if _control_dir is not None:
+            shutil.rmtree(_control_dir, ignore_errors=True)
+            _control_dir = None
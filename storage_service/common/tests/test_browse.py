@@ -0,0 +1,68 @@
+import pytest
+
+from django.core.cache import caches
+
+from common import browse
+
+
+NAMES = ['b', 'a', 'B', 'ab', 'c']
+
+
+def test_paginate():
+    page, cursor = browse.paginate(NAMES, limit=2)
+    assert page == ['B', 'a']
+    assert cursor == 'a'
+    page, cursor = browse.paginate(NAMES, limit=2, cursor=cursor)
+    assert page == ['ab', 'b']
+    page, cursor = browse.paginate(NAMES, limit=2, cursor=cursor)
+    assert page == ['c']
+    assert cursor is None
+
+
+def test_paginate_descending_with_prefix():
+    page, cursor = browse.paginate(NAMES, limit=1, order_by='-name', name_prefix='a')
+    assert (page, cursor) == (['ab'], 'ab')
+    page, cursor = browse.paginate(NAMES, limit=1, order_by='-name', name_prefix='a', cursor=cursor)
+    assert (page, cursor) == (['a'], None)
+
+
+def test_paginate_without_limit():
+    assert browse.paginate(NAMES, cursor='b') == (['c'], None)
+
+
+def test_invalid_options():
+    with pytest.raises(ValueError):
+        browse.paginate(NAMES, order_by='size')
+    with pytest.raises(ValueError):
+        browse.paginate(NAMES, limit=0)
+
+
+def test_paginate_results():
+    results = {
+        'entries': ['file', 'dir', 'other'],
+        'directories': ['dir'],
+        'properties': {'file': {'size': 1}, 'dir': {'object count': 2}},
+    }
+    page = browse.paginate_results(results, limit=2)
+    assert page == {
+        'entries': ['dir', 'file'],
+        'directories': ['dir'],
+        'properties': {'file': {'size': 1}, 'dir': {'object count': 2}},
+        'next_cursor': 'file',
+    }
+
+
+def test_browse_cache_invalidation():
+    cache = browse.BrowseCache('space', cache=caches['default'])
+    keys = dict((path, cache.key(path, {}))
+                for path in ('/', '/a', '/a/b', '/a/b/c', '/a/d'))
+    for key in keys.values():
+        cache.set(key, 'results', None)
+
+    cache.invalidate('/a/b')
+
+    assert cache.get(cache.key('/a/d', {})) == 'results'
+    for path in ('/', '/a', '/a/b', '/a/b/c'):
+        assert cache.get(cache.key(path, {})) is None
+    assert cache.key('/a/d/', {}) == keys['/a/d']
+    assert cache.key('/a/d', {'limit': 1}) != keys['/a/d']
@@ -0,0 +1,193 @@
+import errno
+import os
+import stat
+
+import mock
+import pytest
+
+from common import filecopy
+from locations.models import Space, StorageException
+
+
+def _make_tree(root):
+    os.makedirs(os.path.join(root, 'dir', 'sub'))
+    with open(os.path.join(root, 'dir', 'a.txt'), 'w') as f:
+        f.write('a' * 10)
+    with open(os.path.join(root, 'dir', 'sub', 'b.txt'), 'w') as f:
+        f.write('b' * 2000000)
+    os.symlink('a.txt', os.path.join(root, 'dir', 'link'))
+    os.chmod(os.path.join(root, 'dir', 'a.txt'), 0o755)
+    os.utime(os.path.join(root, 'dir', 'a.txt'), (1000000000, 1000000000))
+    return os.path.join(root, 'dir')
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_copy_directory_like_rsync(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = str(tmpdir.mkdir('dst'))
+
+    stats = filecopy.copy_tree(source, destination, concurrency=2)
+
+    copied = os.path.join(destination, 'dir')
+    assert open(os.path.join(copied, 'a.txt')).read() == 'a' * 10
+    assert open(os.path.join(copied, 'sub', 'b.txt')).read() == 'b' * 2000000
+    assert not os.path.lexists(os.path.join(copied, 'link'))
+    assert os.stat(os.path.join(copied, 'a.txt')).st_mtime == 1000000000
+    assert _mode(os.path.join(copied, 'a.txt')) == 0o770
+    assert _mode(os.path.join(copied, 'sub')) & 0o777 == 0o770
+    assert stats.files == 2
+    assert stats.bytes == 2000010
+
+
+def test_copy_directory_contents_with_trailing_slash(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = os.path.join(str(tmpdir), 'dst')
+
+    filecopy.copy_tree(source + '/', destination)
+
+    assert sorted(os.listdir(destination)) == ['a.txt', 'sub']
+
+
+def test_copy_file(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = str(tmpdir.mkdir('dst'))
+
+    filecopy.copy_tree(os.path.join(source, 'a.txt'), destination + '/')
+    filecopy.copy_tree(os.path.join(source, 'a.txt'),
+                       os.path.join(destination, 'renamed.txt'))
+
+    assert sorted(os.listdir(destination)) == ['a.txt', 'renamed.txt']
+
+
+def test_copy_skips_unchanged_files(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = str(tmpdir.mkdir('dst'))
+    filecopy.copy_tree(source, destination)
+    with open(os.path.join(source, 'sub', 'b.txt'), 'w') as f:
+        f.write('changed')
+
+    progress = mock.Mock()
+    stats = filecopy.copy_tree(source, destination, progress=progress)
+
+    assert stats.files == 1
+    assert stats.files_skipped == 1
+    progress.assert_called_once_with(stats)
+    assert open(os.path.join(destination, 'dir', 'sub', 'b.txt')).read() == 'changed'
+
+
+def test_copy_without_kernel_copy(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = str(tmpdir.mkdir('dst'))
+
+    with mock.patch('common.filecopy._copy_in_kernel', return_value=False):
+        filecopy.copy_tree(source, destination, verify=True)
+
+    assert open(os.path.join(destination, 'dir', 'sub', 'b.txt')).read() == 'b' * 2000000
+
+
+def test_copy_reports_failed_files(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = str(tmpdir.mkdir('dst'))
+
+    with mock.patch('common.filecopy._md5', side_effect=['x', 'y'] * 2):
+        with pytest.raises(filecopy.CopyError) as excinfo:
+            filecopy.copy_tree(source, destination, verify=True)
+
+    assert len(excinfo.value.errors) == 2
+    assert 'Checksum mismatch' in str(excinfo.value)
+
+
+def test_chmod_tree(tmpdir):
+    source = _make_tree(str(tmpdir))
+    os.chmod(os.path.join(source, 'sub', 'b.txt'), 0o600)
+
+    filecopy.chmod_tree(source, 0o664)
+
+    assert _mode(os.path.join(source, 'sub', 'b.txt')) == 0o664
+    assert _mode(os.path.join(source, 'a.txt')) == 0o775
+
+
+def test_move_rsync_copies_local_paths(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = str(tmpdir.mkdir('dst'))
+
+    with mock.patch('subprocess.Popen') as popen:
+        Space().move_rsync(source, destination)
+
+    assert not popen.called
+    assert os.path.isfile(os.path.join(destination, 'dir', 'sub', 'b.txt'))
+
+
+def test_move_rsync_local_copy_errors(tmpdir):
+    with pytest.raises(StorageException):
+        Space().move_rsync(str(tmpdir.join('missing')), str(tmpdir))
+
+
+def test_move_rsync_uses_rsync_for_remote_paths():
+    with mock.patch('subprocess.Popen') as popen:
+        popen.return_value.communicate.return_value = ('', None)
+        popen.return_value.returncode = 0
+        Space().move_rsync('/var/archivematica/pkg', 'user@host:/pkg')
+
+    command = popen.call_args[0][0]
+    assert command[0] == 'rsync'
+    assert command[-2:] == ['/var/archivematica/pkg', 'user@host:/pkg']
+
+
+def test_copy_clones_on_same_filesystem(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = str(tmpdir.mkdir('dst'))
+
+    with mock.patch('fcntl.ioctl') as ioctl:
+        stats = filecopy.copy_tree(source, destination)
+
+    assert ioctl.call_count == 2
+    assert ioctl.call_args[0][1] == filecopy.FICLONE
+    assert stats.files_cloned == 2
+
+
+def test_copy_falls_back_when_clone_unsupported(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = str(tmpdir.mkdir('dst'))
+
+    with mock.patch('fcntl.ioctl',
+                    side_effect=IOError(errno.EOPNOTSUPP, 'Not supported')):
+        stats = filecopy.copy_tree(source, destination)
+
+    assert stats.files_cloned == 0
+    assert open(os.path.join(destination, 'dir', 'sub', 'b.txt')).read() == 'b' * 2000000
+
+
+def test_copy_links(tmpdir):
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    destination = str(tmpdir.mkdir('dst'))
+
+    stats = filecopy.copy_tree(source + '/', destination, link=True)
+
+    assert stats.files_linked == 2
+    assert os.path.samefile(os.path.join(source, 'sub', 'b.txt'),
+                            os.path.join(destination, 'sub', 'b.txt'))
+    assert filecopy.has_links(destination)
+    assert not filecopy.has_links(str(tmpdir.mkdir('empty')))
+
+
+def test_move_rsync_links_staging_copies(tmpdir, settings):
+    settings.STAGING_HARDLINKS = True
+    source = _make_tree(str(tmpdir.mkdir('src')))
+    staging = os.path.join(str(tmpdir), 'staging')
+    destination = os.path.join(str(tmpdir), 'aips', 'dir')
+    os.makedirs(os.path.dirname(destination))
+    space = Space()
+
+    space.move_rsync(source + '/', staging + '/', staging=True)
+    assert os.path.samefile(os.path.join(source, 'a.txt'),
+                            os.path.join(staging, 'a.txt'))
+
+    space.move_rsync(staging + '/', destination, try_mv_local=True)
+    assert not os.path.exists(staging)
+    assert not filecopy.has_links(destination)
+    assert not filecopy.has_links(source)
+    assert open(os.path.join(destination, 'sub', 'b.txt')).read() == 'b' * 2000000
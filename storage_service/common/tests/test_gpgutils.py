@@ -0,0 +1,72 @@
+import threading
+import time
+
+import mock
+import pytest
+
+from common import gpgutils
+
+
+@pytest.fixture
+def fake_gpg(mocker):
+    fake = mock.Mock()
+    fake.list_keys.return_value = mock.Mock(key_map={'ABCD': {'fingerprint': 'ABCD'}})
+    fake.delete_keys.return_value = 'ok'
+    mocker.patch.object(gpgutils, 'gpg', return_value=fake)
+    mocker.patch.object(gpgutils, 'key_cache', gpgutils.KeyCache())
+    return fake
+
+
+def test_key_list_is_cached(fake_gpg):
+    assert gpgutils.get_gpg_key('ABCD') == {'fingerprint': 'ABCD'}
+    assert gpgutils.get_gpg_key('ABCD') == {'fingerprint': 'ABCD'}
+    assert gpgutils.get_gpg_key('EFGH') is None
+    fake_gpg.list_keys.assert_called_once_with(True)
+
+
+def test_key_cache_expires(fake_gpg):
+    gpgutils.key_cache.ttl = 0.01
+    gpgutils.get_gpg_key('ABCD')
+    time.sleep(0.02)
+    gpgutils.get_gpg_key('ABCD')
+    assert fake_gpg.list_keys.call_count == 2
+
+
+def test_key_cache_invalidated_on_changes(fake_gpg):
+    gpgutils.get_gpg_key('ABCD')
+    assert gpgutils.delete_gpg_key('ABCD') is True
+    gpgutils.get_gpg_key('ABCD')
+    assert fake_gpg.list_keys.call_count == 2
+
+    fake_gpg.import_keys.return_value = mock.Mock(count=0)
+    assert gpgutils.import_gpg_key('armor') == gpgutils.IMPORT_ERROR
+    gpgutils.get_gpg_key('ABCD')
+    assert fake_gpg.list_keys.call_count == 3
+
+    gpgutils.generate_gpg_key('name', 'name@example.com')
+    gpgutils.get_gpg_key('ABCD')
+    assert fake_gpg.list_keys.call_count == 4
+
+
+def test_gpg_slot_bounds_concurrency(mocker, settings):
+    settings.GPG_CONCURRENCY = 2
+    mocker.patch.object(gpgutils, '_gpg_slots', None)
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+
+    def work():
+        with gpgutils.gpg_slot():
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=work) for _i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max_running[0] == 2
@@ -0,0 +1,81 @@
+import mock
+import pytest
+import requests
+
+from common import http_client
+
+
+@pytest.fixture(autouse=True)
+def clean_sessions():
+    http_client.clear_sessions()
+    http_client.METRICS.reset()
+    yield
+    http_client.clear_sessions()
+    http_client.METRICS.reset()
+
+
+def test_get_session_is_shared_per_host_and_credentials():
+    session = http_client.get_session('arkivum', 'https://example.com/api/2/files')
+    assert http_client.get_session('arkivum', 'https://example.com/other') is session
+    assert http_client.get_session('arkivum', 'https://example.org/api') is not session
+    assert http_client.get_session('arkivum', 'http://example.com/api') is not session
+    assert http_client.get_session('dataverse', 'https://example.com/api') is not session
+    with_auth = http_client.get_session('dspace', 'https://example.com', auth=('user', 'pass'))
+    assert with_auth.auth == ('user', 'pass')
+    assert http_client.get_session('dspace', 'https://example.com', auth=('user', 'other')) is not with_auth
+
+
+def test_session_pool_and_retries(settings):
+    settings.HTTP_MAX_RETRIES = 5
+    session = http_client.get_session('duracloud', 'https://example.com', pool_size=7)
+    adapter = session.get_adapter('https://example.com/')
+    assert adapter._pool_maxsize == 7
+    assert adapter.max_retries.total == 5
+    assert 'GET' in adapter.max_retries.method_whitelist
+    assert 'POST' not in adapter.max_retries.method_whitelist
+    assert 'PUT' not in adapter.max_retries.method_whitelist
+
+
+def test_session_default_timeout_and_metrics(settings):
+    settings.HTTP_CONNECT_TIMEOUT = 2
+    settings.HTTP_READ_TIMEOUT = 30
+    session = http_client.get_session('pipeline', 'https://example.com')
+    with mock.patch('requests.Session.request',
+                    side_effect=[mock.Mock(status_code=200),
+                                 mock.Mock(status_code=503),
+                                 requests.exceptions.ConnectionError()]) as request:
+        session.get('https://example.com/api')
+        session.get('https://example.com/api', timeout=5)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            session.get('https://example.com/api')
+    assert request.call_args_list[0][1]['timeout'] == (2, 30)
+    assert request.call_args_list[1][1]['timeout'] == 5
+    metrics = http_client.METRICS.snapshot()['pipeline']
+    assert metrics['requests'] == 3
+    assert metrics['errors'] == 2
+
+
+def test_metrics_summary_is_logged_periodically(settings):
+    settings.HTTP_METRICS_LOG_INTERVAL = 60
+    with mock.patch('time.time', side_effect=[0, 10, 30, 70]), \
+            mock.patch.object(http_client.LOGGER, 'info') as info:
+        metrics = http_client.RequestMetrics()
+        metrics.record('arkivum', 1.0)
+        metrics.record('arkivum', 3.0, error=True)
+        assert not info.called
+        metrics.record('dspace', 0.5)
+    assert info.call_count == 2
+    assert info.call_args_list[0][0][1:] == ('arkivum', 2, 70, 1, 2.0, 3.0)
+    assert info.call_args_list[1][0][1] == 'dspace'
+    assert metrics.snapshot() == {}
+
+    settings.HTTP_METRICS_LOG_INTERVAL = 0
+    metrics.record('arkivum', 1.0)
+    assert metrics.snapshot() == {}
+
+
+def test_session_does_not_keep_cookies():
+    session = http_client.get_session('dspace_rest', 'https://example.com')
+    cookie = requests.cookies.create_cookie('JSESSIONID', 'secret', domain='example.com')
+    request = mock.Mock(unverifiable=False, get_full_url=lambda: 'https://example.com/login')
+    assert not session.cookies._policy.set_ok(cookie, request)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+
+import pytest
+
+from common import jsonstream
+
+
+def parse(document, chunk_size=jsonstream.CHUNK_SIZE):
+    return list(jsonstream.iter_list(io.BytesIO(document), chunk_size))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, jsonstream.CHUNK_SIZE])
+def test_iter_list(chunk_size):
+    items = [{u'name': u'caf\xe9 [1], {2}', u'size': 12345}, 123, u'x', None, [1, [2]]]
+    document = json.dumps(items, ensure_ascii=False).encode('utf-8')
+    assert parse(' \n' + document + '\n', chunk_size) == items
+    assert parse('[1.5]', chunk_size) == [1.5]
+    assert parse('[1.5e3, 2]', chunk_size) == [1500.0, 2]
+    assert parse('[-0.25E-2 ,1e+2 ]', chunk_size) == [-0.0025, 100.0]
+
+
+def test_iter_empty_list():
+    assert parse('[]') == []
+    assert parse(' [ ] ') == []
+
+
+@pytest.mark.parametrize('document', ['', 'not json!', '[1, 2', '[1 2]', '[1,]', '[1] 2'])
+def test_iter_invalid_json(document):
+    with pytest.raises(ValueError):
+        parse(document, chunk_size=1)
+
+
+def test_iter_json_not_a_list():
+    with pytest.raises(TypeError):
+        parse('{"files": []}')
@@ -0,0 +1,83 @@
+import mock
+import pytest
+
+from common import ssh
+from locations.models import PipelineLocalFS, Space
+
+
+@pytest.fixture(autouse=True)
+def clean_connections():
+    ssh.close_connections()
+    yield
+    ssh.close_connections()
+
+
+def test_get_connection_is_shared_per_host_user_and_key():
+    connection = ssh.get_connection('archivematica', 'example.com')
+    assert ssh.get_connection('archivematica', 'example.com') is connection
+    assert ssh.get_connection('other', 'example.com') is not connection
+    assert ssh.get_connection('archivematica', 'example.org') is not connection
+    with_key = ssh.get_connection('archivematica', 'example.com', '/tmp/key')
+    assert with_key is not connection
+    assert with_key.control_path != connection.control_path
+    assert '-i' in with_key.options()
+
+
+def test_get_path_connection():
+    connection = ssh.get_path_connection('user@example.com:/var/aips/')
+    assert connection.destination == 'user@example.com'
+    assert ssh.get_path_connection('example.com:/var/aips/').destination == 'example.com'
+    assert ssh.get_path_connection('/var/aips/') is None
+    assert ssh.get_path_connection('user@example.com::module') is None
+
+
+def test_master_connection_is_opened_once(settings):
+    settings.SSH_CONTROL_PERSIST = 30
+    connection = ssh.get_connection('user', 'example.com')
+    with mock.patch('subprocess.call', return_value=0) as call, \
+            mock.patch('os.path.exists', side_effect=[False, True]):
+        rsh = connection.rsh()
+        connection.command('true')
+
+    assert rsh.split()[0] == 'ssh'
+    assert 'ControlPath=' + connection.control_path in rsh
+    assert 'ControlMaster=no' in rsh
+    start, check = [c[0][0] for c in call.call_args_list]
+    assert start[:3] == ['ssh', '-f', '-N']
+    assert 'ControlMaster=yes' in start
+    assert 'ControlPersist=30' in start
+    assert check[-2:] == ['check', 'user@example.com']
+
+
+def test_rsync_commands_use_shared_connection():
+    pipeline_fs = PipelineLocalFS(
+        space=Space(), remote_user='user', remote_name='example.com')
+    connection = ssh.get_connection('user', 'example.com')
+    with mock.patch('subprocess.call', return_value=0), \
+            mock.patch('subprocess.check_call') as check_call, \
+            mock.patch('subprocess.check_output', return_value='') as check_output, \
+            mock.patch('subprocess.Popen') as popen:
+        popen.return_value.communicate.return_value = ('', None)
+        popen.return_value.returncode = 0
+        pipeline_fs.delete_path('/var/aips/pkg')
+        pipeline_fs.browse('/var/aips')
+        pipeline_fs.space.move_rsync('/var/staging/pkg', 'user@example.com:/var/aips/pkg')
+
+    delete = check_call.call_args[0][0]
+    browse = check_output.call_args[0][0]
+    move = popen.call_args[0][0]
+    assert delete[delete.index('--rsh') + 1] == connection.rsh()
+    assert move[move.index('--rsh') + 1] == connection.rsh()
+    browse_rsh = browse[browse.index('--rsh') + 1]
+    assert '-i /var/lib/archivematica/.ssh/id_rsa' in browse_rsh
+    assert 'ControlPath=' in browse_rsh
+
+
+def test_rsync_daemon_commands_do_not_use_ssh():
+    with mock.patch('subprocess.Popen') as popen:
+        popen.return_value.communicate.return_value = ('', None)
+        popen.return_value.returncode = 0
+        Space().move_rsync('/var/staging/pkg', 'user@example.com::module/pkg',
+                           assume_rsync_daemon=True)
+
+    assert '--rsh' not in popen.call_args[0][0]
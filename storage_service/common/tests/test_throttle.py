@@ -0,0 +1,141 @@
+import threading
+import time
+
+import mock
+
+from common import throttle
+from locations.models import Space
+
+
+def test_token_bucket_limits_rate():
+    bucket = throttle.TokenBucket(100000)
+    start = time.time()
+    for _ in range(5):
+        bucket.consume(50000)
+    # The first 50000 bytes are taken from the initial tokens
+    assert time.time() - start >= 1.9
+
+
+def test_token_bucket_without_rate_does_not_wait():
+    bucket = throttle.TokenBucket()
+    start = time.time()
+    bucket.consume(10 ** 12)
+    assert time.time() - start < 0.1
+
+
+def test_token_bucket_serves_interactive_consumers_first():
+    bucket = throttle.TokenBucket(100000)
+    bucket.consume(200000)  # Leaves the bucket two seconds in debt
+    served = []
+
+    def consume(name, interactive):
+        bucket.consume(100000, interactive=interactive)
+        served.append(name)
+
+    background = threading.Thread(target=consume, args=('background', False))
+    background.start()
+    time.sleep(0.2)
+    consume('interactive', True)
+    background.join()
+
+    assert served == ['interactive', 'background']
+
+
+def test_consumer_keeps_priority_of_calling_thread():
+    bucket = throttle.TokenBucket(1000)
+    with throttle.priority(True):
+        consume = bucket.consumer()
+    assert consume.keywords == {'interactive': True}
+    assert not throttle.is_interactive()
+
+
+def test_inherit_priority():
+    result = []
+
+    @throttle.interactive
+    def submit():
+        thread = threading.Thread(
+            target=throttle.inherit_priority(
+                lambda: result.append(throttle.is_interactive())))
+        thread.start()
+        thread.join()
+
+    submit()
+    assert result == [True]
+
+
+def test_operation_limit():
+    limit = throttle.OperationLimit(1)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def operation():
+        with limit.slot():
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=operation)
+    thread.start()
+    entered.wait(5)
+    waiting = threading.Event()
+    done = []
+
+    def other():
+        waiting.set()
+        with limit.slot():
+            done.append(True)
+
+    other_thread = threading.Thread(target=other)
+    other_thread.start()
+    waiting.wait(5)
+    time.sleep(0.1)
+    assert not done
+    release.set()
+    thread.join()
+    other_thread.join()
+    assert done
+
+
+def test_nested_operations_do_not_take_another_slot():
+    limit = throttle.OperationLimit(1)
+    with limit.slot():
+        with limit.slot():
+            pass
+        with limit.slot():
+            pass
+
+
+def test_throttled_reader(tmpdir):
+    path = tmpdir.join('file')
+    path.write(b'x' * 100)
+    consume = mock.Mock()
+    reader = throttle.ThrottledReader(path.open('rb'), consume)
+
+    assert len(reader) == 100
+    assert reader.read(60) == b'x' * 60
+    assert b''.join(reader) == b'x' * 40
+    assert [c[0][0] for c in consume.call_args_list] == [60, 40]
+    assert reader.tell() == 100
+
+
+def test_space_limiter():
+    space = Space(read_limit=10, write_limit=20, max_operations=2)
+    limiter = space.limiter
+
+    assert limiter.read.rate == 10 * 1024
+    assert limiter.write.rate == 20 * 1024
+    assert limiter.operations.limit == 2
+    space.read_limit = None
+    assert space.limiter is limiter
+    assert limiter.read.rate is None
+
+
+def test_move_rsync_limits_bandwidth():
+    space = Space(read_limit=1000, rsync_workers=1)
+    with mock.patch('subprocess.Popen') as popen:
+        popen.return_value.communicate.return_value = ('', None)
+        popen.return_value.returncode = 0
+        space.move_rsync('/var/aips/pkg', 'host::module/pkg',
+                         assume_rsync_daemon=True)
+
+    assert '--bwlimit=1000' in popen.call_args[0][0]
@@ -0,0 +1,262 @@
+"""
+Limits on the bandwidth and concurrent operations of Spaces.
+
+Each Space has a ``Limiter`` in each Storage Service process, with token
+buckets limiting the rate at which packages are read from and written to it,
+and a limit on the number of operations (moves, fixity checks) running on it
+at the same time. ``get_limiter`` applies the current limits of the Space
+every time it is called, so changes made in the Space form take effect
+without a restart.
+
+Work done for a user waiting for it, like downloading a package, runs inside
+``priority(interactive=True)`` (or a function decorated with ``interactive``)
+and is served before background work waiting on the same limits.
+"""
+from __future__ import absolute_import, division
+
+# stdlib, alphabetical
+from contextlib import contextmanager
+import functools
+import os
+import threading
+import time
+
+# Seconds background consumers wait before checking again whether
+# interactive consumers are still waiting
+POLL_INTERVAL = 0.1
+
+_local = threading.local()
+
+
+def is_interactive():
+    """Return True if the current thread does interactive work."""
+    return getattr(_local, 'interactive', False)
+
+
+@contextmanager
+def priority(interactive):
+    """Run the enclosed code as interactive or background work."""
+    previous = is_interactive()
+    _local.interactive = interactive
+    try:
+        yield
+    finally:
+        _local.interactive = previous
+
+
+def interactive(func):
+    """Decorator running ``func`` as interactive work."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with priority(True):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def inherit_priority(func):
+    """Return ``func`` running with the priority of the calling thread, e.g.
+    to submit it to a thread pool."""
+    interactive_ = is_interactive()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with priority(interactive_):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class TokenBucket(object):
+    """
+    Limits the rate, in bytes per second, at which threads consume data.
+
+    Up to one second worth of unused tokens are kept for bursts. Interactive
+    consumers are served before background ones. A rate of None means no
+    limit.
+    """
+
+    def __init__(self, rate=None):
+        self._cond = threading.Condition()
+        self._tokens = 0
+        self._updated = time.time()
+        self._interactive_waiting = 0
+        self.rate = None
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._cond:
+            if rate == self.rate:
+                return
+            self._refill()
+            self.rate = rate or None
+            self._tokens = min(self._tokens, self.rate or 0)
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = time.time()
+        if self.rate:
+            self._tokens = min(
+                self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, amount, interactive=None):
+        """
+        Wait until ``amount`` bytes can be transferred.
+
+        Consumers may go into debt, so amounts larger than the burst size
+        delay the following consumers instead of blocking forever.
+
+        :param int amount: Number of bytes.
+        :param bool interactive: Priority of the consumer, defaults to the
+            priority of the current thread.
+        """
+        if not self.rate:
+            return
+        if interactive is None:
+            interactive = is_interactive()
+        with self._cond:
+            if interactive:
+                self._interactive_waiting += 1
+            try:
+                while self.rate:
+                    self._refill()
+                    if not interactive and self._interactive_waiting:
+                        self._cond.wait(POLL_INTERVAL)
+                    elif self._tokens <= 0:
+                        self._cond.wait(-self._tokens / self.rate)
+                    else:
+                        self._tokens -= amount
+                        break
+            finally:
+                if interactive:
+                    self._interactive_waiting -= 1
+                    self._cond.notify_all()
+
+    def consumer(self):
+        """Return a function consuming from the bucket with the priority of
+        the calling thread, for callbacks called from other threads."""
+        return functools.partial(self.consume, interactive=is_interactive())
+
+
+class OperationLimit(object):
+    """
+    Limits the number of operations running at the same time. When a slot is
+    released, interactive operations get it before background ones. A limit
+    of None means no limit.
+
+    Operations started by a thread already holding a slot do not take
+    another one, so nested operations cannot deadlock.
+    """
+
+    def __init__(self, limit=None):
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._active = 0
+        self._interactive_waiting = 0
+        self.limit = limit
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = limit or None
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot while running the enclosed code."""
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+        interactive_ = is_interactive()
+        with self._cond:
+            if interactive_:
+                self._interactive_waiting += 1
+            try:
+                while self.limit and (
+                        self._active >= self.limit or
+                        (not interactive_ and self._interactive_waiting)):
+                    self._cond.wait()
+            finally:
+                if interactive_:
+                    self._interactive_waiting -= 1
+                    self._cond.notify_all()
+            self._active += 1
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+
+class Limiter(object):
+    """Bandwidth and operation limits of a Space."""
+
+    def __init__(self):
+        self.read = TokenBucket()
+        self.write = TokenBucket()
+        self.operations = OperationLimit()
+
+    def update(self, read_rate=None, write_rate=None, max_operations=None):
+        self.read.set_rate(read_rate)
+        self.write.set_rate(write_rate)
+        self.operations.set_limit(max_operations)
+
+    def operation(self):
+        """Context manager holding an operation slot."""
+        return self.operations.slot()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(key, read_rate=None, write_rate=None, max_operations=None):
+    """
+    Return the Limiter of ``key``, e.g. a Space UUID, updated with the limits.
+
+    :param int read_rate: Maximum bytes read per second, or None.
+    :param int write_rate: Maximum bytes written per second, or None.
+    :param int max_operations: Maximum number of operations at the same time,
+        or None.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = Limiter()
+    limiter.update(read_rate, write_rate, max_operations)
+    return limiter
+
+
+class ThrottledReader(object):
+    """
+    File-like wrapper calling ``consume`` with the size of the data read
+    before returning it. Other attributes are those of ``fileobj``.
+    """
+
+    def __init__(self, fileobj, consume):
+        self._fileobj = fileobj
+        self._consume = consume
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        if data:
+            self._consume(len(data))
+        return data
+
+    def __iter__(self):
+        return iter(lambda: self.read(64 * 1024), b'')
+
+    def __len__(self):
+        # Used by requests to set the Content-Length
+        if hasattr(self._fileobj, '__len__'):
+            return len(self._fileobj)
+        return os.fstat(self._fileobj.fileno()).st_size - self._fileobj.tell()
+
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
@@ -276,15 +276,20 @@ def get_compression(pointer_path):
 
 # ########### OTHER ############
 
-def generate_checksum(file_path, checksum_type='md5'):
+def generate_checksum(file_path, checksum_type='md5', throttle=None):
     """
     Returns checksum object for `file_path` using `checksum_type`.
 
     If checksum_type is not a valid checksum, ValueError raised by hashlib.
+
+    :param throttle: Optional callable, called with the size of each chunk
+        read, that returns when it can be hashed (see common.throttle).
     """
     checksum = hashlib.new(checksum_type)
     with open(file_path, 'rb') as f:
         for chunk in iter(lambda: f.read(128 * checksum.block_size), b''):
+            if throttle is not None:
+                throttle(len(chunk))
             checksum.update(chunk)
     return checksum
 
@@ -2,11 +2,13 @@
 # are based on. They shouldn't be directly used with Api objects.
 
 # stdlib, alphabetical
+import base64
 import json
 import logging
 import os
 import re
 import shutil
+import tempfile
 import urllib
 
 # Core Django, alphabetical
@@ -14,7 +16,8 @@ from django.conf import settings
 from django.conf.urls import url
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.forms.models import model_to_dict
 from django.utils.translation import ugettext as _
 from django.utils import six
@@ -26,16 +29,17 @@ from tastypie.authorization import DjangoAuthorization
 import tastypie.exceptions
 from tastypie import fields
 from tastypie import http
+from tastypie.paginator import Paginator
 from tastypie.resources import ModelResource, ALL, ALL_WITH_RELATIONS
 from tastypie.validation import CleanedDataFormValidation
 from tastypie.utils import trailing_slash, dict_strip_unicode_keys
 
 # This project, alphabetical
 from administration.models import Settings
-from common import utils
+from common import jsonstream, throttle, utils
 from locations.api.sword import views as sword_views
 
-from ..models import (Callback, CallbackError, Event, File, Package, Location, LocationPipeline, Space, Pipeline, StorageException, Async, PosixMoveUnsupportedError)
+from ..models import (Callback, CallbackError, Event, File, Package, Location, LocationPipeline, Space, Pipeline, StorageException, Async, PosixMoveUnsupportedError, send_post_store_callbacks)
 from ..forms import SpaceForm
 from ..constants import PROTOCOL
 from locations import signals
@@ -44,6 +48,12 @@ from ..models.async_manager import AsyncManager
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of files inserted or serialized at a time by manage_contents
+FILE_BATCH_SIZE = 1000
+
+# Request bodies larger than this are spooled to disk by async endpoints
+SPOOL_MAX_SIZE = 10 * 1024 * 1024
+
 
 # FIXME ModelResources with ForeignKeys to another model don't work with
 # validation = CleanedDataFormValidation  On creation, it errors with:
@@ -52,14 +62,17 @@ LOGGER = logging.getLogger(__name__)
 # primary key (in our case, UUID) before passing it to Django.
 # See https://github.com/toastdriven/django-tastypie/issues/152 for details
 
-def _custom_endpoint(expected_methods=['get'], required_fields=[]):
+def _custom_endpoint(expected_methods=['get'], required_fields=[],
+                     deserialize=True):
     """
     Decorator for custom endpoints that handles boilerplate code.
 
     Checks if method allowed, authenticated, deserializes and can require fields
     in the body.
 
-    Custom endpoint must accept request and bundle.
+    Custom endpoint must accept request and bundle. Endpoints reading the
+    body themselves, e.g. to parse it incrementally, must set deserialize
+    to False.
     """
     def decorator(func):
         """ The decorator applied to the endpoint """
@@ -79,12 +92,14 @@ def _custom_endpoint(expected_methods=['get'], required_fields=[]):
                 return http.HttpMultipleChoices(_("More than one resource is found at this URI."))
 
             # Get body content
-            try:
-                deserialized = resource.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
-                deserialized = resource.alter_deserialized_detail_data(request, deserialized)
-            except Exception:
-                # Trouble decoding request body - may not actually exist
-                deserialized = []
+            deserialized = []
+            if deserialize:
+                try:
+                    deserialized = resource.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
+                    deserialized = resource.alter_deserialized_detail_data(request, deserialized)
+                except Exception:
+                    # Trouble decoding request body - may not actually exist
+                    deserialized = []
 
             # Check required fields, if any
             if not all(k in deserialized for k in required_fields):
@@ -103,6 +118,95 @@ def _custom_endpoint(expected_methods=['get'], required_fields=[]):
     return decorator
 
 
+def _browse_options(request, decode_name=lambda name: name):
+    """
+    Return the pagination options of a browse request, see Space.browse.
+
+    Cursors are opaque bytes, so they are exchanged in URL-safe base64.
+
+    :param decode_name: Function decoding ``name_prefix`` like the path.
+    :raises: ValueError if an option is not valid.
+    """
+    options = {}
+    if request.GET.get('limit'):
+        options['limit'] = int(request.GET['limit'])
+    if request.GET.get('cursor'):
+        try:
+            options['cursor'] = base64.urlsafe_b64decode(str(request.GET['cursor']))
+        except TypeError:
+            raise ValueError('Invalid cursor')
+    if request.GET.get('order_by'):
+        options['order_by'] = request.GET['order_by']
+    if request.GET.get('name_prefix'):
+        options['name_prefix'] = utils.coerce_str(
+            decode_name(request.GET['name_prefix']))
+    if request.GET.get('refresh') in ('True', 'true', '1'):
+        options['use_cache'] = False
+    return options
+
+
+def _browse_response(resource, request, space, path, options):
+    """ Return the response of a browse request, or 400 if the options are
+    not valid. """
+    try:
+        objects = resource.get_objects(space, path, **options)
+    except ValueError as e:
+        return http.HttpBadRequest(str(e))
+    if objects.get('next_cursor') is not None:
+        objects['next_cursor'] = base64.urlsafe_b64encode(objects['next_cursor'])
+    return resource.create_response(request, objects)
+
+
+class KeysetPaginator(Paginator):
+    """ Paginator ordering the objects by id when a cursor parameter is given.
+
+    Offset pagination counts all the objects and skips the previous pages in
+    the database, which gets slower with each page. With cursor= (empty for
+    the first page), each page starts after the last object of the previous
+    one, and its meta has a 'next_cursor' and a 'next' URL for the following
+    page, or None if it is the last one. There is no total count. """
+
+    def page(self):
+        if 'cursor' not in self.request_data:
+            return super(KeysetPaginator, self).page()
+        if self.request_data.get('order_by'):
+            raise tastypie.exceptions.BadRequest(
+                'order_by cannot be used with cursor')
+        limit = self.get_limit()
+        objects = self.objects.order_by('id')
+        cursor = self.request_data['cursor']
+        if cursor:
+            try:
+                objects = objects.filter(id__gt=int(cursor))
+            except ValueError:
+                raise tastypie.exceptions.BadRequest('Invalid cursor')
+        next_cursor = None
+        if limit:
+            objects = list(objects[:limit + 1])
+            if len(objects) > limit:
+                objects = objects[:limit]
+                next_cursor = str(objects[-1].id)
+        else:
+            objects = list(objects)
+        return {
+            self.collection_name: objects,
+            'meta': {
+                'limit': limit,
+                'next_cursor': next_cursor,
+                'next': self._generate_cursor_uri(limit, next_cursor),
+            },
+        }
+
+    def _generate_cursor_uri(self, limit, cursor):
+        if self.resource_uri is None or cursor is None:
+            return None
+        request_params = dict((k, utils.coerce_str(v))
+                              for k, v in self.request_data.items()
+                              if k != 'offset')
+        request_params.update({'limit': limit, 'cursor': cursor})
+        return '%s?%s' % (self.resource_uri, urllib.urlencode(request_params))
+
+
 class PipelineResource(ModelResource):
     # Attributes used for POST, exclude from GET
     create_default_locations = fields.BooleanField(use_in=lambda x: False)
@@ -207,7 +311,7 @@ class SpaceResource(ModelResource):
         obj.save()
         return bundle
 
-    def get_objects(self, space, path):
+    def get_objects(self, space, path, **options):
         message = _('This method should be accessed via a versioned subclass')
         raise NotImplementedError(message)
 
@@ -221,16 +325,24 @@ class SpaceResource(ModelResource):
         Directories is a subset of entries, all are just the name.
 
         If a path=<path> parameter is provided, will look in that path inside
-        the Space. """
+        the Space.
+
+        Large directories can be browsed one page at a time with the limit,
+        cursor, order_by and name_prefix parameters (see Space.browse). The
+        response then has a 'next_cursor' to request the following page.
+
+        If the Space caches browse results, refresh=1 lists the path again. """
 
         space = bundle.obj
         path = request.GET.get('path', '')
         if not path.startswith(space.path):
             path = os.path.join(space.path, path)
+        try:
+            options = _browse_options(request)
+        except ValueError as e:
+            return http.HttpBadRequest(str(e))
 
-        objects = self.get_objects(space, path)
-
-        return self.create_response(request, objects)
+        return _browse_response(self, request, space, path, options)
 
 
 class LocationResource(ModelResource):
@@ -274,7 +386,7 @@ class LocationResource(ModelResource):
     def decode_path(self, path):
         return path
 
-    def get_objects(self, space, path):
+    def get_objects(self, space, path, **options):
         message = _('This method should be accessed via a versioned subclass')
         raise NotImplementedError(message)
 
@@ -337,7 +449,13 @@ class LocationResource(ModelResource):
         Directories is a subset of entries, all are just the name.
 
         If a path=<path> parameter is provided, will look in that path inside
-        the Location. """
+        the Location.
+
+        Large directories can be browsed one page at a time with the limit,
+        cursor, order_by and name_prefix parameters (see Space.browse). The
+        response then has a 'next_cursor' to request the following page.
+
+        If the Space caches browse results, refresh=1 lists the path again. """
 
         location = bundle.obj
         path = request.GET.get('path', '')
@@ -347,10 +465,12 @@ class LocationResource(ModelResource):
             location_path = location_path.encode('utf8')
         if not path.startswith(location_path):
             path = os.path.join(location_path, path)
+        try:
+            options = _browse_options(request, self.decode_path)
+        except (ValueError, TypeError) as e:
+            return http.HttpBadRequest(str(e))
 
-        objects = self.get_objects(location.space, path)
-
-        return self.create_response(request, objects)
+        return _browse_response(self, request, location.space, path, options)
 
     def _move_files_between_locations(self, files, origin_location, destination_location):
         """
@@ -518,6 +638,14 @@ class PackageResource(ModelResource):
     GET: List of files
     POST: Create new Package
 
+    List can be paginated by id with cursor= instead of offset, see
+    KeysetPaginator.
+
+    List can be filtered and ordered by the latest fixity check, e.g.
+    latest_fixity_check_datetime__isnull=true for packages never checked,
+    latest_fixity_check_result=false for packages that failed their latest
+    check, or order_by=latest_fixity_check_datetime for the oldest checks.
+
     Detail (api/v1/file/<uuid>/) supports:
     GET: Get details on a specific file
 
@@ -532,6 +660,14 @@ class PackageResource(ModelResource):
 
     Validate fixity (api/v1/file/<uuid>/check_fixity/) supports:
     GET: Scan package for fixity
+
+    Contents (api/v1/file/<uuid>/contents/) supports:
+    GET: List the files of the package
+    PUT: Add files to the package
+    DELETE: Remove the files of the package
+
+    Add contents asynchronously (api/v1/file/<uuid>/contents/async/) supports:
+    PUT: Add files to the package in a background task
     """
     origin_pipeline = fields.ForeignKey(PipelineResource, 'origin_pipeline')
     origin_location = fields.ForeignKey(LocationResource, None, use_in=lambda x: False)
@@ -546,10 +682,22 @@ class PackageResource(ModelResource):
     replicas = fields.ManyToManyField(
         'self', 'replicas', null=True, blank=True, readonly=True)
 
+    # Set by fixity checks
+    latest_fixity_check_datetime = fields.DateTimeField(
+        attribute='latest_fixity_check_datetime', null=True, readonly=True)
+    latest_fixity_check_result = fields.BooleanField(
+        attribute='latest_fixity_check_result', null=True, readonly=True)
+    fixity_failure_count = fields.IntegerField(
+        attribute='fixity_failure_count', readonly=True)
+
     default_location_regex = re.compile(r'\/api\/v2\/location\/default\/(?P<purpose>[A-Z]{2})\/?')
 
     class Meta:
-        queryset = Package.objects.all()
+        # Everything dehydrated with each package, to list them with a
+        # constant number of queries
+        queryset = Package.objects.select_related(
+            'current_location__space', 'origin_pipeline', 'replicated_package',
+        ).prefetch_related('related_packages', 'replicas')
         authentication = MultiAuthentication(BasicAuthentication(), ApiKeyAuthentication(), SessionAuthentication())
         authorization = DjangoAuthorization()
         # validation = CleanedDataFormValidation(form_class=PackageForm)
@@ -558,10 +706,12 @@ class PackageResource(ModelResource):
         # compatibility because the resource itself was originally under
         # that name.
         resource_name = 'file'
+        paginator_class = KeysetPaginator
 
         fields = ['current_path', 'package_type', 'size', 'status', 'uuid',
                   'related_packages', 'misc_attributes', 'replicated_package',
-                  'replicas']
+                  'replicas', 'latest_fixity_check_datetime',
+                  'latest_fixity_check_result', 'fixity_failure_count']
         list_allowed_methods = ['get', 'post']
         detail_allowed_methods = ['get', 'put', 'patch']
         allowed_patch_fields = ['reingest']  # for customized update_in_place
@@ -573,8 +723,12 @@ class PackageResource(ModelResource):
             'path': ALL,
             'uuid': ALL,
             'status': ALL,
-            'related_packages': ALL_WITH_RELATIONS
+            'related_packages': ALL_WITH_RELATIONS,
+            'latest_fixity_check_datetime': ALL,
+            'latest_fixity_check_result': ALL,
+            'fixity_failure_count': ALL,
         }
+        ordering = ['latest_fixity_check_datetime', 'fixity_failure_count']
 
     def prepend_urls(self):
         return [
@@ -588,7 +742,9 @@ class PackageResource(ModelResource):
             url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/pointer_file%s$" % (self._meta.resource_name, self._meta.detail_uri_name, trailing_slash()), self.wrap_view('pointer_file_request'), name="pointer_file_request"),
             url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/check_fixity%s$" % (self._meta.resource_name, self._meta.detail_uri_name, trailing_slash()), self.wrap_view('check_fixity_request'), name="check_fixity_request"),
             url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/send_callback/post_store%s$" % (self._meta.resource_name, self._meta.detail_uri_name, trailing_slash()), self.wrap_view('aip_store_callback_request'), name="aip_store_callback_request"),
+            url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/send_callback/post_store/async%s$" % (self._meta.resource_name, self._meta.detail_uri_name, trailing_slash()), self.wrap_view('aip_store_callback_request_async'), name="aip_store_callback_request_async"),
             url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/contents%s$" % (self._meta.resource_name, self._meta.detail_uri_name, trailing_slash()), self.wrap_view("manage_contents"), name="manage_contents"),
+            url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/contents/async%s$" % (self._meta.resource_name, self._meta.detail_uri_name, trailing_slash()), self.wrap_view("manage_contents_async"), name="manage_contents_async"),
             url(r"^(?P<resource_name>%s)/metadata%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view("file_data"), name="file_data"),
             url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/reindex%s$" % (self._meta.resource_name, self._meta.detail_uri_name, trailing_slash()), self.wrap_view('reindex_request'), name="reindex_request"),
             # Reingest
@@ -857,6 +1013,7 @@ class PackageResource(ModelResource):
             content_type='application/json')
 
     @_custom_endpoint(expected_methods=['get', 'head'])
+    @throttle.interactive
     def extract_file_request(self, request, bundle, **kwargs):
         """Return a single file from the Package, extracting if necessary."""
         # NOTE this responds to HEAD because AtoM uses HEAD to check for the existence of a file. The storage service has no way to check if a file exists except by downloading and extracting this AIP
@@ -913,6 +1070,7 @@ class PackageResource(ModelResource):
         return response
 
     @_custom_endpoint(expected_methods=['get', 'head'])
+    @throttle.interactive
     def download_request(self, request, bundle, **kwargs):
         """Return the entire Package to be downloaded."""
         # NOTE this responds to HEAD because AtoM uses HEAD to check for the existence of a package. The storage service has no way to check if the package still exists except by downloading it
@@ -977,18 +1135,80 @@ class PackageResource(ModelResource):
         if len(callbacks) == 0:
             return http.HttpNoContent()
 
-        fail = 0
+        try:
+            checksums = self._post_store_checksums(package)
+        # Currently we only support this for local packages.
+        except NotImplementedError:
+            return http.HttpNoContent()
+
+        fail = send_post_store_callbacks(callbacks, checksums)
+
+        if fail > 0:
+            response = {
+                "message": _("Failed to POST %(count)d responses to callback URI") % {'count': fail},
+                "failure_count": fail,
+                "callback_uris": [c.uri for c in callbacks]
+            }
+            return http.HttpApplicationError(
+                json.dumps(response),
+                content_type="application/json"
+            )
+        else:
+            return http.HttpNoContent()
+
+    @_custom_endpoint(expected_methods=['get'])
+    def aip_store_callback_request_async(self, request, bundle, **kwargs):
+        """
+        Sends the post-store callbacks of the files of a package in a
+        background task, returning a HTTP 202 response with a redirect to a
+        URL for polling for its completion. The task reports the number of
+        checksums processed as its progress.
+        """
+        package = bundle.obj
+
+        callbacks = Callback.objects.filter(event="post_store")
+        if len(callbacks) == 0:
+            return http.HttpNoContent()
+        # Currently we only support this for local packages.
+        if package.is_compressed and package.get_local_path() is None:
+            return http.HttpNoContent()
+
+        def report_progress(done, total):
+            AsyncManager.report_progress({'processed': done, 'total': total})
+
+        def task():
+            checksums = self._post_store_checksums(package)
+            fail = send_post_store_callbacks(
+                callbacks, checksums, progress=report_progress)
+            if fail > 0:
+                raise CallbackError(
+                    _("Failed to POST %(count)d responses to callback URI") % {'count': fail})
+            return _("Callbacks sent for the files of package %(uuid)s") % {'uuid': package.uuid}
 
+        async_task = AsyncManager.run_task(task)
+
+        response = http.HttpAccepted()
+        response['Location'] = reverse('api_dispatch_detail', kwargs={
+            'api_name': 'v2',
+            'resource_name': 'async',
+            'id': async_task.id,
+        })
+        return response
+
+    def _post_store_checksums(self, package):
+        """
+        Return the sha512 checksums of the files of package from its bag
+        manifest.
+
+        :raises: NotImplementedError if the package is compressed and not
+            available locally.
+        """
         if package.is_compressed:
             # Don't extract the entire AIP, which could take forever;
             # instead, just extract bagit.txt and manifest-sha512.txt,
             # which is enough to get bag.entries with the
             # precalculated sha512 checksums
-            try:
-                basedir = package.get_base_directory()
-            # Currently we only support this for local packages.
-            except NotImplementedError:
-                return http.HttpNoContent()
+            basedir = package.get_base_directory()
 
             __, tmpdir = package.extract_file(os.path.join(basedir, 'bagit.txt'))
             package.extract_file(os.path.join(basedir, 'manifest-sha512.txt'),
@@ -1001,46 +1221,21 @@ class PackageResource(ModelResource):
 
         safe_files = ('bag-info.txt', 'manifest-sha512.txt', 'bagit.txt')
 
-        bag = bagit.Bag(package_dir)
-        for f, checksums in bag.entries.items():
-            try:
-                cksum = checksums['sha512']
-            except KeyError:
-                # These files do not typically have an sha512 hash, so it's
-                # fine for these to be missing that key; every other file should.
-                if f not in safe_files:
-                    LOGGER.warning("Post-store callback: sha512 missing for file %s", f)
-                continue
-
-            files = File.objects.filter(checksum=cksum, stored=False)
-            if len(files) > 1:
-                LOGGER.warning("Multiple File entries found for sha512 %s", cksum)
-
-            for file_ in files:
-                for callback in callbacks:
-                    uri = callback.uri.replace('<source_id>', file_.source_id)
-                    try:
-                        callback.execute(uri)
-                        file_.stored = True
-                        file_.save()
-                    except CallbackError:
-                        fail += 1
-
-        if tmpdir is not None:
-            shutil.rmtree(tmpdir)
-
-        if fail > 0:
-            response = {
-                "message": _("Failed to POST %(count)d responses to callback URI") % {'count': fail},
-                "failure_count": fail,
-                "callback_uris": [c.uri for c in callbacks]
-            }
-            return http.HttpApplicationError(
-                json.dumps(response),
-                content_type="application/json"
-            )
-        else:
-            return http.HttpNoContent()
+        checksums = []
+        try:
+            bag = bagit.Bag(package_dir)
+            for f, file_checksums in bag.entries.items():
+                try:
+                    checksums.append(file_checksums['sha512'])
+                except KeyError:
+                    # These files do not typically have an sha512 hash, so it's
+                    # fine for these to be missing that key; every other file should.
+                    if f not in safe_files:
+                        LOGGER.warning("Post-store callback: sha512 missing for file %s", f)
+        finally:
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir)
+        return checksums
 
     @_custom_endpoint(expected_methods=['post'])
     def reindex_request(self, request, bundle, **kwargs):
@@ -1140,7 +1335,7 @@ class PackageResource(ModelResource):
 
         return (status_code, response)
 
-    @_custom_endpoint(expected_methods=['get', 'put', 'delete'])
+    @_custom_endpoint(expected_methods=['get', 'put', 'delete'], deserialize=False)
     def manage_contents(self, request, bundle, **kwargs):
         if request.method == 'PUT':
             return self._add_files_to_package(request, bundle, **kwargs)
@@ -1149,6 +1344,37 @@ class PackageResource(ModelResource):
         elif request.method == 'GET':
             return self._package_contents(request, bundle, **kwargs)
 
+    @_custom_endpoint(expected_methods=['put'], deserialize=False)
+    def manage_contents_async(self, request, bundle, **kwargs):
+        """
+        Adds a set of files to a package in a background task, returning a
+        HTTP 202 response with a redirect to a URL for polling for its
+        completion. Suited to lists too large to be added during a request.
+
+        See _add_files_to_package for a description of the expected request
+        format.
+        """
+        # The request body cannot be read once the response is sent
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        shutil.copyfileobj(request, body)
+        body.seek(0)
+        package = bundle.obj
+
+        def task():
+            with body:
+                count = self._create_files(package, body)
+            return _("%(count)d files created in package %(uuid)s") % {'count': count, 'uuid': package.uuid}
+
+        async_task = AsyncManager.run_task(task)
+
+        response = http.HttpAccepted()
+        response['Location'] = reverse('api_dispatch_detail', kwargs={
+            'api_name': 'v2',
+            'resource_name': 'async',
+            'id': async_task.id,
+        })
+        return response
+
     def _remove_files_from_package(self, request, bundle, **kwargs):
         """
         Removes all file records associated with this package.
@@ -1169,26 +1395,55 @@ class PackageResource(ModelResource):
             "sipuuid": "string",
             "origin": "string"
         }
+
+        The body is parsed and the files are inserted in batches, so large
+        lists are never loaded in memory at once. Either all the files are
+        added or none is.
         """
 
         try:
-            files_list = json.load(request)
-        except ValueError:
+            count = self._create_files(bundle.obj, request)
+        except KeyError as e:
             response = {
                 "success": False,
-                "error": _("No JSON object could be decoded from POST body.")
+                "error": _('File object was missing key: %(key)s') % {'key': e.args[0]},
             }
             return http.HttpBadRequest(json.dumps(response),
-                content_type="application/json")
-
-        if not isinstance(files_list, list):
+                content_type="application_json")
+        except TypeError:
             response = {
                 "success": False,
                 "error": _("JSON request must contain a list of objects.")
             }
             return http.HttpBadRequest(json.dumps(response),
                 content_type="application/json")
+        except ValueError:
+            response = {
+                "success": False,
+                "error": _("No JSON object could be decoded from POST body.")
+            }
+            return http.HttpBadRequest(json.dumps(response),
+                content_type="application/json")
 
+        if count == 0:
+            return http.HttpResponse()
+
+        response = {
+            "success": True,
+            "message": _("%(count)d files created in package %(uuid)s") % {'count': count, 'uuid': bundle.obj.uuid},
+        }
+        return http.HttpCreated(json.dumps(response),
+            content_type="application_json")
+
+    def _create_files(self, package, stream):
+        """
+        Creates the files listed in the JSON read from stream in package, see
+        _add_files_to_package, and returns how many were created.
+
+        :raises: ValueError if stream is not valid JSON, TypeError if it is
+            not a list of objects, KeyError if an object is missing a key.
+            No file is created then.
+        """
         property_map = {
             "relative_path": "name",
             "fileuuid": "source_id",
@@ -1197,36 +1452,25 @@ class PackageResource(ModelResource):
             "origin": "origin",
         }
 
-        if len(files_list) == 0:
-            return http.HttpResponse()
-
-        created_files = []
-        for f in files_list:
-            kwargs = {
-                "package": bundle.obj
-            }
-            for source, dest in property_map.items():
-                try:
+        count = 0
+        batch = []
+        with transaction.atomic():
+            for f in jsonstream.iter_list(stream):
+                if not isinstance(f, dict):
+                    raise TypeError('File is not an object')
+                kwargs = {
+                    "package": package
+                }
+                for source, dest in property_map.items():
                     kwargs[dest] = f[source]
-                except KeyError:
-                    response = {
-                        "success": False,
-                        "error": _('File object was missing key: %(key)s') % {'key': source},
-                    }
-                    return http.HttpBadRequest(json.dumps(response),
-                        content_type="application_json")
-
-            created_files.append(File(**kwargs))
-
-        for f in created_files:
-            f.save()
-
-        response = {
-            "success": True,
-            "message": _("%(count)d files created in package %(uuid)s") % {'count': len(created_files), 'uuid': bundle.obj.uuid},
-        }
-        return http.HttpCreated(json.dumps(response),
-            content_type="application_json")
+                batch.append(File(**kwargs))
+                if len(batch) == FILE_BATCH_SIZE:
+                    File.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            File.objects.bulk_create(batch)
+            count += len(batch)
+        return count
 
     def _package_contents(self, request, bundle, **kwargs):
         """
@@ -1235,6 +1479,8 @@ class PackageResource(ModelResource):
 
         The file properties provided are the properties of the ~:class:`~locations.models.event.File` class; see the class definition for more information.
 
+        The response is streamed, FILE_BATCH_SIZE files at a time.
+
         :returns: a JSON object in the following format:
         {
             "success": True,
@@ -1249,16 +1495,24 @@ class PackageResource(ModelResource):
             ]
         }
         """
-        response = {
-            "success": True,
-            "package": bundle.obj.uuid,
-            "files": []
-        }
-
-        for f in bundle.obj.file_set.all():
-            response["files"].append({attr: getattr(f, attr) for attr in ('source_id', 'name', 'source_package', 'checksum', 'accessionid', 'origin')})
-
-        return http.HttpResponse(status=200, content=json.dumps(response),
+        attrs = ('source_id', 'name', 'source_package', 'checksum', 'accessionid', 'origin')
+        files = bundle.obj.file_set.values_list(*attrs).iterator()
+
+        def stream():
+            yield '{"success": true, "package": %s, "files": [' % json.dumps(bundle.obj.uuid)
+            separator = ''
+            batch = []
+            for values in files:
+                batch.append(json.dumps(dict(zip(attrs, values))))
+                if len(batch) == FILE_BATCH_SIZE:
+                    yield separator + ', '.join(batch)
+                    separator = ', '
+                    batch = []
+            if batch:
+                yield separator + ', '.join(batch)
+            yield ']}'
+
+        return StreamingHttpResponse(stream(), status=200,
             content_type='application/json')
 
     def file_data(self, request, **kwargs):
@@ -1271,14 +1525,20 @@ class PackageResource(ModelResource):
 
         Acceptable parameters are:
             * relative_path (searches the `name` field)
+            * relative_path_prefix (searches the start of the `name` field)
             * fileuuid (searches the `source_id` field)
             * accessionid (searches the `accessionid` field)
             * sipuuid (searches the `source_package` field)
 
+        Results can be paged with limit=<number of files>. If more files
+        match, the response has a Link header with the URL of the next page
+        (rel="next"), which adds a cursor parameter.
+
         :returns: an array of one or more objects. See the transferfile
         index for information on the return format.
         If no results are found for the specified query, returns 404.
-        If no acceptable query parameters are found, returns 400.
+        If no acceptable query parameters are found, or limit or cursor are
+        not positive integers, returns 400.
         """
         # Tastypie API checks
         self.method_check(request, allowed=['get', 'post'])
@@ -1299,7 +1559,9 @@ class PackageResource(ModelResource):
             except KeyError:
                 pass
 
-        if not query:
+        prefix = request.GET.get('relative_path_prefix')
+
+        if not query and not prefix:
             response = {
                 "success": False,
                 "error": _("No supported query properties found!")
@@ -1307,8 +1569,35 @@ class PackageResource(ModelResource):
             return http.HttpBadRequest(content=json.dumps(response),
                 content_type="application/json")
 
+        try:
+            limit = int(request.GET.get('limit') or 0)
+            cursor = int(request.GET.get('cursor') or 0)
+            if limit < 0 or cursor < 0:
+                raise ValueError('Negative limit or cursor')
+        except ValueError:
+            response = {
+                "success": False,
+                "error": _("limit and cursor must be positive integers.")
+            }
+            return http.HttpBadRequest(content=json.dumps(response),
+                content_type="application/json")
+
         files = File.objects.filter(**query)
-        if not files.exists():
+        if prefix:
+            files = files.name_startswith(prefix)
+        next_url = None
+        if limit or cursor:
+            files = files.filter(id__gt=cursor).order_by('id')
+        if limit:
+            files = list(files[:limit + 1])
+            if len(files) > limit:
+                files = files[:limit]
+                params = request.GET.copy()
+                params['cursor'] = files[-1].id
+                next_url = '{}?{}'.format(request.path, params.urlencode())
+        else:
+            files = list(files)
+        if not files:
             return http.HttpNotFound()
 
         response = []
@@ -1323,7 +1612,10 @@ class PackageResource(ModelResource):
                 "sipuuid": f.source_package
             })
 
-        return http.HttpResponse(content=json.dumps(response), content_type="application/json")
+        response = http.HttpResponse(content=json.dumps(response), content_type="application/json")
+        if next_url:
+            response['Link'] = '<{}>; rel="next"'.format(next_url)
+        return response
 
 
 class AsyncResource(ModelResource):
@@ -1343,6 +1635,7 @@ class AsyncResource(ModelResource):
 
     def dehydrate(self, bundle):
         """Pull out errors and results using our accessors so they get unpickled."""
+        bundle.data['progress'] = bundle.obj.progress
         if bundle.obj.completed:
             if bundle.obj.was_error:
                 bundle.data['error'] = bundle.obj.error
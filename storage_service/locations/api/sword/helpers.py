@@ -14,10 +14,8 @@ from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 
-# External dependencies, alphabetical
-import requests
-
 # This project, alphabetical
+from common import http_client
 from locations import models
 from locations.models.async_manager import AsyncManager
 from common.utils import generate_checksum
@@ -104,7 +102,8 @@ def download_resource(url, destination_path, filename=None, username=None, passw
         auth = (username, password)
 
     verify = not settings.INSECURE_SKIP_VERIFY
-    response = requests.get(url, auth=auth, verify=verify)
+    session = http_client.get_session('sword', url, auth=auth)
+    response = session.get(url, verify=verify, stream=True)
     if filename is None:
         if 'content-disposition' in response.headers:
             filename = parse_filename_from_content_disposition(response.headers['content-disposition'])
@@ -114,7 +113,8 @@ def download_resource(url, destination_path, filename=None, username=None, passw
 
     filepath = os.path.join(destination_path, filename)
     with open(filepath, 'wb') as fp:
-        fp.write(response.content)
+        for chunk in response.iter_content(1024 * 1024):
+            fp.write(chunk)
 
     return filename
 
@@ -75,12 +75,16 @@ class PipelineForm(forms.ModelForm):
 class SpaceForm(forms.ModelForm):
     class Meta:
         model = models.Space
-        fields = ('access_protocol', 'size', 'path', 'staging_path')
+        fields = ('access_protocol', 'size', 'path', 'staging_path', 'rsync_workers',
+                  'read_limit', 'write_limit', 'max_operations',
+                  'browse_cache_ttl')
 
     def __init__(self, *args, **kwargs):
         super(SpaceForm, self).__init__(*args, **kwargs)
         instance = getattr(self, 'instance', None)
         self.filter_beta_protocols()
+        # Optional, e.g. when creating spaces through the API
+        self.fields['rsync_workers'].required = False
         if instance and instance.uuid:
             # If editing (not creating a new object) access protocol shouldn't
             # be changed.  Remove from fields, print in template
@@ -96,6 +100,12 @@ class SpaceForm(forms.ModelForm):
         self.fields['access_protocol'].choices = filtered_protocols
         self.fields['access_protocol'].widget.choices = filtered_protocols
 
+    def clean_rsync_workers(self):
+        rsync_workers = self.cleaned_data['rsync_workers']
+        if rsync_workers is None:
+            return self._meta.model._meta.get_field('rsync_workers').default
+        return rsync_workers
+
     def clean_access_protocol(self):
         instance = getattr(self, 'instance', None)
         if instance and instance.uuid:
@@ -0,0 +1,37 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from locations.models.arkivum import ArkivumStatusPoller
+
+
+class Command(BaseCommand):
+    help = 'Poll Arkivum for the replication state of the packages stored ' \
+        'in Arkivum spaces, and mark the replicated ones as uploaded.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Poll once and exit.')
+        parser.add_argument('--sleep', type=int, default=30,
+                            help='Seconds to sleep between polls.')
+        parser.add_argument('--interval', type=int, default=60,
+                            help='Seconds before a package still replicating is checked again.')
+        parser.add_argument('--max-interval', type=int, default=3600,
+                            help='Maximum seconds between checks of a package.')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Number of packages checked at the same time.')
+
+    def handle(self, *args, **options):
+        poller = ArkivumStatusPoller(
+            concurrency=options['concurrency'],
+            interval=options['interval'],
+            max_interval=options['max_interval'])
+        while True:
+            result = poller.poll()
+            print('Uploaded: {uploaded}, pending: {pending}, errors: {errors}'.format(**result))
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+INDEX_NAME = 'locations_package_current_path_idx'
+
+
+def create_index(apps, schema_editor):
+    """Index Package.current_path, used to find the package of a path.
+
+    current_path is a TEXT column, which MySQL can only index with a prefix
+    length. 191 characters fit in the index key limit with utf8mb4.
+    """
+    if schema_editor.connection.vendor == 'mysql':
+        column = 'current_path(191)'
+    else:
+        column = 'current_path'
+    schema_editor.execute('CREATE INDEX {} ON locations_package ({})'.format(
+        INDEX_NAME, column))
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        sql = 'DROP INDEX {} ON locations_package'
+    else:
+        sql = 'DROP INDEX {}'
+    schema_editor.execute(sql.format(INDEX_NAME))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0020_dspace_rest'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
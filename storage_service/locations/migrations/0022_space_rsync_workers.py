@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.core.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0021_package_current_path_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='space',
+            name='rsync_workers',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Number of rsync processes copying a package to or from a remote host at the same time. Packages are split into that many lists of files of similar size.', verbose_name='Rsync workers', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.core.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0022_space_rsync_workers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='space',
+            name='max_operations',
+            field=models.PositiveSmallIntegerField(default=None, validators=[django.core.validators.MinValueValidator(1)], blank=True, help_text='Maximum number of packages moved to or from this space or checked for fixity at the same time, in each Storage Service process (optional)', null=True, verbose_name='Maximum concurrent operations'),
+        ),
+        migrations.AddField(
+            model_name='space',
+            name='read_limit',
+            field=models.PositiveIntegerField(default=None, help_text='Maximum rate at which packages are read from this space, in KiB/s, in each Storage Service process (optional)', null=True, verbose_name='Read bandwidth limit', blank=True),
+        ),
+        migrations.AddField(
+            model_name='space',
+            name='write_limit',
+            field=models.PositiveIntegerField(default=None, help_text='Maximum rate at which packages are written to this space, in KiB/s, in each Storage Service process (optional)', null=True, verbose_name='Write bandwidth limit', blank=True),
+        ),
+    ]
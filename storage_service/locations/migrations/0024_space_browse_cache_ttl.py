@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0023_space_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='space',
+            name='browse_cache_ttl',
+            field=models.PositiveIntegerField(default=None, help_text='Number of seconds the contents of a directory are cached after browsing it. 0 disables caching. Leave empty to use the default of the Storage Service (optional)', null=True, verbose_name='Browse cache time', blank=True),
+        ),
+    ]
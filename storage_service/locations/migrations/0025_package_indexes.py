@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0024_space_browse_cache_ttl'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='package',
+            name='package_type',
+            field=models.CharField(db_index=True, max_length=8, choices=[(b'AIP', b'AIP'), (b'AIC', b'AIC'), (b'SIP', b'SIP'), (b'DIP', b'DIP'), (b'transfer', 'Transfer'), (b'file', 'Single File'), (b'deposit', 'FEDORA Deposit')]),
+        ),
+        migrations.AlterField(
+            model_name='package',
+            name='status',
+            field=models.CharField(default=b'FAIL', help_text='Status of the package in the storage service.', max_length=8, db_index=True, choices=[(b'PENDING', 'Upload Pending'), (b'STAGING', 'Staged on Storage Service'), (b'UPLOADED', 'Uploaded'), (b'VERIFIED', 'Verified'), (b'FAIL', 'Failed'), (b'DEL_REQ', 'Delete requested'), (b'DELETED', 'Deleted'), (b'FINALIZE', 'Deposit Finalized')]),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Index name: (column, MySQL prefix length)
+INDEXES = {
+    'locations_file_name_idx': ('name', 191),
+    'locations_file_source_id_idx': ('source_id', 64),
+    'locations_file_source_package_idx': ('source_package', 64),
+    'locations_file_accessionid_idx': ('accessionid', 191),
+    'locations_file_checksum_idx': ('checksum', 128),
+}
+
+
+def create_indexes(apps, schema_editor):
+    """Index the File columns searched by the file metadata API and the
+    post-store callback.
+
+    The columns are TEXT, which MySQL can only index with a prefix length;
+    191 characters fit in the index key limit with utf8mb4. The name index
+    also serves prefix searches: PostgreSQL needs text_pattern_ops for LIKE
+    'prefix%' to use it.
+
+    MySQL builds the indexes without blocking writes to the table (online
+    DDL). On PostgreSQL migrations run in a transaction, where CREATE INDEX
+    blocks writes until it is done: installations with large File tables
+    can create the indexes beforehand with CREATE INDEX CONCURRENTLY and the
+    same names, since the indexes that exist are skipped.
+    """
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        existing = connection.introspection.get_constraints(cursor, 'locations_file')
+    for name, (column, prefix_length) in sorted(INDEXES.items()):
+        if name in existing:
+            continue
+        if connection.vendor == 'mysql':
+            sql = 'CREATE INDEX {name} ON locations_file ({column}({length})) ALGORITHM=INPLACE LOCK=NONE'
+        elif connection.vendor == 'postgresql':
+            sql = 'CREATE INDEX {name} ON locations_file ({column}{ops})'
+        else:
+            sql = 'CREATE INDEX {name} ON locations_file ({column})'
+        schema_editor.execute(sql.format(
+            name=name, column=column, length=prefix_length,
+            ops=' text_pattern_ops' if column == 'name' else ''))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        sql = 'DROP INDEX {} ON locations_file'
+    else:
+        sql = 'DROP INDEX {}'
+    for name in sorted(INDEXES):
+        schema_editor.execute(sql.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0025_package_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
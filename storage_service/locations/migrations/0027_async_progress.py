@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0026_file_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='async',
+            name='progress',
+            field=jsonfield.fields.JSONField(default=None, help_text='Progress reported by the task while running, e.g. the number of items processed.', null=True, verbose_name='Progress', blank=True),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def set_latest_fixity_checks(apps, schema_editor):
+    """Copy the latest fixity check and the failure count of each package
+    from its FixityLog history."""
+    Package = apps.get_model('locations', 'Package')
+    FixityLog = apps.get_model('locations', 'FixityLog')
+    failures = dict(FixityLog.objects.filter(success=False)
+                    .values_list('package').annotate(Count('id')))
+    latest = FixityLog.objects.values_list('package') \
+        .annotate(Max('datetime_reported'))
+    for package_uuid, datetime_reported in latest:
+        log = FixityLog.objects.filter(
+            package=package_uuid,
+            datetime_reported=datetime_reported).latest('id')
+        Package.objects.filter(uuid=package_uuid).update(
+            latest_fixity_check_datetime=log.datetime_reported,
+            latest_fixity_check_result=log.success,
+            fixity_failure_count=failures.get(package_uuid, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0027_async_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='fixity_failure_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of fixity checks of this package that failed.', verbose_name='Fixity check failures', editable=False),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='latest_fixity_check_datetime',
+            field=models.DateTimeField(editable=False, blank=True, help_text='When the latest fixity check of this package was reported, if it was ever checked.', null=True, verbose_name='Latest fixity check', db_index=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='latest_fixity_check_result',
+            field=models.NullBooleanField(editable=False, help_text='True if the latest fixity check succeeded, False if it failed, None if it was not run or the package was never checked.', verbose_name='Latest fixity check result', db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='fixitylog',
+            index_together=set([('package', 'datetime_reported')]),
+        ),
+        migrations.RunPython(set_latest_fixity_checks,
+                             migrations.RunPython.noop),
+    ]
@@ -1,10 +1,12 @@
 from __future__ import absolute_import
 # stdlib, alphabetical
+from concurrent import futures
 import json
 import logging
 from lxml import etree
 import os
 import requests
+import time
 import urllib
 
 # Core Django, alphabetical
@@ -18,12 +20,13 @@ from django.utils.translation import ugettext_lazy as _
 import dateutil.parser
 
 # This project, alphabetical
-from common import utils
+from common import http_client, utils
 
 # This module, alphabetical
 from . import StorageException
 from .location import Location
 from .package import Package
+from .space import Space
 
 LOGGER = logging.getLogger(__name__)
 
@@ -55,6 +58,12 @@ class Arkivum(models.Model):
         Location.AIP_STORAGE,
     ]
 
+    @property
+    def session(self):
+        return http_client.get_session(
+            'arkivum', 'https://' + self.host,
+            pool_size=settings.ARKIVUM_STATUS_CONCURRENCY)
+
     def browse(self, path):
         # Support browse so that the Location select works
         if self.remote_user and self.remote_name:
@@ -69,7 +78,7 @@ class Arkivum(models.Model):
         # TODO folders
         url = 'https://' + self.host + '/files/' + delete_path
         LOGGER.info('URL: %s', url)
-        response = requests.delete(url, verify=VERIFY)
+        response = self.session.delete(url, verify=VERIFY)
         LOGGER.info('Response: %s, Response text: %s', response.status_code, response.text)
         if response.status_code != 204:
             raise StorageException('Unable to delete %s', delete_path)
@@ -136,7 +145,7 @@ class Arkivum(models.Model):
 
         LOGGER.debug('POST URL: %s; Header: %s; Payload: %s; Files: %s', url, headers, payload, files)
         try:
-            response = requests.post(url, headers=headers, data=payload, files=files, verify=VERIFY)
+            response = self.session.post(url, headers=headers, data=payload, files=files, verify=VERIFY)
         except requests.exceptions.ConnectionError:
             LOGGER.exception('Error in connection for POST to %s', url)
             raise StorageException(_('Error in connection for POST to %(url)s'), {'url': url})
@@ -158,9 +167,12 @@ class Arkivum(models.Model):
         package.misc_attributes.update({'arkivum_identifier': request_id})
         package.save()
 
-    def _get_package_info(self, package):
+    def _get_package_info(self, package, is_compressed=None):
         """
         Return status and file info for a package in Arkivum.
+
+        :param bool is_compressed: Whether the package is compressed, if
+            already known; otherwise checked with package.is_compressed.
         """
         # If no request ID, try POSTing to Arkivum again
         if 'arkivum_identifier' not in package.misc_attributes:
@@ -174,14 +186,16 @@ class Arkivum(models.Model):
             return {'error': True, 'error_message': msg}
 
         # Ask Arkivum for replication status
-        if package.is_compressed:
+        if is_compressed is None:
+            is_compressed = package.is_compressed
+        if is_compressed:
             url = 'https://' + self.host + '/api/2/files/release/' + package.misc_attributes['arkivum_identifier']
         else:
             url = 'https://' + self.host + '/api/3/ingest-manifest/status/' + package.misc_attributes['arkivum_identifier']
 
         LOGGER.info('URL: %s', url)
         try:
-            response = requests.get(url, verify=VERIFY)
+            response = self.session.get(url, verify=VERIFY)
         except Exception:
             msg = _('Error fetching package status')
             LOGGER.warning(msg, exc_info=True)
@@ -214,7 +228,7 @@ class Arkivum(models.Model):
         LOGGER.info('URL: %s', url)
 
         try:
-            response = requests.get(url, verify=VERIFY)
+            response = self.session.get(url, verify=VERIFY)
         except Exception:
             msg = _('Error fetching file info')
             LOGGER.warning(msg, exc_info=True)
@@ -233,12 +247,21 @@ class Arkivum(models.Model):
             return {'error': True, 'error_message': msg}
         return response_json
 
-    def update_package_status(self, package):
-        LOGGER.info('Package status: %s', package.status)
-        response_json = self._get_package_info(package)
+    def _get_replication_state(self, package, is_compressed=None):
+        """
+        Return the replication state of a package in Arkivum.
+
+        :param bool is_compressed: Whether the package is compressed, if
+            already known; otherwise checked with package.is_compressed.
+        :returns: Tuple of (replication state, error message). The replication
+            state is None on error.
+        """
+        if is_compressed is None:
+            is_compressed = package.is_compressed
+        response_json = self._get_package_info(package, is_compressed)
         if response_json.get('error'):
             return (None, response_json['error_message'])
-        if package.is_compressed:
+        if is_compressed:
             # Look for ['fileInformation']['replicationState'] == 'green'
             replication = response_json.get('fileInformation', {}).get('replicationState', '')
         else:  # uncompressed bag
@@ -251,6 +274,13 @@ class Arkivum(models.Model):
                 if response_json.get('error'):
                     return (None, response_json['error_message'])
                 replication = response_json.get('replicationState', '')
+        return (replication, None)
+
+    def update_package_status(self, package):
+        LOGGER.info('Package status: %s', package.status)
+        replication, error = self._get_replication_state(package)
+        if error:
+            return (None, error)
         if replication.lower() == 'green':
             # Set status to UPLOADED
             package.status = Package.UPLOADED
@@ -281,7 +311,7 @@ class Arkivum(models.Model):
                 url = 'https://' + self.host + '/api/2/files/fileInfo/' + url_path
                 LOGGER.info('URL: %s', url)
                 try:
-                    response = requests.get(url, verify=VERIFY)
+                    response = self.session.get(url, verify=VERIFY)
                 except Exception:
                     LOGGER.warning('Error fetching file information', exc_info=True)
                     return None
@@ -368,3 +398,110 @@ class Arkivum(models.Model):
             timestamp = dateutil.parser.parse(timestamp).isoformat()
 
         return (success, errors, message, timestamp)
+
+
+class ArkivumStatusPoller(object):
+    """
+    Polls Arkivum for the replication state of all the pending packages.
+
+    Packages stored in Arkivum stay in STAGING until Arkivum reports them as
+    replicated ('green'). Each call to ``poll`` checks the packages that are
+    due in a pool of threads, and marks the replicated ones as UPLOADED with a
+    single update. Packages still replicating are checked again after an
+    interval that doubles on every check, up to ``max_interval`` seconds.
+    """
+
+    def __init__(self, concurrency=None, interval=60, max_interval=3600):
+        self.concurrency = concurrency or settings.ARKIVUM_STATUS_CONCURRENCY
+        self.interval = interval
+        self.max_interval = max_interval
+        # Package UUID: (time of the next check, seconds between checks)
+        self._schedule = {}
+
+    @staticmethod
+    def pending_packages():
+        """Return the packages stored in Arkivum that are not replicated yet."""
+        return Package.objects.filter(
+            status=Package.STAGING,
+            current_location__space__access_protocol=Space.ARKIVUM,
+        ).select_related('current_location', 'current_location__space')
+
+    def poll(self, now=None):
+        """
+        Check the replication state of the pending packages that are due.
+
+        :returns: Dict with the number of packages 'uploaded', still 'pending'
+            and whose state could not be fetched ('errors').
+        """
+        if now is None:
+            now = time.time()
+        packages = list(self.pending_packages())
+        pending_uuids = set(package.uuid for package in packages)
+        # Forget packages that are not pending anymore
+        for uuid in set(self._schedule) - pending_uuids:
+            del self._schedule[uuid]
+        due = [package for package in packages
+               if self._schedule.get(package.uuid, (0, None))[0] <= now]
+        if not due:
+            return {'uploaded': 0, 'pending': len(packages), 'errors': 0}
+
+        arkivums = {
+            arkivum.space_id: arkivum for arkivum in Arkivum.objects.filter(
+                space__in=set(package.current_location.space_id for package in due))
+        }
+        jobs = []
+        for package in due:
+            arkivum = arkivums[package.current_location.space_id]
+            # Fetching the request ID and checking whether the package is
+            # compressed may use the database, so it is done in this thread.
+            # The workers only make requests to Arkivum.
+            try:
+                is_compressed = package.is_compressed
+                if 'arkivum_identifier' not in package.misc_attributes:
+                    arkivum._get_package_info(package, is_compressed)
+            except Exception:
+                LOGGER.warning('Unable to prepare %s for polling', package, exc_info=True)
+                is_compressed = None
+            jobs.append((arkivum, package, is_compressed))
+
+        uploaded = []
+        errors = 0
+        with futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = executor.map(lambda job: self._check(*job), jobs)
+            for (_arkivum, package, _is_compressed), (replication, error) in zip(jobs, results):
+                if error:
+                    LOGGER.warning('Unable to get replication state of %s: %s', package, error)
+                    errors += 1
+                    self._reschedule(package.uuid, now)
+                elif replication.lower() == 'green':
+                    uploaded.append(package.uuid)
+                    self._schedule.pop(package.uuid, None)
+                else:
+                    LOGGER.debug('Replication state of %s: %s', package, replication)
+                    self._reschedule(package.uuid, now)
+
+        if uploaded:
+            Package.objects.filter(uuid__in=uploaded).update(status=Package.UPLOADED)
+        LOGGER.info('Arkivum packages replicated: %s, pending: %s, errors: %s',
+                    len(uploaded), len(packages) - len(uploaded), errors)
+        return {
+            'uploaded': len(uploaded),
+            'pending': len(packages) - len(uploaded),
+            'errors': errors,
+        }
+
+    @staticmethod
+    def _check(arkivum, package, is_compressed):
+        if is_compressed is None:
+            return (None, _('Unable to determine whether the package is compressed'))
+        if 'arkivum_identifier' not in package.misc_attributes:
+            return (None, _('Unable to contact Arkivum'))
+        try:
+            return arkivum._get_replication_state(package, is_compressed)
+        except Exception as err:
+            return (None, str(err))
+
+    def _reschedule(self, uuid, now):
+        previous = self._schedule.get(uuid, (None, None))[1]
+        interval = min(previous * 2, self.max_interval) if previous else self.interval
+        self._schedule[uuid] = (now + interval, interval)
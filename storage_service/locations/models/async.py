@@ -8,6 +8,9 @@ from django.utils import six
 from django.utils.six.moves import cPickle as pickle
 from django.utils.translation import ugettext_lazy as _
 
+# Third party dependencies, alphabetical
+import jsonfield
+
 __all__ = ('Async',)
 
 LOGGER = logging.getLogger(__name__)
@@ -28,6 +31,10 @@ class Async(models.Model):
 
     _error = models.BinaryField(null=True, db_column='error')
 
+    progress = jsonfield.JSONField(null=True, blank=True, default=None,
+        verbose_name=_('Progress'),
+        help_text=_("Progress reported by the task while running, e.g. the number of items processed."))
+
     created_time = models.DateTimeField(auto_now_add=True)
     updated_time = models.DateTimeField(auto_now=True)
     completed_time = models.DateTimeField(null=True)
@@ -43,6 +43,7 @@ class RunningTask(object):
         self.was_error = False
         self.result = None
         self.error = None
+        self.progress = None
 
 
 class AsyncManager(object):
@@ -82,6 +83,9 @@ class AsyncManager(object):
                                 for task in AsyncManager.running_tasks
                                 if task.thread.is_alive()]
             Async.objects.filter(id__in=running_task_ids).update(updated_time=timezone.now())
+            for task in AsyncManager.running_tasks:
+                if task.thread.is_alive() and task.progress is not None:
+                    Async.objects.filter(id=task.async_id).update(progress=task.progress)
 
             # Find any tasks that have completed since we last looked
             completed_tasks = [task for task in AsyncManager.running_tasks if not task.thread.is_alive()]
@@ -94,6 +98,7 @@ class AsyncManager(object):
                     async_task.completed = True
                     async_task.completed_time = timezone.now()
                     async_task.was_error = task.was_error
+                    async_task.progress = task.progress
 
                     if task.was_error:
                         async_task.error = task.error
@@ -129,6 +134,17 @@ class AsyncManager(object):
 
         return wrapper
 
+    @staticmethod
+    def report_progress(progress):
+        """Set the progress of the task running in the current thread, saved
+        in its Async model by the watchdog.  `progress` must be serializable
+        to JSON.  Does nothing outside of a task."""
+        current = threading.current_thread()
+        with AsyncManager.lock:
+            for task in AsyncManager.running_tasks:
+                if task.thread is current:
+                    task.progress = progress
+
     # Run a task.  Return an async object to track it.
     @staticmethod
     def run_task(task_fn, *args, **kwargs):
@@ -1,20 +1,23 @@
 from __future__ import absolute_import
 
 # stdlib, alphabetical
+from concurrent import futures
+import hashlib
 import json
 import logging
 import os
 import re
+import time
 import zipfile
 
 # Core Django, alphabetical
+from django.conf import settings
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
-# Third party dependencies, alphabetical
-import requests
-
 # This project, alphabetical
+from common import browse, http_client
+
 LOGGER = logging.getLogger(__name__)
 
 # This module, alphabetical
@@ -65,8 +68,21 @@ class Dataverse(URLMixin, models.Model):
         verbose_name = _("Dataverse")
         app_label = "locations"
 
+    # Browse lists one page at a time (see Space.browse)
+    PAGINATED_BROWSE = True
+
     ALLOWED_LOCATION_PURPOSE = [Location.TRANSFER_SOURCE]
 
+    BUFFER_SIZE = 1024 * 1024  # 1 MB
+    RETRY_ATTEMPTS = 3
+    RETRY_BACKOFF = 1  # Seconds before the first retry, doubled every retry
+
+    @property
+    def session(self):
+        return http_client.get_session(
+            "dataverse", self._generate_dataverse_url(),
+            pool_size=settings.DATAVERSE_CONCURRENCY)
+
     @staticmethod
     def get_query_value(key, path, default=None):
         """Retrieve the value corresponding to ``key`` from the string
@@ -102,21 +118,33 @@ class Dataverse(URLMixin, models.Model):
         query_string, path = self.get_query_value("query:", path, default="*")
         return dataset, subtree, query_string
 
-    def browse(self, path):
+    def browse(self, path, **options):
         """Fetch the datasets in this dataverse or the files in the dataset
         referenced in ``path``.
+
+        Datasets are paginated and ordered by name by the search API, with
+        the offset of the next page as cursor. The files of a dataset, and
+        datasets filtered by ``name_prefix``, are paginated from the complete
+        listing.
         """
         LOGGER.info("Path received: %s", path)
         dataset_id, subtree, query_string = self.get_query_and_subtree(path)
         LOGGER.info("Dataset ID: %s Subtree: %s Query: %s",
             dataset_id, subtree, query_string)
         if dataset_id:
-            return self._browse_dataset(dataset_id)
-        return self._browse_dataverse(query_string, subtree)
+            result = self._browse_dataset(dataset_id)
+        elif options and not options.get('name_prefix'):
+            return self._browse_dataverse(query_string, subtree, **options)
+        else:
+            result = self._browse_dataverse(query_string, subtree)
+        if options:
+            return browse.paginate_results(result, **options)
+        return result
 
-    def _browse_dataverse(self, query_string, subtree):
+    def _browse_dataverse(self, query_string, subtree, limit=None, cursor=None,
+                          order_by=None):
         """Return all datasets in all Dataverses (conforming to ``browse``
-        protocol).
+        protocol), or one page of them if pagination options are set.
         """
         LOGGER.info("Subtree: %s", subtree)
         LOGGER.info("Query: %s", query_string)
@@ -127,15 +155,18 @@ class Dataverse(URLMixin, models.Model):
             'subtree': subtree,
             'type': 'dataset',
             'sort': 'name',
-            'order': 'asc',
-            'start': 0,
-            'per_page': 50,
+            'order': 'desc' if order_by == '-name' else 'asc',
+            'start': int(cursor or 0),
+            'per_page': min(limit or 50, 1000),
             'show_entity_ids': True,
         }
+        paginated = any(option is not None for option in (limit, cursor, order_by))
+        entries = []
         properties = {}
+        next_cursor = None
         while True:
             LOGGER.debug('URL: %s, params: %s', url, params)
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params)
             LOGGER.debug('Response: %s', response)
             # If the request isn't successful, i.e. doesn't return 200, then
             # raise an exception. Other use cases from Dataverse might need to
@@ -154,19 +185,27 @@ class Dataverse(URLMixin, models.Model):
                 raise StorageException(
                     _('Unable to parse JSON from response to %(url)s')
                     % {'url': url})
+            if limit is not None:
+                items = items[:limit - len(entries)]
+            entries.extend(str(ds['entity_id']) for ds in items)
             properties.update(
                 {str(ds['entity_id']): {'verbose name': ds['name']}
                  for ds in items})
-            if params['start'] + data['count_in_response'] < data['total_count']:
-                params['start'] += data['count_in_response']
+            if items and params['start'] + len(items) < data['total_count']:
+                params['start'] += len(items)
             else:
                 break
-        entries = list(properties.keys())
-        return {
+            if limit is not None and len(entries) >= limit:
+                next_cursor = str(params['start'])
+                break
+        result = {
             'directories': entries,
             'entries': entries,
             'properties': properties,
         }
+        if paginated:
+            result['next_cursor'] = next_cursor
+        return result
 
     def _browse_dataset(self, dataset_identifier):
         """Return all files in the dataset with ``entity_id``
@@ -178,7 +217,7 @@ class Dataverse(URLMixin, models.Model):
         url = self._generate_dataverse_url(slug=files_in_dataset_path)
         params = {'key': self.api_key}
         LOGGER.debug('URL: %s, params: %s', url, params)
-        response = requests.get(url, params=params)
+        response = self.session.get(url, params=params)
         LOGGER.debug('Response: %s', response)
         # If the request isn't successful, i.e. doesn't return 200, then raise
         # an exception. Other use cases from Dataverse might need to be
@@ -224,7 +263,7 @@ class Dataverse(URLMixin, models.Model):
         url = self._generate_dataverse_url(slug=datasets_url)
         params = {"key": self.api_key}
         LOGGER.debug("URL: %s, params: %s", url, params)
-        response = requests.get(url, params=params)
+        response = self.session.get(url, params=params)
         LOGGER.debug("Response: %s", response)
         if response.status_code != 200:
             raise StorageException(
@@ -250,6 +289,7 @@ class Dataverse(URLMixin, models.Model):
                 dataset, f, sort_keys=True, indent=4, separators=(',', ': '))
 
         # Fetch all files in dataset.json
+        downloads = []
         for file_entry in dataset["latestVersion"]["files"]:
             zipped_bundle = False
             entry_id = str(file_entry["dataFile"]["id"])
@@ -267,29 +307,47 @@ class Dataverse(URLMixin, models.Model):
                 # it would normally (as configured) in the transfer workflow.
                 #
                 # Integrity checks are completed by the Dataverse
-                # microservices.
+                # microservices. The md5 of the file entry is the one of the
+                # original file, not of the bundle, so it is not checked.
                 zipped_bundle = True
                 download_path = os.path.join(
                     dest_path, file_entry["label"][:-4] + ".zip"
                 )
                 bundle_url = "/api/access/datafile/bundle/{}".format(entry_id)
                 url = self._generate_dataverse_url(slug=bundle_url)
+                md5 = None
             else:
                 download_path = os.path.join(
                     dest_path, file_entry["dataFile"]["filename"]
                 )
                 datafile_url = "/api/access/datafile/{}".format(entry_id)
                 url = self._generate_dataverse_url(slug=datafile_url)
-            LOGGER.debug("URL: %s, params: %s", url, params)
-            response = requests.get(url, params=params, stream=True)
-            with open(download_path, "wb") as f:
-                for chunk in response.iter_content(8192):
-                    f.write(chunk)
-            if zipped_bundle:
-                # The bundle .zip itself is ephemeral, and so once downloaded
-                # unzip and remove the container here.
-                LOGGER.info("Bundle downloaded. Deleting.")
-                self.extract_and_remove_bundle(dest_path, download_path)
+                md5 = self._get_md5(file_entry["dataFile"])
+            downloads.append((url, download_path, md5, zipped_bundle))
+
+        # Download the files concurrently. Bundles are extracted as soon as
+        # they are downloaded, while the other files are still downloading.
+        with futures.ThreadPoolExecutor(
+                max_workers=settings.DATAVERSE_CONCURRENCY) as executor:
+            pending = {
+                executor.submit(
+                    self._download_file, url, download_path, params, md5):
+                (download_path, zipped_bundle)
+                for url, download_path, md5, zipped_bundle in downloads
+            }
+            try:
+                for future in futures.as_completed(pending):
+                    future.result()
+                    download_path, zipped_bundle = pending[future]
+                    if zipped_bundle:
+                        # The bundle .zip itself is ephemeral, and so once
+                        # downloaded unzip and remove the container here.
+                        LOGGER.info("Bundle downloaded. Deleting.")
+                        self.extract_and_remove_bundle(dest_path, download_path)
+            except Exception:
+                for future in pending:
+                    future.cancel()
+                raise
 
         # Add Agent info
         agent_info = [
@@ -305,6 +363,71 @@ class Dataverse(URLMixin, models.Model):
             json.dump(agent_info, f, sort_keys=True, indent=4,
                       separators=(',', ': '))
 
+    @staticmethod
+    def _get_md5(data_file):
+        """Return the md5 of a ``dataFile`` entry of a dataset, or None.
+
+        Older Dataverse versions provide it as ``md5``, newer ones in
+        ``checksum`` alongside the checksum algorithm.
+        """
+        if data_file.get("md5"):
+            return data_file["md5"]
+        checksum = data_file.get("checksum") or {}
+        if checksum.get("type", "").upper() == "MD5":
+            return checksum.get("value")
+        return None
+
+    def _download_file(self, url, download_path, params, md5=None):
+        """Download ``url`` to ``download_path``, retrying failed attempts.
+
+        Retries wait exponentially longer, starting at self.RETRY_BACKOFF
+        seconds.
+
+        :param str md5: Expected md5 of the file. If provided, it is compared
+            to the md5 of the downloaded data, computed while downloading.
+        :raises StorageException: if the last attempt fails.
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._download_file_once(url, download_path, params, md5)
+            except Exception as err:
+                LOGGER.warning("Error downloading %s: %s", url, err)
+                if attempt >= self.RETRY_ATTEMPTS:
+                    if os.path.exists(download_path):
+                        os.remove(download_path)
+                    if isinstance(err, StorageException):
+                        raise
+                    raise StorageException(
+                        _("Unable to download %(url)s: %(error)s")
+                        % {"url": url, "error": err})
+            delay = self.RETRY_BACKOFF * 2 ** attempt
+            attempt += 1
+            LOGGER.info("Retrying %s in %s seconds", url, delay)
+            time.sleep(delay)
+
+    def _download_file_once(self, url, download_path, params, md5=None):
+        LOGGER.debug("URL: %s, params: %s", url, params)
+        response = self.session.get(url, params=params, stream=True)
+        try:
+            if response.status_code != 200:
+                raise StorageException(
+                    _("Unable to download %(url)s: response %(status)s")
+                    % {"url": url, "status": response.status_code})
+            checksum = hashlib.md5()
+            with open(download_path, "wb") as f:
+                for chunk in response.iter_content(self.BUFFER_SIZE):
+                    checksum.update(chunk)
+                    f.write(chunk)
+        finally:
+            response.close()
+        if md5 and checksum.hexdigest() != md5.lower():
+            raise StorageException(
+                _("Checksum mismatch for %(path)s: expected %(expected)s, "
+                  "got %(actual)s")
+                % {"path": download_path, "expected": md5,
+                   "actual": checksum.hexdigest()})
+
     @staticmethod
     def extract_and_remove_bundle(dest_path, bundle_path):
         """Given a bundle from Dataverse, extract the files from the ZIP and
@@ -21,14 +21,13 @@ from django.utils.translation import ugettext_lazy as _
 
 # Third party dependencies, alphabetical
 from lxml import etree
-import requests
 import sword2
 import jsonfield
 
 # This project, alphabetical
 
 # This module, alphabetical
-from common import utils
+from common import http_client, utils
 from .location import Location
 
 LOGGER = logging.getLogger(__name__)
@@ -297,7 +296,8 @@ class DSpace(models.Model):
                 'Content-Length': str(os.path.getsize(upload_path)),
                 'Content-Disposition': "attachment; filename=%s" % urllib.quote(os.path.basename(upload_path)),
             }
-            requests.post(entry_receipt.edit_media, headers=headers, data=content, auth=(self.user, self.password))
+            session = http_client.get_session('dspace', entry_receipt.edit_media, auth=(self.user, self.password))
+            session.post(entry_receipt.edit_media, headers=headers, data=content)
 
         # Finalize deposit
         LOGGER.info('Complete deposit for %s', entry_receipt.edit)
@@ -353,11 +353,12 @@ class DSpace(models.Model):
         # Set bitstream permissions for bitstreams attached to handle
         parsed_url = urlparse.urlparse(self.sd_iri)
         dspace_url = urlparse.urlunparse((parsed_url.scheme, parsed_url.netloc, '', '', '', ''))
+        session = http_client.get_session('dspace', dspace_url)
         # Log in to get DSpace REST API token
         url = dspace_url + '/rest/login'
         body = {'email': self.user, 'password': self.password}
         try:
-            response = requests.post(url, json=body)
+            response = session.post(url, json=body)
         except Exception:
             LOGGER.warning('Error logging in to DSpace REST API, aborting', exc_info=True)
             return
@@ -371,7 +372,7 @@ class DSpace(models.Model):
         }
         params = {'expand': 'bitstreams'}
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = session.get(url, headers=headers, params=params)
         except Exception:
             LOGGER.warning('Error fetching bitstream information for handle %s', handle, exc_info=True)
         LOGGER.debug('REST API handle mapping %s %s', response.status_code, response)
@@ -395,7 +396,7 @@ class DSpace(models.Model):
                 continue
             LOGGER.debug('Posting bitstream body %s', body)
             try:
-                response = requests.put(url, headers=headers, json=body)
+                response = session.put(url, headers=headers, json=body)
             except Exception:
                 LOGGER.warning('Error posting bitstream body', exc_info=True)
                 continue
@@ -404,7 +405,7 @@ class DSpace(models.Model):
         # Logout from DSpace API
         url = dspace_url + '/rest/logout'
         try:
-            requests.post(url, headers=headers)
+            session.post(url, headers=headers)
         except Exception:
             LOGGER.info('Error logging out of DSpace REST API', exc_info=True)
         return
@@ -26,7 +26,7 @@ from agentarchives import archivesspace
 from agentarchives.archivesspace.client import CommunicationError
 
 # This module, alphabetical
-from common import utils
+from common import http_client, utils
 from .location import Location
 
 LOGGER = logging.getLogger(__name__)
@@ -299,11 +299,12 @@ class DSpaceREST(models.Model):
                 netloc='{}:{}'.format(self.ds_rest_url.netloc, DFLT_DS_PORT))
 
     def _post(self, url, data=None, cookies=None, headers=HEADERS):
-        return requests.post(url,
-                             cookies=cookies,
-                             data=data,
-                             headers=headers,
-                             verify=self.verify_ssl)
+        session = http_client.get_session('dspace_rest', url)
+        return session.post(url,
+                            cookies=cookies,
+                            data=data,
+                            headers=headers,
+                            verify=self.verify_ssl)
 
     def _create_dspace_record(self, metadata, ds_sessionid, ds_collection):
         # Structure necessary to create DSpace record
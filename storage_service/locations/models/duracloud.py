@@ -1,21 +1,23 @@
 from __future__ import absolute_import
 # stdlib, alphabetical
+import bisect
+from concurrent import futures
+import hashlib
 import logging
 from lxml import etree
 import os
 import re
-import shutil
+import threading
+import time
 import urllib
 
 # Core Django, alphabetical
+from django.conf import settings
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
-# Third party dependencies, alphabetical
-import requests
-
 # This project, alphabetical
-from common import utils
+from common import browse, http_client, throttle, utils
 
 # This module, alphabetical
 from . import StorageException
@@ -37,6 +39,9 @@ class Duracloud(models.Model):
         verbose_name = _("DuraCloud")
         app_label = 'locations'
 
+    # Browse lists one page at a time (see Space.browse)
+    PAGINATED_BROWSE = True
+
     ALLOWED_LOCATION_PURPOSE = [
         Location.AIP_RECOVERY,
         Location.AIP_STORAGE,
@@ -47,73 +52,106 @@ class Duracloud(models.Model):
 
     MANIFEST_SUFFIX = '.dura-manifest'
     CHUNK_SIZE = 1 * 1024 * 1024 * 1024  # 1 GB
+    BUFFER_SIZE = 1 * 1024 * 1024  # 1 MB
+    # Failed requests are retried after RETRY_BACKOFF seconds, doubling the
+    # wait after each attempt
+    RETRY_ATTEMPTS = 3
+    RETRY_BACKOFF = 1
 
     def __init__(self, *args, **kwargs):
         super(Duracloud, self).__init__(*args, **kwargs)
         self._session = None
+        self._limiter = None
 
     @property
     def session(self):
         if self._session is None:
-            self._session = requests.Session()
-            self._session.auth = (self.user, self.password)
+            # Keep one connection per worker open
+            self._session = http_client.get_session(
+                'duracloud', self.duraspace_url, auth=(self.user, self.password),
+                pool_size=settings.DURACLOUD_CONCURRENCY)
         return self._session
 
+    @property
+    def limiter(self):
+        """ Bandwidth limits of the space (see common.throttle). """
+        if self._limiter is None:
+            self._limiter = self.space.limiter
+        return self._limiter
+
     @property
     def duraspace_url(self):
         return 'https://' + self.host + '/durastore/' + self.duraspace + '/'
 
-    def _get_files_list(self, prefix, show_split_files=True):
+    def _get_files_list(self, prefix, show_split_files=True, use_cache=True):
         """
         Generator function to return the full path of all files starting with prefix.
 
         :param prefix: All paths returned will start with prefix
         :param bool show_split_files: If True, will show files ending with .dura-chunk-#### and .dura-manifest. If False, will show the original file name (everything before .dura-manifest)
+        :param bool use_cache: If False, always list the files from DuraCloud
+            instead of using a recent listing from LISTING_CACHE.
         :returns: Iterator of paths
         """
-        params = {'prefix': prefix}
-        LOGGER.debug('URL: %s, params: %s', self.duraspace_url, params)
-        response = self.session.get(self.duraspace_url, params=params)
-        LOGGER.debug('Response: %s', response)
-        if response.status_code != 200:
-            LOGGER.warning('%s: Response: %s', response, response.text)
-            raise StorageException(_('Unable to get list of files in %(prefix)s') % {'prefix': prefix})
-        # Response is XML in the form:
-        # <space id="self.durastore">
-        #   <item>path</item>
-        #   <item>path</item>
-        # </space>
-        root = etree.fromstring(response.content)
-        paths = [p.text for p in root]
-        LOGGER.debug('Paths first 10: %s', paths[:10])
-        LOGGER.debug('Paths last 10: %s', paths[-10:])
+        prefix = utils.coerce_str(prefix)
+        ttl = settings.DURACLOUD_LISTING_CACHE_TTL
+        use_cache = use_cache and ttl > 0
+        paths = None
+        if use_cache:
+            paths = LISTING_CACHE.get(self.space_id, prefix)
+        if paths is None:
+            paths = self._list_files(prefix)
+            if use_cache:
+                paths = list(paths)
+                LISTING_CACHE.set(self.space_id, prefix, paths, ttl)
         durachunk_regex = r'.dura-chunk-\d{4}$'
         duramanifest_len = len(self.MANIFEST_SUFFIX)
-        while paths:
-            for p in paths:
-                if not show_split_files:
-                    # There is exactly one .dura-manifest for chunked files
-                    # Return the original filename when we find a manifest file
-                    if p.endswith(self.MANIFEST_SUFFIX):
-                        yield p[:-duramanifest_len]
-                        continue
-                    # File chunks skipped - manifest returns original filename
-                    if re.search(durachunk_regex, p):
-                        continue
-                yield utils.coerce_str(p)
-            params['marker'] = paths[-1]
+        for p in paths:
+            if not show_split_files:
+                # There is exactly one .dura-manifest for chunked files
+                # Return the original filename when we find a manifest file
+                if p.endswith(self.MANIFEST_SUFFIX):
+                    yield p[:-duramanifest_len]
+                    continue
+                # File chunks skipped - manifest returns original filename
+                if re.search(durachunk_regex, p):
+                    continue
+            yield p
+
+    def _list_files(self, prefix, marker=None):
+        """
+        Generator function to list all the paths starting with prefix in DuraCloud.
+
+        :param prefix: All paths returned will start with prefix
+        :param marker: If set, only list the paths after marker.
+        :returns: Iterator of paths, in the order returned by DuraCloud
+        """
+        params = {'prefix': prefix}
+        if marker:
+            params['marker'] = marker
+        while True:
             LOGGER.debug('URL: %s, params: %s', self.duraspace_url, params)
             response = self.session.get(self.duraspace_url, params=params)
             LOGGER.debug('Response: %s', response)
             if response.status_code != 200:
                 LOGGER.warning('%s: Response: %s', response, response.text)
                 raise StorageException(_('Unable to get list of files in %(prefix)s') % {'prefix': prefix})
+            # Response is XML in the form:
+            # <space id="self.durastore">
+            #   <item>path</item>
+            #   <item>path</item>
+            # </space>
             root = etree.fromstring(response.content)
-            paths = [p.text for p in root]
+            paths = [utils.coerce_str(p.text) for p in root]
             LOGGER.debug('Paths first 10: %s', paths[:10])
             LOGGER.debug('Paths last 10: %s', paths[-10:])
+            if not paths:
+                break
+            for p in paths:
+                yield p
+            params['marker'] = paths[-1]
 
-    def browse(self, path):
+    def browse(self, path, **options):
         """
         Returns information about the files and simulated-folders in Duracloud.
 
@@ -124,6 +162,11 @@ class Duracloud(models.Model):
         """
         if path and not path.endswith('/'):
             path += '/'
+        if options.get('order_by') == '-name':
+            # Files can only be listed in ascending order
+            return browse.paginate_results(self.browse(path), **options)
+        if options:
+            return self._browse_page(path, **options)
         entries = set()
         directories = set()
         properties = {}
@@ -144,6 +187,58 @@ class Duracloud(models.Model):
         directories = sorted(directories, key=lambda s: s.lower())  # Also converts to list
         return {'directories': directories, 'entries': entries, 'properties': properties}
 
+    def _browse_page(self, path, limit=None, cursor=None, name_prefix=None,
+                     order_by='name'):
+        """
+        Return one page of the entries of ``path`` in name order, listing the
+        files only until the page is full.
+
+        The cursor is the last file path of the previous page, relative to
+        path. It is the path stored in DuraCloud, e.g. the manifest of a
+        chunked file, so pages resume where the listing stopped.
+        """
+        path = utils.coerce_str(path)
+        prefix = path + utils.coerce_str(name_prefix or '')
+        marker = path + cursor if cursor else None
+        paths = None
+        if settings.DURACLOUD_LISTING_CACHE_TTL > 0:
+            paths = LISTING_CACHE.get(self.space_id, prefix)
+        if paths is None:
+            # Not cached, since only part of the listing may be read
+            paths = self._list_files(prefix, marker)
+        elif marker:
+            paths = paths[bisect.bisect_right(paths, marker):]
+        durachunk_regex = r'.dura-chunk-\d{4}$'
+        entries = []
+        directories = []
+        properties = {}
+        last = None
+        for p in paths:
+            # File chunks skipped - manifest counts as the original file
+            if re.search(durachunk_regex, p):
+                continue
+            relative_path = p[len(path):]
+            path_parts = relative_path.split('/', 1)
+            dirname = path_parts[0]
+            if len(path_parts) == 1 and dirname.endswith(self.MANIFEST_SUFFIX):
+                dirname = dirname[:-len(self.MANIFEST_SUFFIX)]
+            if not dirname:
+                continue
+            # The paths in an entry are listed one after the other
+            if not entries or entries[-1] != dirname:
+                if limit is not None and len(entries) == limit:
+                    return {'directories': directories, 'entries': entries,
+                            'properties': properties, 'next_cursor': last}
+                entries.append(dirname)
+            if len(path_parts) > 1:
+                if dirname not in properties:
+                    directories.append(dirname)
+                    properties[dirname] = {'object count': 0}
+                properties[dirname]['object count'] += 1
+            last = relative_path
+        return {'directories': directories, 'entries': entries,
+                'properties': properties, 'next_cursor': None}
+
     def delete_path(self, delete_path):
         # BUG If delete_path is a folder but provided without a trailing /, will delete a file with the same name.
         # Files
@@ -165,26 +260,38 @@ class Duracloud(models.Model):
                 LOGGER.debug('Chunks to delete: %s', to_delete)
             else:
                 # File cannot be found - this may be a folder
-                to_delete = self._get_files_list(delete_path, show_split_files=True)
+                to_delete = self._get_files_list(delete_path, show_split_files=True, use_cache=False)
             # Do not support globbing for delete - do not want to accidentally
             # delete something
             for d in to_delete:
                 url = self.duraspace_url + urllib.quote(d)
                 response = self.session.delete(url)
+                LISTING_CACHE.remove(self.space_id, d)
+        else:
+            LISTING_CACHE.remove(self.space_id, delete_path)
 
     def _download_file(self, url, download_path, expected_size=0, checksum=None):
         """
         Helper to download files from DuraCloud.
 
+        Chunked files are downloaded by up to settings.DURACLOUD_CONCURRENCY
+        workers, each writing its chunk at the right offset of a preallocated
+        file and verifying it against the checksum in the manifest. If
+        download_path already exists, e.g. from an interrupted download, the
+        chunks that match their checksum there are not downloaded again.
+
         :param url: URL to fetch the file from.
         :param download_path: Absolute path to store the downloaded file at.
         :return: True on success, False if file not found
         :raises: StorageException if response code not 200 or 404
         """
         LOGGER.debug('URL: %s', url)
-        response = self.session.get(url)
+        # Resolved here because the workers must not query the database
+        self.limiter
+        response = self.session.get(url, stream=True)
         LOGGER.debug('Response: %s', response)
         if response.status_code == 404:
+            response.close()
             # Check if chunked by looking for a .dura-manifest
             manifest_url = url + self.MANIFEST_SUFFIX
             LOGGER.debug('Manifest URL: %s', manifest_url)
@@ -198,27 +305,27 @@ class Duracloud(models.Model):
             root = etree.fromstring(response.content)
             expected_size = int(root.findtext('header/sourceContent/byteSize'))
             checksum = root.findtext('header/sourceContent/md5')
-            chunk_elements = [e for e in root.findall('chunks/chunk')]
-            # Download each chunk and append to original file
             self.space.create_local_directory(download_path)
-            LOGGER.debug('Writing to %s', download_path)
-            with open(download_path, 'wb') as output_f:
-                for e in chunk_elements:
+            resume = os.path.exists(download_path)
+            LOGGER.debug('Writing to %s (resume: %s)', download_path, resume)
+            # Preallocate the file so each chunk can be written at its offset
+            with open(download_path, 'r+b' if resume else 'wb') as f:
+                f.truncate(expected_size)
+            jobs = []
+            with futures.ThreadPoolExecutor(max_workers=settings.DURACLOUD_CONCURRENCY) as executor:
+                offset = 0
+                for e in root.findall('chunks/chunk'):
                     # Parse chunk element
                     chunk = e.attrib['chunkId']
                     size = int(e.findtext('byteSize'))
                     md5 = e.findtext('md5')
-                    # Download
                     chunk_url = self.duraspace_url + urllib.quote(chunk)
-                    LOGGER.debug('Chunk URL: %s', chunk_url)
-                    chunk_path = chunk_url.replace(url, download_path)
-                    LOGGER.debug('Chunk path: %s', chunk_path)
-                    self._download_file(chunk_url, chunk_path, size, md5)
-                    # Append to output
-                    with open(chunk_path, 'rb') as chunk_f:
-                        shutil.copyfileobj(chunk_f, output_f)
-                    # Delete chunk_path
-                    os.remove(chunk_path)
+                    LOGGER.debug('Chunk URL: %s, offset: %s', chunk_url, offset)
+                    jobs.append(executor.submit(
+                        throttle.inherit_priority(self._download_chunk), chunk_url, download_path,
+                        offset, size, md5, resume))
+                    offset += size
+                _wait_for_all(jobs)
         elif response.status_code != 200:
             LOGGER.warning('Response: %s when fetching %s', response, url)
             LOGGER.warning('Response text: %s', response.text)
@@ -227,21 +334,75 @@ class Duracloud(models.Model):
             self.space.create_local_directory(download_path)
             LOGGER.debug('Writing to %s', download_path)
             with open(download_path, 'wb') as f:
-                f.write(response.content)
+                for data in response.iter_content(self.BUFFER_SIZE):
+                    self.limiter.read.consume(len(data))
+                    f.write(data)
 
         # Verify file, if size or checksum is known
         if expected_size and os.path.getsize(download_path) != expected_size:
             raise StorageException(
-                _('File %(path)s does not match expected size of %(expected_size)s bytes, but was actually %(actual_size)s bytes'),
+                _('File %(path)s does not match expected size of %(expected_size)s bytes, but was actually %(actual_size)s bytes') %
                 {'path': download_path,
                  'expected_size': expected_size,
                  'actual_size': os.path.getsize(download_path)})
         calculated_checksum = utils.generate_checksum(download_path, 'md5')
         if checksum and checksum != calculated_checksum.hexdigest():
-            raise StorageException('File %s does not match expected checksum of %s, but was actually %s', download_path, checksum, calculated_checksum.hexdigest())
+            raise StorageException('File %s does not match expected checksum of %s, but was actually %s' % (download_path, checksum, calculated_checksum.hexdigest()))
 
         return True
 
+    def _download_chunk(self, url, download_path, offset, size, checksum, resume=False):
+        """
+        Download a chunk into ``download_path`` at ``offset``, and verify it.
+
+        :param url: URL to fetch the chunk from.
+        :param download_path: Absolute path of the file the chunk is part of.
+            It must exist and be at least offset + size bytes long.
+        :param int offset: Position of the first byte of the chunk in the file.
+        :param int size: Expected size of the chunk in bytes.
+        :param str checksum: Expected MD5 hex digest of the chunk.
+        :param bool resume: If True, skip the download if the chunk is already
+            in ``download_path``.
+        :returns: None
+        :raises: StorageException if the chunk cannot be fetched or does not
+            match its size or checksum.
+        """
+        if resume:
+            reader = _ChunkReader(download_path, offset, size)
+            try:
+                while reader.read(self.BUFFER_SIZE):
+                    pass
+            finally:
+                reader.close()
+            if reader.md5.hexdigest() == checksum:
+                LOGGER.info('%s already downloaded, skipping', url)
+                return
+
+        def fetch():
+            LOGGER.debug('GET URL: %s', url)
+            response = self.session.get(url, stream=True)
+            LOGGER.debug('Response: %s', response)
+            if response.status_code != 200:
+                LOGGER.warning('%s: Response: %s', response, response.text)
+                raise StorageException('Unable to fetch %s' % url)
+            md5 = hashlib.md5()
+            written = 0
+            with open(download_path, 'r+b') as f:
+                f.seek(offset)
+                for data in response.iter_content(self.BUFFER_SIZE):
+                    written += len(data)
+                    if written > size:
+                        break
+                    self.limiter.read.consume(len(data))
+                    md5.update(data)
+                    f.write(data)
+            if written != size or md5.hexdigest() != checksum:
+                raise StorageException(
+                    _('Chunk %(url)s does not match expected size of %(size)s bytes and checksum %(checksum)s') %
+                    {'url': url, 'size': size, 'checksum': checksum})
+
+        self._retry(fetch, url)
+
     def move_to_storage_service(self, src_path, dest_path, dest_space):
         """ Moves src_path to dest_space.staging_path/dest_path. """
         # Convert unicode strings to byte strings
@@ -267,27 +428,14 @@ class Duracloud(models.Model):
                 dest = entry.replace(src_path, dest_path, 1)
                 self._download_file(url, dest)
 
-    def _process_chunk(self, f, chunk_path):
-        bytes_read = 0
-        bytes_to_read = 1024 * 1024  # 1MB
-
-        with open(chunk_path, 'w') as fchunk:
-            while bytes_read < self.CHUNK_SIZE:
-                data = f.read(bytes_to_read)
-                fchunk.write(data)
-
-                length = len(data)
-
-                if length < bytes_to_read:
-                    raise StopIteration(_("End of file reached"))
-                else:
-                    bytes_read += length
-
     def _upload_file(self, url, upload_file, resume=False):
         """
         Upload a file of any size to Duracloud.
 
-        If the file is larger that self.CHUNK_SIZE, will chunk it and upload chunks and manifest.
+        If the file is larger that self.CHUNK_SIZE, will chunk it and upload
+        chunks and manifest. Chunks are read straight from ``upload_file`` by
+        up to settings.DURACLOUD_CONCURRENCY workers, and hashed as they are
+        uploaded, so no temporary chunk files are written.
 
         :param url: URL to upload the file to.
         :param upload_file: Absolute path to the file to upload.
@@ -295,9 +443,43 @@ class Duracloud(models.Model):
         :raises: StorageException if error storing file
         """
         LOGGER.debug('Upload %s to %s', upload_file, url)
+        # Resolved here because the workers must not query the database
+        self.limiter
         filesize = os.path.getsize(upload_file)
         if filesize > self.CHUNK_SIZE:
             LOGGER.debug('%s size (%s) larger than %s', upload_file, filesize, self.CHUNK_SIZE)
+            relative_path = urllib.unquote(url.replace(self.duraspace_url, '', 1))
+            LOGGER.debug('File name: %s', relative_path)
+            # If resume, check if chunks already exists
+            chunklist = set()
+            if resume:
+                chunklist = set(self._get_files_list(relative_path))
+                LOGGER.debug('Chunklist %s', chunklist)
+            # Create the session before the workers share it
+            self.session
+            chunks_info = []
+            with futures.ThreadPoolExecutor(max_workers=settings.DURACLOUD_CONCURRENCY) as executor:
+                for i, offset in enumerate(range(0, filesize, self.CHUNK_SIZE)):
+                    # Setup chunk info
+                    chunk_suffix = '.dura-chunk-' + str(i).zfill(4)
+                    chunk_url = url + chunk_suffix
+                    chunkid = relative_path + chunk_suffix
+                    length = min(self.CHUNK_SIZE, filesize - offset)
+                    LOGGER.debug('Chunk ID: %s, offset: %s, size: %s', chunkid, offset, length)
+                    # Check if chunk exists already
+                    upload = not (resume and chunkid in chunklist)
+                    if not upload:
+                        LOGGER.info('%s already in Duracloud, skipping upload', chunkid)
+                    future = executor.submit(
+                        throttle.inherit_priority(self._upload_chunk_range), chunk_url, upload_file,
+                        offset, length, upload)
+                    chunks_info.append((chunkid, length, future))
+                # The checksum of the whole file is calculated while the
+                # workers upload the chunks
+                checksum = utils.generate_checksum(upload_file, 'md5')
+                LOGGER.debug('Checksum for %s: %s', upload_file, checksum.hexdigest())
+                chunk_md5s = _wait_for_all([f for __, __, f in chunks_info])
+
             # Create manifest info for complete file.  Eg:
             # <header schemaVersion="0.2">
             #   <sourceContent contentId="chunked/chunked_image.jpg">
@@ -306,10 +488,6 @@ class Duracloud(models.Model):
             #     <md5>9497f70a1a17943ddfcbed567538900d</md5>
             #   </sourceContent>
             # </header>
-            relative_path = urllib.unquote(url.replace(self.duraspace_url, '', 1))
-            LOGGER.debug('File name: %s', relative_path)
-            checksum = utils.generate_checksum(upload_file, 'md5')
-            LOGGER.debug('Checksum for %s: %s', upload_file, checksum.hexdigest())
             root = etree.Element('{duracloud.org}chunksManifest', nsmap={'dur': 'duracloud.org'})
             header = etree.SubElement(root, 'header', schemaVersion="0.2")
             content = etree.SubElement(header, 'sourceContent', contentId=relative_path)
@@ -317,92 +495,131 @@ class Duracloud(models.Model):
             etree.SubElement(content, 'byteSize').text = str(filesize)
             etree.SubElement(content, 'md5').text = checksum.hexdigest()
             chunks = etree.SubElement(root, 'chunks')
-            # Split file into chunks
-            with open(upload_file, 'rb') as f:
-                # If resume, check if chunks already exists
-                if resume:
-                    chunklist = set(self._get_files_list(relative_path))
-                    LOGGER.debug('Chunklist %s', chunklist)
-                file_complete = False
-                i = 0
-                while not file_complete:
-                    # Setup chunk info
-                    chunk_suffix = '.dura-chunk-' + str(i).zfill(4)
-                    chunk_path = upload_file + chunk_suffix
-                    LOGGER.debug('Chunk path: %s', chunk_path)
-                    chunk_url = url + chunk_suffix
-                    LOGGER.debug('Chunk URL: %s', chunk_url)
-                    chunkid = relative_path + chunk_suffix
-                    LOGGER.debug('Chunk ID: %s', chunkid)
-                    try:
-                        self._process_chunk(f, chunk_path)
-                    except StopIteration:
-                        file_complete = True
-                    # Make chunk element
-                    # <chunk chunkId="chunked/chunked_image.jpg.dura-chunk-0000" index="0">
-                    #   <byteSize>2097152</byteSize>
-                    #   <md5>ddbb227beaac5a9dc34eb49608997abf</md5>
-                    # </chunk>
-                    checksum = utils.generate_checksum(chunk_path)
-                    chunk_e = etree.SubElement(chunks, 'chunk', chunkId=chunkid)
-                    etree.SubElement(chunk_e, 'byteSize').text = str(os.path.getsize(chunk_path))
-                    etree.SubElement(chunk_e, 'md5').text = checksum.hexdigest()
-                    # Upload chunk
-                    # Check if chunk exists already
-                    if resume and chunkid in chunklist:
-                        LOGGER.info('%s already in Duracloud, skipping upload', chunk_path)
-                    else:
-                        self._upload_chunk(chunk_url, chunk_path)
-                    # Delete chunk
-                    os.remove(chunk_path)
-                    i += 1
-            # Write .dura-manifest
-            manifest_path = upload_file + self.MANIFEST_SUFFIX
-            manifest_url = url + self.MANIFEST_SUFFIX
-            with open(manifest_path, 'w') as f:
-                f.write(etree.tostring(root, pretty_print=True, xml_declaration=True, encoding='UTF-8'))
+            for (chunkid, length, __), md5 in zip(chunks_info, chunk_md5s):
+                # Make chunk element
+                # <chunk chunkId="chunked/chunked_image.jpg.dura-chunk-0000" index="0">
+                #   <byteSize>2097152</byteSize>
+                #   <md5>ddbb227beaac5a9dc34eb49608997abf</md5>
+                # </chunk>
+                chunk_e = etree.SubElement(chunks, 'chunk', chunkId=chunkid)
+                etree.SubElement(chunk_e, 'byteSize').text = str(length)
+                etree.SubElement(chunk_e, 'md5').text = md5
             # Upload .dura-manifest
-            self._upload_chunk(manifest_url, manifest_path)
-            os.remove(manifest_path)
+            manifest = etree.tostring(root, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+            self._put(url + self.MANIFEST_SUFFIX, lambda: manifest, upload_file + self.MANIFEST_SUFFIX)
             # TODO what if .dura-manifest over chunksize?
+            LISTING_CACHE.add(self.space_id, [info[0] for info in chunks_info])
+            LISTING_CACHE.add(self.space_id, [relative_path + self.MANIFEST_SUFFIX])
         else:
             # Example URL: https://trial.duracloud.org/durastore/trial261//ts/test.txt
             self._upload_chunk(url, upload_file)
+            LISTING_CACHE.add(self.space_id, [urllib.unquote(url.replace(self.duraspace_url, '', 1))])
 
-    def _upload_chunk(self, url, upload_file, retry_attempts=3):
+    def _upload_chunk_range(self, url, upload_file, offset, length, upload=True):
+        """
+        Upload ``length`` bytes of ``upload_file`` starting at ``offset``.
+
+        :param url: URL to upload the chunk to.
+        :param upload_file: Absolute path to the file the chunk is part of.
+        :param int offset: Position of the first byte of the chunk.
+        :param int length: Size of the chunk in bytes.
+        :param bool upload: If False, only calculate the checksum of the chunk.
+        :returns: MD5 hex digest of the chunk
+        :raises: StorageException if error storing the chunk
+        """
+        def open_chunk():
+            return _ChunkReader(upload_file, offset, length)
+
+        if upload:
+            chunk = self._put(url, open_chunk, upload_file)
+        else:
+            chunk = open_chunk()
+            try:
+                while chunk.read(self.BUFFER_SIZE):
+                    pass
+            finally:
+                chunk.close()
+        return chunk.md5.hexdigest()
+
+    def _upload_chunk(self, url, upload_file, retry_attempts=None):
         """
         Upload a single file to Duracloud.
 
         The file size must be less than self.CHUNK_SIZE.
-        Call _upload_file_check_chunking if the file might be larger.
+        Call _upload_file if the file might be larger.
 
         :param url: URL to upload the file to.
         :param upload_file: Absolute path to the file to upload.
-        :param int retry_attempts: Number of retry attempts left.
+        :param int retry_attempts: Number of retry attempts, defaults to
+            self.RETRY_ATTEMPTS.
         :returns: None
         :raises: StorageException if error storing file
         """
-        try:
-            LOGGER.debug('PUT URL: %s', url)
-            with open(upload_file, 'rb') as f:
-                response = self.session.put(url, data=f)
-            LOGGER.debug('Response: %s', response)
-        except Exception:
-            LOGGER.exception('Error in PUT to %s', url)
-            if retry_attempts > 0:
-                LOGGER.info('Retrying %s', upload_file)
-                self._upload_chunk(url, upload_file, retry_attempts - 1)
+        self._put(url, lambda: open(upload_file, 'rb'), upload_file, retry_attempts)
+
+    def _put(self, url, open_data, name, retry_attempts=None):
+        """
+        PUT the data returned by ``open_data`` to ``url``, retrying on failure.
+
+        :param url: URL to upload the data to.
+        :param open_data: Callable returning the request body. It is called
+            again for each attempt, so file-like bodies are read from the start.
+        :param name: Name of what is being uploaded, for error messages.
+        :param int retry_attempts: Number of retry attempts, defaults to
+            self.RETRY_ATTEMPTS.
+        :returns: The body of the successful request.
+        :raises: StorageException if error storing the data
+        """
+        def put():
+            data = open_data()
+            if hasattr(data, 'read'):
+                data = throttle.ThrottledReader(
+                    data, self.limiter.write.consumer())
             else:
-                raise
-        else:
+                self.limiter.write.consume(len(data))
+            try:
+                LOGGER.debug('PUT URL: %s', url)
+                response = self.session.put(url, data=data)
+                LOGGER.debug('Response: %s', response)
+            finally:
+                if hasattr(data, 'close'):
+                    data.close()
             if response.status_code != 201:
                 LOGGER.warning('%s: Response: %s', response, response.text)
-                if retry_attempts > 0:
-                    LOGGER.info('Retrying %s', upload_file)
-                    self._upload_chunk(url, upload_file, retry_attempts - 1)
-                else:
-                    raise StorageException(
-                        _('Unable to store %(filename)s') % {'filename': upload_file})
+                raise StorageException(
+                    _('Unable to store %(filename)s') % {'filename': name})
+            return data
+
+        return self._retry(put, name, retry_attempts)
+
+    def _retry(self, func, name, retry_attempts=None):
+        """
+        Call ``func`` until it does not raise, at most 1 + retry_attempts times.
+
+        Retries wait exponentially longer, starting at self.RETRY_BACKOFF
+        seconds.
+
+        :param func: Callable to call without arguments.
+        :param name: Name of what is being transferred, for logging.
+        :param int retry_attempts: Number of retry attempts, defaults to
+            self.RETRY_ATTEMPTS.
+        :returns: The return value of ``func``.
+        :raises: The exception raised by ``func`` on the last attempt.
+        """
+        if retry_attempts is None:
+            retry_attempts = self.RETRY_ATTEMPTS
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception:
+                LOGGER.exception('Error transferring %s', name)
+                if attempt >= retry_attempts:
+                    raise
+            delay = self.RETRY_BACKOFF * 2 ** attempt
+            attempt += 1
+            LOGGER.info('Retrying %s in %s seconds', name, delay)
+            time.sleep(delay)
 
     def move_from_storage_service(self, source_path, destination_path, package=None, resume=False):
         """ Moves self.staging_path/src_path to dest_path. """
@@ -411,6 +628,10 @@ class Duracloud(models.Model):
         if os.path.isdir(source_path):
             # Both source and destination paths should end with /
             destination_path = os.path.join(destination_path, '')
+            if resume:
+                # List what was already uploaded once, so the listing cache
+                # can answer the lookup for each file
+                list(self._get_files_list(destination_path))
             # Duracloud does not accept folders, so upload each file individually
             for path, dirs, files in os.walk(source_path):
                 for basename in files:
@@ -425,3 +646,118 @@ class Duracloud(models.Model):
             raise StorageException(_('%(path)s does not exist.') % {'path': source_path})
         else:
             raise StorageException(_('%(path)s is not a file or directory.') % {'path': source_path})
+
+
+class _ListingCache(object):
+    """
+    In-process index of the paths listed in DuraCloud spaces, with a TTL.
+
+    Listings are stored per (space, prefix), sorted, so that the paths under
+    any longer prefix can be answered from them as well. Uploads and deletes
+    done by the storage service update the listings that cover them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listings = {}  # (space_id, prefix): (expiry time, sorted paths)
+
+    def get(self, space_id, prefix):
+        """Return the cached paths starting with prefix, or None if unknown."""
+        now = time.time()
+        with self._lock:
+            for (cached_space_id, cached_prefix), (expiry, paths) in self._listings.items():
+                if cached_space_id != space_id or expiry < now or not prefix.startswith(cached_prefix):
+                    continue
+                start = bisect.bisect_left(paths, prefix)
+                end = start
+                while end < len(paths) and paths[end].startswith(prefix):
+                    end += 1
+                return paths[start:end]
+        return None
+
+    def set(self, space_id, prefix, paths, ttl):
+        now = time.time()
+        with self._lock:
+            # Drop expired listings so they do not accumulate
+            for key in list(self._listings):
+                if self._listings[key][0] < now:
+                    del self._listings[key]
+            self._listings[(space_id, prefix)] = (now + ttl, sorted(paths))
+
+    def add(self, space_id, paths):
+        """Add newly stored paths to the listings covering them."""
+        with self._lock:
+            for (cached_space_id, cached_prefix), (expiry, listing) in self._listings.items():
+                if cached_space_id != space_id:
+                    continue
+                for path in paths:
+                    path = utils.coerce_str(path)
+                    if not path.startswith(cached_prefix):
+                        continue
+                    i = bisect.bisect_left(listing, path)
+                    if i == len(listing) or listing[i] != path:
+                        listing.insert(i, path)
+
+    def remove(self, space_id, path):
+        """Remove a deleted path from the listings covering it."""
+        path = utils.coerce_str(path)
+        with self._lock:
+            for (cached_space_id, cached_prefix), (expiry, listing) in self._listings.items():
+                if cached_space_id != space_id or not path.startswith(cached_prefix):
+                    continue
+                i = bisect.bisect_left(listing, path)
+                if i < len(listing) and listing[i] == path:
+                    del listing[i]
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+
+
+LISTING_CACHE = _ListingCache()
+
+
+class _ChunkReader(object):
+    """
+    Read-only, file-like view of ``length`` bytes of ``path`` from ``offset``.
+
+    The MD5 of the data is calculated as it is read, so that a chunk can be
+    hashed and uploaded in one pass.
+    """
+
+    def __init__(self, path, offset, length):
+        self._file = open(path, 'rb')
+        self._file.seek(offset)
+        self._remaining = length
+        self.length = length
+        self.md5 = hashlib.md5()
+
+    def __len__(self):
+        # Used by requests to set the Content-Length
+        return self.length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        self.md5.update(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _wait_for_all(fs):
+    """
+    Return the results of the futures in ``fs``, in order.
+
+    If one of them fails, the ones that have not started are cancelled and
+    the exception is raised.
+    """
+    try:
+        return [f.result() for f in fs]
+    except Exception:
+        for f in fs:
+            f.cancel()
+        raise
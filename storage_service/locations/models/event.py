@@ -1,24 +1,42 @@
 # stdlib, alphabetical
+import collections
+import logging
+import time
 
 # Core Django, alphabetical
 from django.conf import settings
-from django.db import models
+from django.db import connections, models
 from django.utils.translation import ugettext_lazy as _
 
 # Third party dependencies, alphabetical
+from concurrent import futures
 from django_extensions.db.fields import UUIDField
 import requests
 
 # This project, alphabetical
+from common import http_client
 
 # This module, alphabetical
 from . import StorageException
 
-__all__ = ('Event', 'Callback', 'File', 'CallbackError')
+__all__ = ('Event', 'Callback', 'File', 'CallbackError',
+           'send_post_store_callbacks')
+
+LOGGER = logging.getLogger(__name__)
+
+# Maximum number of checksums looked up per query, below the limit of 999
+# query parameters of older SQLite versions.
+CHECKSUMS_PER_QUERY = 500
 
 
 class CallbackError(StorageException):
-    pass
+    """ The callback failed. If retryable, because the connection to the
+    server failed, so the request was not processed and executing it again
+    may succeed. """
+
+    def __init__(self, message, retryable=False):
+        super(CallbackError, self).__init__(message)
+        self.retryable = retryable
 
 
 class Event(models.Model):
@@ -116,19 +134,59 @@ class Callback(models.Model):
 
         If the response from the server did not match the expected
         status code, raises a a CallbackError with the body of the
-        response; otherwise, returns None.
+        response; otherwise, returns None. Connection errors are marked
+        retryable.
         """
         if not url:
             url = self.uri
 
+        session = http_client.get_session(
+            'callback', url, pool_size=settings.CALLBACK_CONCURRENCY)
         try:
-            response = getattr(requests, self.method)(url)
+            response = session.request(self.method.upper(), url)
         except requests.exceptions.ConnectionError as e:
+            raise CallbackError(str(e), retryable=True)
+        except requests.exceptions.RequestException as e:
             raise CallbackError(str(e))
 
         if not response.status_code == self.expected_status:
             raise CallbackError(response.text)
 
+    def execute_with_retries(self, url=None):
+        """
+        Execute the callback like execute, retrying it with backoff if the
+        connection to the server fails.
+
+        The session already retries the idempotent methods, on server errors
+        too, so only the others are retried here. They are not retried after
+        a read timeout or a server error, since the server may have processed
+        the request.
+        """
+        attempts = settings.HTTP_MAX_RETRIES + 1
+        if self.method.upper() in http_client.RETRY_METHODS:
+            attempts = 1
+        for attempt in range(attempts):
+            try:
+                return self.execute(url)
+            except CallbackError as e:
+                if not e.retryable or attempt == attempts - 1:
+                    raise
+                LOGGER.info('Retrying callback %s after error: %s', url, e)
+                time.sleep(settings.HTTP_RETRY_BACKOFF * 2 ** attempt)
+
+
+class FileQuerySet(models.QuerySet):
+    def name_startswith(self, prefix):
+        """ Return the files whose name starts with prefix.
+
+        Uses the index on name (see migration 0026_file_indexes). MySQL
+        cannot use it for the case sensitive LIKE BINARY of startswith, so
+        the files are also filtered with a case insensitive LIKE there. """
+        files = self.filter(name__startswith=prefix)
+        if connections[self.db].vendor == 'mysql':
+            files = files.filter(name__istartswith=prefix)
+        return files
+
 
 class File(models.Model):
     uuid = UUIDField(editable=False, unique=True, version=4,
@@ -149,3 +207,64 @@ class File(models.Model):
     class Meta:
         verbose_name = _("File")
         app_label = 'locations'
+
+    objects = FileQuerySet.as_manager()
+
+
+def send_post_store_callbacks(callbacks, checksums, progress=None):
+    """
+    Execute callbacks for each file with one of checksums that is not stored
+    yet, and mark stored the files for which a callback succeeded.
+
+    Files are looked up CHECKSUMS_PER_QUERY checksums at a time. Their
+    callbacks are executed by a pool of settings.CALLBACK_CONCURRENCY
+    threads, which do not use the database, and the files of each batch are
+    marked stored with one update.
+
+    :param callbacks: Callbacks to execute; '<source_id>' in their URI is
+        replaced by the source_id of the file.
+    :param checksums: Checksums of the files, e.g. from a bag manifest.
+    :param progress: Optional function called after each batch with the
+        number of checksums processed and their total.
+    :return: Number of callback executions that failed.
+    """
+    callbacks = list(callbacks)
+    checksums = sorted(set(checksums))
+
+    def send(source_id):
+        """ Return the number of callbacks that failed for the file. """
+        failures = 0
+        for callback in callbacks:
+            try:
+                callback.execute_with_retries(
+                    callback.uri.replace('<source_id>', source_id))
+            except CallbackError as e:
+                LOGGER.warning('Callback %s failed for file %s: %s',
+                               callback.uri, source_id, e)
+                failures += 1
+        return failures
+
+    failures = 0
+    with futures.ThreadPoolExecutor(max_workers=settings.CALLBACK_CONCURRENCY) as executor:
+        for start in range(0, len(checksums), CHECKSUMS_PER_QUERY):
+            files = list(File.objects.filter(
+                checksum__in=checksums[start:start + CHECKSUMS_PER_QUERY],
+                stored=False,
+            ).values_list('id', 'checksum', 'source_id'))
+            counts = collections.Counter(checksum for __, checksum, __ in files)
+            for checksum, count in counts.items():
+                if count > 1:
+                    LOGGER.warning("Multiple File entries found for sha512 %s", checksum)
+
+            stored = []
+            results = executor.map(send, [source_id for __, __, source_id in files])
+            for (file_id, __, __), file_failures in zip(files, results):
+                failures += file_failures
+                if file_failures < len(callbacks):
+                    stored.append(file_id)
+            File.objects.filter(id__in=stored).update(stored=True)
+
+            if progress is not None:
+                progress(min(start + CHECKSUMS_PER_QUERY, len(checksums)),
+                         len(checksums))
+    return failures
@@ -22,6 +22,8 @@ class FixityLog(models.Model):
     class Meta:
         verbose_name = _("Fixity Log")
         app_label = 'locations'
+        # Backs the history of a package, ordered by time
+        index_together = (('package', 'datetime_reported'),)
 
     def __unicode__(self):
         return _('Fixity check of %(package)s') % {'package': self.package}
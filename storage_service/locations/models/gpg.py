@@ -1,17 +1,18 @@
 from __future__ import absolute_import
 # stdlib, alphabetical
 import datetime
+import errno
 import logging
 import os
 import shutil
 import subprocess
-import tarfile
+import tempfile
+import threading
 from uuid import uuid4
 
 from metsrw.plugins import premisrw
 
 # Core Django, alphabetical
-from django.conf import settings
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.utils import six
@@ -105,8 +106,8 @@ class GPG(models.Model):
             _gpg_decrypt(dst_path)
         # When the source path does NOT exist, we are copying a single file or
         # directory from within an encrypted package, e.g., during SIP arrange.
-        # Here we must decrypt, copy, and then re-encrypt. This seems like it
-        # would be terribly inefficient when dealing with large transfers.
+        # Here we stream the decrypted package through tar and extract only
+        # the requested path, leaving the encrypted package untouched.
         else:
             encr_path = _get_encrypted_path(src_path)
             if not encr_path:
@@ -114,20 +115,21 @@ class GPG(models.Model):
                     'Unable to move %(src_path)s; this file/dir does not exist;'
                     ' nor is it in an encrypted directory.' %
                     {'src_path': src_path}))
-            _gpg_decrypt(encr_path)
+            extract_dir = tempfile.mkdtemp(
+                dir=os.path.dirname(dst_path.rstrip('/')))
             try:
-                if os.path.exists(src_path):
-                    self.space.move_rsync(src_path, dst_path)
-                else:
+                member_path = _gpg_extract_member(
+                    encr_path, src_path, extract_dir)
+                if member_path is None:
                     raise GPGException(_(
                         'Unable to move %(src_path)s; this file/dir does not'
                         ' exist, not even in encrypted directory'
                         ' %(encr_path)s.' %
                         {'src_path': src_path, 'encr_path': encr_path}))
+                self.space.move_rsync(member_path, dst_path,
+                                      try_mv_local=True)
             finally:
-                # Re-encrypt the decrypted package at source after copy, no
-                # matter what happens.
-                _gpg_encrypt(encr_path, _encr_path2key_fingerprint(encr_path))
+                shutil.rmtree(extract_dir)
 
     def move_from_storage_service(self, src_path, dst_path, package=None):
         """Move AIP in SS at path ``src_path`` to GPG space at ``dst_path``,
@@ -229,32 +231,59 @@ def _gpg_encrypt(path, key_fingerprint):
     encrypted file as well as a Python-GnuPG encryption result object with
     ``ok`` and ``status`` attributes, see
     https://pythonhosted.org/python-gnupg/.
+
+    A directory is streamed through ``tar`` into GnuPG, so the encrypted file
+    is the only copy of the package written to disk. The unencrypted package
+    is only deleted once encryption has succeeded.
     """
-    tar_created = False
-    if os.path.isdir(path):
-        _create_tar(path)
-        tar_created = True
-    encr_path, result = gpgutils.gpg_encrypt_file(path, key_fingerprint)
-    if os.path.isfile(encr_path) and result.ok:
+    path = path.rstrip('/')
+    is_dir = os.path.isdir(path)
+    if is_dir:
+        encr_path, result = _gpg_encrypt_dir(path, key_fingerprint)
+    else:
+        encr_path, result = gpgutils.gpg_encrypt_file(path, key_fingerprint)
+    if result.ok and os.path.isfile(encr_path):
         LOGGER.info('Successfully encrypted %s at %s', path, encr_path)
-        os.remove(path)
+        if is_dir:
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
         os.rename(encr_path, path)
         return path, result
     else:
-        if tar_created:
-            _extract_tar(path)
+        if os.path.isfile(encr_path):
+            os.remove(encr_path)
         fail_msg = _('An error occured when attempting to encrypt'
                      ' %(path)s' % {'path': path})
         LOGGER.error(fail_msg)
         raise GPGException(fail_msg)
 
 
-def _db_engine():
-    if 'sqlite' in settings.DATABASES['default']['ENGINE']:
-        return 'sqlite'
-    if 'mysql' in settings.DATABASES['default']['ENGINE']:
-        return 'mysql'
-    return 'other'
+def _gpg_encrypt_dir(path, key_fingerprint):
+    """Encrypt the tar stream of the directory at ``path`` to ``path``.gpg.
+    Returns the path to the encrypted file and the Python-GnuPG encryption
+    result object, which is not ok if ``tar`` failed.
+    """
+    encr_path = path + '.gpg'
+    cmd = ['tar', '-C', os.path.dirname(path), '-cf', '-',
+           os.path.basename(path)]
+    LOGGER.info('Encrypting archive of %s at %s', path, encr_path)
+    try:
+        tar = subprocess.Popen(cmd, stdout=subprocess.PIPE, close_fds=True)
+    except OSError:
+        LOGGER.exception('Unable to run %s', cmd)
+        raise GPGException(_('Failed to create a tarfile for dir at'
+                             ' %(path)s' % {'path': path}))
+    try:
+        result = gpgutils.gpg_encrypt_stream(
+            tar.stdout, key_fingerprint, encr_path)
+    finally:
+        tar.stdout.close()
+        returncode = tar.wait()
+    if returncode != 0:
+        LOGGER.error('%s exited with status %s', cmd, returncode)
+        result.ok = False
+    return encr_path, result
 
 
 def _encr_path2key_fingerprint(encr_path):
@@ -262,21 +291,43 @@ def _encr_path2key_fingerprint(encr_path):
     used to encrypt the package. Since it was already encrypted, its
     model must have a GPG fingerprint.
     """
-    sql = ('SELECT * FROM locations_package WHERE %s LIKE CONCAT(\'%%\','
-           ' current_path, \'%%\')')
-    if _db_engine() == 'sqlite':
-        sql = ('SELECT * FROM locations_package WHERE %s LIKE "%" ||'
-               ' current_path || "%"')
-    matches = list(Package.objects.raw(sql, [encr_path]))
+    candidates = sorted(_encr_path_candidates(encr_path))
+    matches = []
+    for start in range(0, len(candidates), CANDIDATES_PER_QUERY):
+        matches.extend(Package.objects.filter(
+            current_path__in=candidates[start:start + CANDIDATES_PER_QUERY]
+        ).values_list('pk', 'encryption_key_fingerprint'))
     try:
-        return matches[0].encryption_key_fingerprint
-    except IndexError:
+        return min(matches)[1]
+    except ValueError:
         fail_msg = 'Unable to find package matching encrypted path {}'.format(
             encr_path)
         LOGGER.error(fail_msg)
         raise GPGException(fail_msg)
 
 
+# Maximum number of values in the IN clause of a query, below the limit of
+# 999 query parameters of older SQLite versions.
+CANDIDATES_PER_QUERY = 500
+
+
+def _encr_path_candidates(encr_path):
+    """Return the package paths that ``encr_path`` can be in, i.e., all the
+    sequences of whole path components in ``encr_path``, with and without a
+    trailing slash. E.g., for 'a/b' they are 'a', 'a/', 'b', 'b/', 'a/b' and
+    'a/b/'. Querying them uses the index on ``Package.current_path``.
+    """
+    components = [component for component in encr_path.split('/') if component]
+    candidates = set()
+    for end in range(1, len(components) + 1):
+        for start in range(end):
+            candidate = '/'.join(components[start:end])
+            candidates.update((candidate, candidate + '/'))
+            if start == 0 and encr_path.startswith('/'):
+                candidates.update(('/' + candidate, '/' + candidate + '/'))
+    return candidates
+
+
 # This replaces non-unicode characters with a replacement character,
 # and is primarily used for arbitrary strings (e.g. filenames, paths)
 # that might not be valid unicode to begin with.
@@ -287,65 +338,6 @@ def escape(string):
     return string
 
 
-def _abort_create_tar(path, tarpath):
-    fail_msg = _(
-        'Failed to create a tarfile at %(tarpath)s for dir at %(path)s' %
-        {'tarpath': tarpath, 'path': path})
-    LOGGER.error(fail_msg)
-    raise GPGException(fail_msg)
-
-
-def _create_tar(path):
-    """Create a tarfile from the directory at ``path`` and overwrite ``path``
-    with that tarfile.
-    """
-    path = path.rstrip('/')
-    tarpath = '{}.tar'.format(path)
-    changedir = os.path.dirname(tarpath)
-    source = os.path.basename(path)
-    cmd = ['tar', '-C', changedir, '-cf', tarpath, source]
-    LOGGER.info('creating archive of %s at %s, relative to %s',
-                source, tarpath, changedir)
-    try:
-        subprocess.check_output(cmd)
-    except (OSError, subprocess.CalledProcessError):
-        _abort_create_tar(path, tarpath)
-    if os.path.isfile(tarpath) and tarfile.is_tarfile(tarpath):
-        shutil.rmtree(path)
-        os.rename(tarpath, path)
-    else:
-        _abort_create_tar(path, tarpath)
-    try:
-        assert tarfile.is_tarfile(path)
-        assert not os.path.exists(tarpath)
-    except AssertionError:
-        _abort_create_tar(path, tarpath)
-
-
-def _abort_extract_tar(tarpath, newtarpath):
-    fail_msg = _('Failed to extract %(tarpath)s to a directory at the same'
-                 ' location.' % {'tarpath': tarpath})
-    LOGGER.error(fail_msg)
-    os.rename(newtarpath, tarpath)
-    raise GPGException(fail_msg)
-
-
-def _extract_tar(tarpath):
-    """Extract tarfile at ``path`` to a directory at ``path``."""
-    newtarpath = '{}.tar'.format(tarpath)
-    os.rename(tarpath, newtarpath)
-    changedir = os.path.dirname(newtarpath)
-    cmd = ['tar', '-xf', newtarpath, '-C', changedir]
-    try:
-        subprocess.check_output(cmd)
-    except (OSError, subprocess.CalledProcessError):
-        _abort_extract_tar(tarpath, newtarpath)
-    if os.path.isdir(tarpath):
-        os.remove(newtarpath)
-    else:
-        _abort_extract_tar(tarpath, newtarpath)
-
-
 def _parse_gpg_version(raw_gpg_version):
     return raw_gpg_version.splitlines()[0].split()[-1]
 
@@ -394,6 +386,10 @@ def create_encryption_event(encr_result, key_fingerprint):
 def _gpg_decrypt(path):
     """Use GnuPG to decrypt the file at ``path`` and then delete the
     encrypted file.
+
+    A file without an extension is one that we created in this space using an
+    uncompressed AIP as input, i.e., an encrypted tarfile. Those are extracted
+    while they are decrypted, without writing the decrypted tarfile to disk.
     """
     if not os.path.isfile(path):
         fail_msg = _('Cannot decrypt file at %(path)s; no such file.' %
@@ -401,24 +397,229 @@ def _gpg_decrypt(path):
         LOGGER.error(fail_msg)
         raise GPGException(fail_msg)
     decr_path = path + '.decrypted'
-    decr_result = gpgutils.gpg_decrypt_file(path, decr_path)
-    if decr_result.ok and os.path.isfile(decr_path):
+    if os.path.splitext(path)[1] == '':
+        writer = _PlaintextWriter(decr_path)
+        decr_result = _gpg_decrypt_stream(path, writer)
+        is_tar = writer.is_tar
+    else:
+        decr_result = gpgutils.gpg_decrypt_file(path, decr_path)
+        is_tar = False
+    if decr_result.ok and os.path.exists(decr_path):
         LOGGER.info('Successfully decrypted %s to %s.', path, decr_path)
         os.remove(path)
-        os.rename(decr_path, path)
+        if is_tar:
+            LOGGER.info('%s is a tarfile so we extracted it', path)
+            _move_extracted_dir(decr_path, path)
+        else:
+            os.rename(decr_path, path)
     else:
+        _remove_path(decr_path)
         fail_msg = _('Failed to decrypt %(path)s. Reason: %(reason)s' %
                      {'path': path, 'reason': decr_result.status})
         LOGGER.info(fail_msg)
         raise GPGException(fail_msg)
-    # A tarfile without an extension is one that we created in this space
-    # using an uncompressed AIP as input. We extract those here.
-    if tarfile.is_tarfile(path) and os.path.splitext(path)[1] == '':
-        LOGGER.info('%s is a tarfile so we are extracting it', path)
-        _extract_tar(path)
     return path
 
 
+def _gpg_decrypt_stream(path, consumer):
+    """Decrypt the file at ``path`` into a named pipe read by ``consumer``,
+    a ``_PlaintextConsumer`` thread, so that the decrypted data never hits the
+    disk. Returns the Python-GnuPG decryption result object, which is not ok
+    if ``consumer`` failed.
+    """
+    fifo_dir = tempfile.mkdtemp(dir=os.path.dirname(path))
+    fifo = os.path.join(fifo_dir, 'plaintext')
+    try:
+        os.mkfifo(fifo)
+        consumer.fifo = fifo
+        consumer.start()
+        try:
+            decr_result = gpgutils.gpg_decrypt_file(path, fifo)
+        finally:
+            # If GnuPG failed before opening the pipe, the consumer is still
+            # waiting for a writer: open and close the pipe until it gets an
+            # end of file. Opening fails while the consumer has not opened it.
+            consumer.join(0.1)
+            while consumer.is_alive():
+                try:
+                    os.close(os.open(fifo, os.O_WRONLY | os.O_NONBLOCK))
+                except OSError:
+                    pass
+                consumer.join(0.1)
+    finally:
+        shutil.rmtree(fifo_dir)
+    if consumer.error is not None:
+        LOGGER.error('Failed to process decrypted %s: %s', path,
+                     consumer.error)
+        decr_result.ok = False
+    return decr_result
+
+
+class _PlaintextConsumer(threading.Thread):
+    """Thread that reads the decrypted data written by GnuPG to the named pipe
+    ``fifo`` and hands it to ``consume``. Any exception is stored in
+    ``error``.
+    """
+
+    BUFFER_SIZE = 1024 * 1024  # 1 MB
+
+    def __init__(self):
+        super(_PlaintextConsumer, self).__init__()
+        self.daemon = True
+        self.fifo = None
+        self.error = None
+
+    def run(self):
+        try:
+            with open(self.fifo, 'rb') as stream:
+                self.consume(stream)
+        except Exception as err:
+            self.error = err
+
+    def consume(self, stream):
+        raise NotImplementedError
+
+    def _pipe_to(self, cmd, head, stream):
+        """Write ``head`` and then the rest of ``stream`` to the stdin of a
+        process running ``cmd``.
+        """
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, close_fds=True)
+        try:
+            process.stdin.write(head)
+            shutil.copyfileobj(stream, process.stdin, self.BUFFER_SIZE)
+        except IOError as err:
+            if err.errno != errno.EPIPE:
+                raise
+            # The process exited without reading all of its input. Read the
+            # rest so that GnuPG can finish, and rely on the exit status.
+            _drain(stream)
+        finally:
+            try:
+                process.stdin.close()
+            except IOError:
+                pass
+            returncode = process.wait()
+        if returncode != 0:
+            raise GPGException(_('%(cmd)s exited with status %(status)s' %
+                                 {'cmd': ' '.join(cmd), 'status': returncode}))
+
+
+class _PlaintextWriter(_PlaintextConsumer):
+    """Writes decrypted data to the file ``decr_path``, unless it is a
+    tarfile, which is extracted into the directory ``decr_path`` instead.
+    """
+
+    def __init__(self, decr_path):
+        super(_PlaintextWriter, self).__init__()
+        self.decr_path = decr_path
+        self.is_tar = False
+
+    def consume(self, stream):
+        head = _read_tar_header(stream)
+        self.is_tar = _is_tar_header(head)
+        if self.is_tar:
+            os.mkdir(self.decr_path)
+            self._pipe_to(['tar', '-xf', '-', '-C', self.decr_path],
+                          head, stream)
+        else:
+            with open(self.decr_path, 'wb') as f:
+                f.write(head)
+                shutil.copyfileobj(stream, f, self.BUFFER_SIZE)
+
+
+class _TarMemberExtractor(_PlaintextConsumer):
+    """Extracts the member ``member`` of a decrypted tarfile, and nothing
+    else, into the directory ``extract_path``.
+    """
+
+    def __init__(self, extract_path, member):
+        super(_TarMemberExtractor, self).__init__()
+        self.extract_path = extract_path
+        self.member = member
+
+    def consume(self, stream):
+        head = _read_tar_header(stream)
+        if not _is_tar_header(head):
+            _drain(stream)
+            raise GPGException(_('Decrypted data is not a tarfile'))
+        self._pipe_to(
+            ['tar', '-xf', '-', '-C', self.extract_path, self.member],
+            head, stream)
+
+
+def _gpg_extract_member(encr_path, path, extract_path):
+    """Extract ``path``, a file or directory inside the encrypted package at
+    ``encr_path``, into the directory ``extract_path``, without decrypting the
+    whole package to disk. Returns the path of the extracted file or
+    directory (with a trailing slash if ``path`` has one), or None if
+    ``path`` is not in the package.
+    """
+    relative_path = os.path.relpath(path, encr_path)
+    # Packages are tarred with their directory name as the top directory
+    member = os.path.join(os.path.basename(encr_path), relative_path)
+    extractor = _TarMemberExtractor(extract_path, member)
+    decr_result = _gpg_decrypt_stream(encr_path, extractor)
+    if extractor.error is None and not decr_result.ok:
+        fail_msg = _('Failed to decrypt %(path)s. Reason: %(reason)s' %
+                     {'path': encr_path, 'reason': decr_result.status})
+        LOGGER.info(fail_msg)
+        raise GPGException(fail_msg)
+    member_path = os.path.join(extract_path, member)
+    if not decr_result.ok or not os.path.lexists(member_path):
+        LOGGER.warning('Unable to extract %s from %s', member, encr_path)
+        return None
+    if path.endswith('/'):
+        member_path = os.path.join(member_path, '')
+    return member_path
+
+
+def _drain(stream):
+    """Read and discard the rest of ``stream``."""
+    while stream.read(_PlaintextConsumer.BUFFER_SIZE):
+        pass
+
+
+TAR_BLOCK_SIZE = 512
+
+
+def _read_tar_header(stream):
+    """Read the first tar block of ``stream``, or less at end of file."""
+    head = b''
+    while len(head) < TAR_BLOCK_SIZE:
+        data = stream.read(TAR_BLOCK_SIZE - len(head))
+        if not data:
+            break
+        head += data
+    return head
+
+
+def _is_tar_header(head):
+    """Return True if ``head`` is a POSIX or GNU tar header block."""
+    return len(head) == TAR_BLOCK_SIZE and head[257:262] == b'ustar'
+
+
+def _move_extracted_dir(extract_path, path):
+    """Move the package directory extracted into ``extract_path`` to ``path``
+    and remove ``extract_path``.
+    """
+    extracted = os.listdir(extract_path)
+    if len(extracted) != 1:
+        _remove_path(extract_path)
+        fail_msg = _('Failed to extract %(tarpath)s to a directory at the same'
+                     ' location.' % {'tarpath': path})
+        LOGGER.error(fail_msg)
+        raise GPGException(fail_msg)
+    os.rename(os.path.join(extract_path, extracted[0]), path)
+    os.rmdir(extract_path)
+
+
+def _remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
 def _get_encrypted_path(encr_path):
     """Attempt to return the existing file path that is ``encr_path`` or
     one of its ancestor paths. This is needed when we are asked to move a
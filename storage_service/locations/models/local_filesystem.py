@@ -38,7 +38,7 @@ class LocalFilesystem(models.Model):
         """ Moves src_path to dest_space.staging_path/dest_path. """
         # Archivematica expects the file to still be on disk even after stored
         self.space.create_local_directory(dest_path)
-        return self.space.move_rsync(src_path, dest_path)
+        return self.space.move_rsync(src_path, dest_path, staging=True)
 
     def move_from_storage_service(self, source_path, destination_path, package=None):
         """ Moves self.staging_path/src_path to dest_path. """
@@ -52,7 +52,7 @@ class NFS(models.Model):
     def move_to_storage_service(self, src_path, dest_path, dest_space):
         """ Moves src_path to dest_space.staging_path/dest_path. """
         self.space.create_local_directory(dest_path)
-        return self.space.move_rsync(src_path, dest_path)
+        return self.space.move_rsync(src_path, dest_path, staging=True)
 
     def post_move_to_storage_service(self, *args, **kwargs):
         # TODO delete original file?
@@ -14,7 +14,7 @@ from uuid import uuid4
 
 # Core Django, alphabetical
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
 
@@ -42,6 +42,9 @@ __all__ = ('Package', )
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of File rows inserted at a time when indexing a transfer
+FILE_BATCH_SIZE = 1000
+
 
 class Package(models.Model):
     """ A package stored in a specific location. """
@@ -83,7 +86,8 @@ class Package(models.Model):
         (FILE, _('Single File')),
         (DEPOSIT, _('FEDORA Deposit'))
     )
-    package_type = models.CharField(max_length=8, choices=PACKAGE_TYPE_CHOICES)
+    package_type = models.CharField(max_length=8, choices=PACKAGE_TYPE_CHOICES,
+                                    db_index=True)
     related_packages = models.ManyToManyField('self', related_name='related')
 
     DEFAULT_CHECKSUM_ALGORITHM = 'sha256'
@@ -108,13 +112,32 @@ class Package(models.Model):
         (FINALIZED, _("Deposit Finalized")),
     )
     status = models.CharField(
-        max_length=8, choices=STATUS_CHOICES, default=FAIL,
+        max_length=8, choices=STATUS_CHOICES, default=FAIL, db_index=True,
         help_text=_("Status of the package in the storage service."))
     # NOTE Do not put anything important here because you cannot easily query
     # JSONFields! Add a new column if you need to query it
     misc_attributes = jsonfield.JSONField(
         blank=True, null=True, default={},
         help_text=_('For storing flexible, often Space-specific, attributes'))
+    # Latest fixity check, copied from the FixityLog history by
+    # record_fixity_check so packages can be filtered and sorted by it.
+    # Only record_fixity_check writes them, see save
+    latest_fixity_check_datetime = models.DateTimeField(
+        null=True, blank=True, editable=False, db_index=True,
+        verbose_name=_('Latest fixity check'),
+        help_text=_("When the latest fixity check of this package was reported, if it was ever checked."))
+    latest_fixity_check_result = models.NullBooleanField(
+        editable=False, db_index=True,
+        verbose_name=_('Latest fixity check result'),
+        help_text=_("True if the latest fixity check succeeded, False if it failed, None if it was not run or the package was never checked."))
+    fixity_failure_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name=_('Fixity check failures'),
+        help_text=_("Number of fixity checks of this package that failed."))
+
+    FIXITY_CHECK_FIELDS = ('latest_fixity_check_datetime',
+                           'latest_fixity_check_result',
+                           'fixity_failure_count')
 
     # Temporary attributes to track path on locally accessible filesystem
     local_path = None
@@ -144,6 +167,22 @@ class Package(models.Model):
         )
         # return "File: {}".format(self.uuid)
 
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        """ Save package, except the latest fixity check fields.
+
+        The package may have been loaded before a fixity check was recorded,
+        so saving its copy of the fields would overwrite the check. """
+        if update_fields is None and not self._state.adding and \
+                not force_insert:
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key]
+        if update_fields is not None:
+            update_fields = [name for name in update_fields
+                             if name not in self.FIXITY_CHECK_FIELDS]
+        super(Package, self).save(force_insert, force_update, using,
+                                  update_fields)
+
     # Attributes
     @property
     def full_path(self):
@@ -190,21 +229,33 @@ class Package(models.Model):
                 message = _('%(path)s is neither a file nor a directory') % {'path': full_path}
             raise StorageException(message)
 
-    @property
-    def latest_fixity_check_datetime(self):
-        latest_check = self._latest_fixity_check()
-        return latest_check.datetime_reported if latest_check is not None else None
+    def record_fixity_check(self, success, message=None):
+        """
+        Log a fixity check of this package and make it the latest one.
 
-    @property
-    def latest_fixity_check_result(self):
-        latest_check = self._latest_fixity_check()
-        return latest_check.success if latest_check is not None else None
+        The FixityLog is created and the latest fixity check fields are
+        updated in one transaction, with the package row locked so that
+        concurrent checks of the same package are counted correctly.
 
-    def _latest_fixity_check(self):
-        try:
-            return FixityLog.objects.filter(package=self).order_by('-datetime_reported')[0]  # limit 1
-        except IndexError:
-            return None
+        :param success: True if the check succeeded, False if it failed,
+            None if it could not be run.
+        :param message: Error details, if any.
+        :returns: The FixityLog created.
+        """
+        with transaction.atomic():
+            package = Package.objects.select_for_update().get(pk=self.pk)
+            log = FixityLog.objects.create(
+                package=package, success=success, error_details=message)
+            self.latest_fixity_check_datetime = log.datetime_reported
+            self.latest_fixity_check_result = success
+            self.fixity_failure_count = package.fixity_failure_count
+            if success is False:
+                self.fixity_failure_count += 1
+            Package.objects.filter(pk=self.pk).update(
+                latest_fixity_check_datetime=self.latest_fixity_check_datetime,
+                latest_fixity_check_result=self.latest_fixity_check_result,
+                fixity_failure_count=self.fixity_failure_count)
+        return log
 
     def get_download_path(self, lockss_au_number=None):
         full_path = self.fetch_local_path()
@@ -491,7 +542,8 @@ class Package(models.Model):
         # event out of the result.
         replica_local_path = self.get_local_path()
         replica_checksum = utils.generate_checksum(
-            replica_local_path, master_checksum_algorithm).hexdigest()
+            replica_local_path, master_checksum_algorithm,
+            throttle=src_space.limiter.read.consume).hexdigest()
         checksum_report = _get_checksum_report(
             master_checksum, self.uuid, replica_checksum, replica_package.uuid,
             master_checksum_algorithm)
@@ -1507,59 +1559,93 @@ class Package(models.Model):
         if not os.path.isfile(mets_path):
             raise StorageException(_('No METS found at location: %(path)s') % {'path': mets_path})
 
-        doc = etree.parse(mets_path)
-
+        # The METS is parsed in one pass, dropping each element once it has
+        # been read, so the time and memory used grow linearly with the
+        # number of files. The processed structMap comes after the fileSec,
+        # so the files are filtered at the end.
         namespaces = {'m': utils.NSMAP['mets'],
                       'p': utils.NSMAP['premis']}
-        mets = doc.xpath('/m:mets', namespaces=namespaces)
-        if not mets:
-            raise StorageException(_("<mets> element not found in METS file!"))
-        else:
-            mets = mets[0]
-
-        try:
-            transfer_uuid = mets.attrib['OBJID']
-        except KeyError:
-            raise StorageException(_("<mets> element did not have an OBJID attribute!"))
+        mets_tag = '{' + utils.NSMAP['mets'] + '}'
+        href = '{' + utils.NSMAP['xlink'] + '}href'
+        cleanup_notes = etree.XPath('m:digiprovMD/m:mdWrap/m:xmlData/p:event/p:eventType[text()="name cleanup"]/../p:eventOutcomeInformation/p:eventOutcomeDetail/p:eventOutcomeDetailNote/text()', namespaces=namespaces, smart_strings=False)
+        # Elements dropped at their end; other elements are dropped with the
+        # closest of their ancestors that is.
+        dropped = (mets_tag + 'file', mets_tag + 'div', mets_tag + 'fptr')
+
+        mets = header = structmap_label = None
+        file_locations = []  # (file ID, path in the fileSec) in document order
+        processed_file_ids = set()
+        cleanup_events = {}  # amdSec ID: note of its first name cleanup event
+        for event, element in etree.iterparse(mets_path, events=('start', 'end')):
+            if mets is None:
+                mets = element
+                if mets.tag != mets_tag + 'mets':
+                    raise StorageException(_("<mets> element not found in METS file!"))
+                try:
+                    transfer_uuid = mets.attrib['OBJID']
+                except KeyError:
+                    raise StorageException(_("<mets> element did not have an OBJID attribute!"))
+                continue
 
-        header = doc.find('m:metsHdr', namespaces=namespaces)
-        if header is None:
-            raise StorageException(_("<metsHdr> element not found in METS file!"))
+            parent = element.getparent()
+            if event == 'start':
+                if element.tag == mets_tag + 'structMap' and parent is mets:
+                    structmap_label = element.get('LABEL')
+                continue
 
-        try:
-            creation_date = header.attrib['CREATEDATE']
-        except KeyError:
-            raise StorageException(_("<metsHdr> element did not have a CREATEDATE attribute!"))
+            if element.tag == mets_tag + 'FLocat':
+                file_locations.append((parent.attrib['ID'], element.attrib[href]))
+            elif element.tag == mets_tag + 'fptr':
+                # Only include files listed in the "processed" structMap;
+                # some files may not be present in this transfer.
+                if structmap_label == 'processed':
+                    processed_file_ids.add(element.get('FILEID'))
+            elif parent is mets:
+                if element.tag == mets_tag + 'metsHdr':
+                    header = element
+                    try:
+                        creation_date = header.attrib['CREATEDATE']
+                    except KeyError:
+                        raise StorageException(_("<metsHdr> element did not have a CREATEDATE attribute!"))
+
+                    accession_id = header.findtext('./m:altRecordID[@TYPE="Accession number"]', namespaces=namespaces) or ''
+
+                    agent = header.xpath('./m:agent[@ROLE="CREATOR"][@TYPE="OTHER"][@OTHERTYPE="SOFTWARE"]/m:note[.="Archivematica dashboard UUID"]/../m:name',
+                                         namespaces=namespaces)
+                    if not agent:
+                        raise StorageException(_("No <agent> element found!"))
+                    dashboard_uuid = agent[0].text
+                elif element.tag == mets_tag + 'amdSec':
+                    notes = cleanup_notes(element)
+                    if notes:
+                        cleanup_events[element.get('ID')] = notes[0]
+                elif element.tag == mets_tag + 'structMap':
+                    structmap_label = None
+            elif element.tag not in dropped:
+                continue
 
-        accession_id = header.findtext('./m:altRecordID[@TYPE="Accession number"]', namespaces=namespaces) or ''
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
 
-        agent = header.xpath('./m:agent[@ROLE="CREATOR"][@TYPE="OTHER"][@OTHERTYPE="SOFTWARE"]/m:note[.="Archivematica dashboard UUID"]/../m:name',
-                             namespaces=namespaces)
-        if not agent:
-            raise StorageException(_("No <agent> element found!"))
-        dashboard_uuid = agent[0].text
+        if header is None:
+            raise StorageException(_("<metsHdr> element not found in METS file!"))
 
-        files = mets.xpath('.//m:FLocat', namespaces=namespaces)
         package_basename = os.path.basename(self.current_path)
 
         files_data = []
-        for f in files:
-            file_id = f.getparent().attrib['ID']
-
-            # Only include files listed in the "processed" structMap;
-            # some files may not be present in this transfer.
-            if mets.find('./m:structMap[@LABEL="processed"]//m:fptr[@FILEID="{}"]'.format(file_id), namespaces=namespaces) is None:
+        for file_id, relative_path in file_locations:
+            if file_id not in processed_file_ids:
                 continue
 
-            relative_path = f.attrib['{' + utils.NSMAP['xlink'] + '}href']
             uuid = file_id[-36:]
 
             # If the filename has been sanitized, the path in the fileSec
             # may be outdated; check for a cleanup event and use that,
             # if present.
-            cleanup_events = mets.xpath('m:amdSec[@ID="digiprov-{}"]/m:digiprovMD/m:mdWrap/m:xmlData/p:event/p:eventType[text()="name cleanup"]/../p:eventOutcomeInformation/p:eventOutcomeDetail/p:eventOutcomeDetailNote/text()'.format(uuid), namespaces=namespaces, smart_strings=False)
-            if cleanup_events:
-                cleaned_up_name = re.match(r'.*cleaned up name="(.*)"$', cleanup_events[0])
+            cleanup_event = cleanup_events.get('digiprov-{}'.format(uuid))
+            if cleanup_event:
+                cleaned_up_name = re.match(r'.*cleaned up name="(.*)"$', cleanup_event)
                 if cleaned_up_name:
                     relative_path = cleaned_up_name.groups()[0].replace('%transferDirectory%', '', 1)
 
@@ -1593,14 +1679,27 @@ class Package(models.Model):
             prefix = self.full_path
 
         file_data = self._parse_mets(prefix=prefix)
+        attributes = {
+            'source_package': file_data['transfer_uuid'],
+            'accessionid': file_data['accession_id'],
+            'package': self,
+            'origin': file_data['dashboard_uuid'],
+        }
 
-        for f in file_data['files']:
-            File.objects.update_or_create(source_id=f['file_uuid'],
-                                          source_package=file_data['transfer_uuid'],
-                                          accessionid=file_data['accession_id'],
-                                          package=self,
-                                          name=f['path'],
-                                          origin=file_data['dashboard_uuid'])
+        # Files already indexed, e.g. if the transfer is indexed again
+        indexed = set(File.objects.filter(**attributes).values_list('source_id', 'name'))
+        batch = []
+        with transaction.atomic():
+            for f in file_data['files']:
+                if (f['file_uuid'], f['path']) in indexed:
+                    continue
+                indexed.add((f['file_uuid'], f['path']))
+                batch.append(File(source_id=f['file_uuid'], name=f['path'],
+                                  **attributes))
+                if len(batch) == FILE_BATCH_SIZE:
+                    File.objects.bulk_create(batch)
+                    batch = []
+            File.objects.bulk_create(batch)
 
     def backlog_transfer(self, origin_location, origin_path):
         """
@@ -1704,7 +1803,8 @@ class Package(models.Model):
 
         bag = bagit.Bag(path)
         try:
-            success = bag.validate(processes=settings.BAG_VALIDATION_NO_PROCESSES)
+            with self.current_location.space.limiter.operation():
+                success = bag.validate(processes=settings.BAG_VALIDATION_NO_PROCESSES)
             failures = []
             message = ""
         except bagit.BagValidationError as failure:
@@ -13,7 +13,7 @@ from django_extensions.db.fields import UUIDField
 import requests
 
 # This project, alphabetical
-from common import utils
+from common import http_client, utils
 
 # This module, alphabetical
 from .local_filesystem import LocalFilesystem
@@ -155,9 +155,10 @@ class Pipeline(URLMixin, models.Model):
         LOGGER.debug('URL: %s; headers %s; data: %s', api_url, headers, fields)
         try:
             verify = not settings.INSECURE_SKIP_VERIFY
-            resp = requests.request(method, api_url, headers=headers,
-                                    data=fields, allow_redirects=True,
-                                    verify=verify)
+            session = http_client.get_session('pipeline', api_url)
+            resp = session.request(method, api_url, headers=headers,
+                                   data=fields, allow_redirects=True,
+                                   verify=verify)
         except requests.exceptions.RequestException:
             LOGGER.exception('Unable to connect to pipeline %s.', self)
             raise
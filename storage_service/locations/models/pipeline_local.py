@@ -14,7 +14,7 @@ from django.utils.translation import ugettext_lazy as _
 # Third party dependencies, alphabetical
 
 # This project, alphabetical
-from common import utils
+from common import ssh, utils
 
 # This module, alphabetical
 from .location import Location
@@ -45,6 +45,9 @@ class PipelineLocalFS(models.Model):
         verbose_name = _("Pipeline Local FS")
         app_label = 'locations'
 
+    # Browse lists one page at a time (see Space.browse)
+    PAGINATED_BROWSE = True
+
     ALLOWED_LOCATION_PURPOSE = [
         Location.AIP_RECOVERY,
         Location.AIP_STORAGE,
@@ -73,10 +76,10 @@ class PipelineLocalFS(models.Model):
 
         return return_str.format(user, host, utils.coerce_str(path))
 
-    def browse(self, path):
+    def browse(self, path, **options):
         path = os.path.join(path, '')
         ssh_path = self._format_host_path(path)
-        return self.space.browse_rsync(ssh_path, assume_rsync_daemon=self.assume_rsync_daemon, rsync_password=self.rsync_password)
+        return self.space.browse_rsync(ssh_path, assume_rsync_daemon=self.assume_rsync_daemon, rsync_password=self.rsync_password, **options)
 
     def delete_path(self, delete_path):
         # Sync from an empty directory to delete the contents of delete_path;
@@ -86,9 +89,11 @@ class PipelineLocalFS(models.Model):
         temp_dir = tempfile.mkdtemp()
         dest_path = self._format_host_path(os.path.join(delete_path, ''))
         command = ['rsync', '-vv', '--itemize-changes', '--protect-args',
-                   '--delete', '--dirs',
-                   os.path.join(temp_dir, ''),
-                   dest_path]
+                   '--delete', '--dirs']
+        if not self.assume_rsync_daemon:
+            connection = ssh.get_connection(self.remote_user, self.remote_name)
+            command += ['--rsh', connection.rsh()]
+        command += [os.path.join(temp_dir, ''), dest_path]
         LOGGER.info("rsync delete command: %s", command)
         try:
             subprocess.check_call(command)
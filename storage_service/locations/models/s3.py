@@ -12,6 +12,7 @@ import boto3
 import re
 
 # This project, alphabetical
+from common import browse, utils
 
 # This module, alphabetical
 from . import StorageException
@@ -37,6 +38,9 @@ class S3(models.Model):
         verbose_name = _("S3")
         app_label = 'locations'
 
+    # Browse lists one page at a time (see Space.browse)
+    PAGINATED_BROWSE = True
+
     ALLOWED_LOCATION_PURPOSE = [
         Location.AIP_STORAGE,
     ]
@@ -74,7 +78,7 @@ class S3(models.Model):
     def _bucket_name(self):
         return self.space_id
 
-    def browse(self, path):
+    def browse(self, path, **options):
         # strip leading slash on path
         path = path.lstrip('/')
 
@@ -91,6 +95,12 @@ class S3(models.Model):
         if path != '':
             path = path.rstrip('/') + '/'
 
+        if options.get('order_by') == '-name':
+            # Keys can only be listed in ascending order
+            return browse.paginate_results(self.browse(path), **options)
+        if options:
+            return self._browse_page(path, **options)
+
         objects = self.resource.Bucket(self._bucket_name()).objects.filter(Prefix=path)
 
         directories = set()
@@ -120,6 +130,63 @@ class S3(models.Model):
             'properties': properties,
         }
 
+    def _browse_page(self, path, limit=None, cursor=None, name_prefix=None,
+                     order_by='name'):
+        """
+        Return one page of the entries of ``path`` in key order, listing the
+        bucket only until the page is full.
+
+        The cursor is the last key of the previous page, relative to path.
+        """
+        path = utils.coerce_str(path)
+        params = {
+            'Bucket': self._bucket_name(),
+            'Prefix': path + (name_prefix or ''),
+            'Delimiter': '/',
+        }
+        if cursor:
+            params['StartAfter'] = path + cursor
+        directories = []
+        entries = []
+        properties = {}
+        last = None
+        for page in self.client.get_paginator('list_objects_v2').paginate(**params):
+            # Directories and objects are listed separately
+            keys = [(p['Prefix'], None) for p in page.get('CommonPrefixes', [])]
+            keys += [(o['Key'], o) for o in page.get('Contents', [])]
+            for key, obj in sorted(keys):
+                key = utils.coerce_str(key)
+                name = key[len(path):]
+                if obj is None:
+                    name = name.rstrip('/')
+                if not name:
+                    continue
+                if limit is not None and len(entries) == limit:
+                    return {
+                        'directories': directories,
+                        'entries': entries,
+                        'properties': properties,
+                        'next_cursor': last,
+                    }
+                entries.append(name)
+                if obj is None:
+                    directories.append(name)
+                    last = name + browse.AFTER_DIRECTORY
+                else:
+                    properties[name] = {
+                        'verbose name': key,
+                        'size': obj['Size'],
+                        'timestamp': obj['LastModified'],
+                        'e_tag': obj['ETag'],
+                    }
+                    last = name
+        return {
+            'directories': directories,
+            'entries': entries,
+            'properties': properties,
+            'next_cursor': None,
+        }
+
     def delete_path(self, delete_path):
         objects = self.resource.Bucket(self._bucket_name()).objects.filter(Prefix=delete_path)
 
@@ -139,11 +206,14 @@ class S3(models.Model):
             dest_file = objectSummary.key.replace(src_path, dest_path, 1)
             self.space.create_local_directory(dest_file)
 
-            bucket.download_file(objectSummary.key, dest_file)
+            bucket.download_file(objectSummary.key, dest_file,
+                                 Callback=self.space.limiter.read.consumer())
 
     def move_from_storage_service(self, src_path, dest_path, package=None):
         self._ensure_bucket_exists()
         bucket = self.resource.Bucket(self._bucket_name())
+        # Called by the threads of boto3 with the size of each part uploaded
+        callback = self.space.limiter.write.consumer()
 
         if os.path.isdir(src_path):
             # ensure trailing slash on both paths
@@ -159,14 +229,14 @@ class S3(models.Model):
                     dest = entry.replace(src_path, dest_path, 1)
 
                     with open(entry, 'rb') as data:
-                        bucket.upload_fileobj(data, dest)
+                        bucket.upload_fileobj(data, dest, Callback=callback)
 
         elif os.path.isfile(src_path):
             # strip leading slash on dest_path
             dest_path = dest_path.lstrip('/')
 
             with open(src_path, 'rb') as data:
-                bucket.upload_fileobj(data, dest_path)
+                bucket.upload_fileobj(data, dest_path, Callback=callback)
 
         else:
             raise StorageException(
@@ -1,6 +1,8 @@
 # stdlib, alphabetical
+from concurrent import futures
 import datetime
 import errno
+import heapq
 import logging
 import os
 import re
@@ -8,18 +10,23 @@ import shutil
 import stat
 import subprocess
 import tempfile
+import threading
 
 # Core Django, alphabetical
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.utils import six
+from django.utils.six.moves import shlex_quote
 
 # Third party dependencies, alphabetical
 from django_extensions.db.fields import UUIDField
+import scandir
 
 # This project, alphabetical
-from common import utils
+from common import browse, filecopy, ssh, throttle, utils
 LOGGER = logging.getLogger(__name__)
 
 # This module, alphabetical
@@ -28,6 +35,19 @@ from . import StorageException  # noqa: E402
 __all__ = ('Space', 'PosixMoveUnsupportedError', )
 
 
+# Permission bits added to packages moved with os.rename, like chmod ug+rw,o+r
+LOCAL_MOVE_MODE = (stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP |
+                   stat.S_IROTH)
+
+# Matches the user@host: or host: prefix of rsync remote paths
+REMOTE_PATH_RE = re.compile(r'^[^/:]+:')
+
+
+def is_remote_path(path):
+    """ Returns True if path is an rsync remote path like user@host:/path. """
+    return bool(REMOTE_PATH_RE.match(path))
+
+
 def validate_space_path(path):
     """ Validation for path in Space.  Must be absolute. """
     if path[0] != '/':
@@ -180,6 +200,23 @@ class Space(models.Model):
     last_verified = models.DateTimeField(default=None, null=True, blank=True,
         verbose_name=_("Last verified"),
         help_text=_("Time this location was last verified to be accessible."))
+    rsync_workers = models.PositiveSmallIntegerField(default=1,
+        validators=[MinValueValidator(1)],
+        verbose_name=_("Rsync workers"),
+        help_text=_("Number of rsync processes copying a package to or from a remote host at the same time. Packages are split into that many lists of files of similar size."))
+    read_limit = models.PositiveIntegerField(default=None, null=True, blank=True,
+        verbose_name=_("Read bandwidth limit"),
+        help_text=_("Maximum rate at which packages are read from this space, in KiB/s, in each Storage Service process (optional)"))
+    write_limit = models.PositiveIntegerField(default=None, null=True, blank=True,
+        verbose_name=_("Write bandwidth limit"),
+        help_text=_("Maximum rate at which packages are written to this space, in KiB/s, in each Storage Service process (optional)"))
+    max_operations = models.PositiveSmallIntegerField(default=None, null=True, blank=True,
+        validators=[MinValueValidator(1)],
+        verbose_name=_("Maximum concurrent operations"),
+        help_text=_("Maximum number of packages moved to or from this space or checked for fixity at the same time, in each Storage Service process (optional)"))
+    browse_cache_ttl = models.PositiveIntegerField(default=None, null=True, blank=True,
+        verbose_name=_("Browse cache time"),
+        help_text=_("Number of seconds the contents of a directory are cached after browsing it. 0 disables caching. Leave empty to use the default of the Storage Service (optional)"))
 
     class Meta:
         verbose_name = _('Space')
@@ -192,6 +229,15 @@ class Space(models.Model):
             path=self.path,
         )
 
+    @property
+    def limiter(self):
+        """ common.throttle.Limiter enforcing the current limits of this space. """
+        return throttle.get_limiter(
+            self.uuid,
+            read_rate=self.read_limit and self.read_limit * 1024,
+            write_rate=self.write_limit and self.write_limit * 1024,
+            max_operations=self.max_operations)
+
     def clean(self):
         # Object storage spaces do not require a path, or for it to start with /
         if self.access_protocol not in self.OBJECT_STORAGE:
@@ -240,15 +286,63 @@ class Space(models.Model):
         'verbose name': Verbose name of the object
         See each Space's browse for details.
 
+        Large directories can be browsed one page at a time with the keyword
+        arguments `limit`, `cursor`, `order_by` and `name_prefix` (see
+        common.browse). When any of them is given, the result only contains
+        the entries of the page, and a 'next_cursor' key with the cursor of
+        the following page, or None. Spaces whose class sets
+        PAGINATED_BROWSE list the page natively; the others are listed
+        completely and then paginated.
+
+        Results are cached for `browse_cache_ttl` seconds (see
+        common.browse.BrowseCache). Moves to and deletes from this space done
+        by the Storage Service invalidate the results they affect.
+
         :param str path: Full path to return info for
+        :param bool use_cache: If False, list the path even if its results
+            are cached, and cache the new results.
         :return: Dictionary of object information detailed above.
+        :raises: ValueError if the pagination options are not valid.
         """
         LOGGER.info('path: %s', path)
+        use_cache = kwargs.pop('use_cache', True)
+        options = dict((option, kwargs.pop(option))
+                       for option in ('limit', 'cursor', 'order_by', 'name_prefix')
+                       if kwargs.get(option) is not None)
+        if options:
+            browse.check_options(**options)
+        ttl = self.browse_cache_ttl
+        if ttl is None:
+            ttl = settings.BROWSE_CACHE_TTL
+        # Other arguments are specific to the child space, so not cached
+        if not ttl or args or kwargs:
+            return self._browse(path, options, *args, **kwargs)
+        key = self.browse_cache.key(path, options)
+        if use_cache:
+            results = self.browse_cache.get(key)
+            if results is not None:
+                LOGGER.debug('Browse results of %s found in cache', path)
+                return results
+        results = self._browse(path, options)
+        self.browse_cache.set(key, results, ttl)
+        return results
+
+    @property
+    def browse_cache(self):
+        return browse.BrowseCache(self.uuid)
+
+    def _browse(self, path, options, *args, **kwargs):
+        """ List path without the cache, see browse. """
         try:
-            return self.get_child_space().browse(path, *args, **kwargs)
+            child = self.get_child_space()
+            if options and not getattr(child, 'PAGINATED_BROWSE', False):
+                return browse.paginate_results(
+                    child.browse(path, *args, **kwargs), **options)
+            kwargs.update(options)
+            return child.browse(path, *args, **kwargs)
         except AttributeError:
             LOGGER.debug('Falling back to default browse local', exc_info=False)
-            return self.browse_local(path)
+            return self.browse_local(path, **options)
 
     def delete_path(self, delete_path, *args, **kwargs):
         """
@@ -267,6 +361,9 @@ class Space(models.Model):
             return self.get_child_space().delete_path(delete_path, *args, **kwargs)
         except AttributeError:
             return self._delete_path_local(delete_path)
+        finally:
+            # After the change, so that results listed during it are dropped
+            self.browse_cache.invalidate(delete_path)
 
     def posix_move(self, source_path, destination_path, destination_space, package=None):
         """
@@ -290,8 +387,15 @@ class Space(models.Model):
 
         abs_destination_path = os.path.join(destination_space.path, destination_path)
 
-        return self.get_child_space().posix_move(
-            source_path, abs_destination_path, destination_space, package)
+        # Take the slots of both spaces in a fixed order to avoid deadlocks
+        first, second = sorted([self, destination_space], key=lambda space: space.uuid)
+        try:
+            with first.limiter.operation(), second.limiter.operation():
+                return self.get_child_space().posix_move(
+                    source_path, abs_destination_path, destination_space, package)
+        finally:
+            self.browse_cache.invalidate(source_path)
+            destination_space.browse_cache.invalidate(abs_destination_path)
 
     def move_to_storage_service(self, source_path, destination_path,
                                 destination_space, *args, **kwargs):
@@ -320,8 +424,9 @@ class Space(models.Model):
         destination_path = os.path.join(destination_space.staging_path, destination_path)
 
         try:
-            self.get_child_space().move_to_storage_service(
-                source_path, destination_path, destination_space, *args, **kwargs)
+            with self.limiter.operation():
+                self.get_child_space().move_to_storage_service(
+                    source_path, destination_path, destination_space, *args, **kwargs)
         except AttributeError:
             raise NotImplementedError(_('%(protocol)s space has not implemented %(method)s') % {'protocol': self.get_access_protocol_display(), 'method': 'move_to_storage_service'})
 
@@ -380,8 +485,12 @@ class Space(models.Model):
         source_path, destination_path = self._move_from_path_mangling(source_path, destination_path)
         child_space = self.get_child_space()
         if hasattr(child_space, 'move_from_storage_service'):
-            return child_space.move_from_storage_service(
-                source_path, destination_path, *args, **kwargs)
+            try:
+                with self.limiter.operation():
+                    return child_space.move_from_storage_service(
+                        source_path, destination_path, *args, **kwargs)
+            finally:
+                self.browse_cache.invalidate(destination_path)
         else:
             raise NotImplementedError(_('%(protocol)s space has not implemented %(method)s') % {'protocol': self.get_access_protocol_display(), 'method': 'move_from_storage_service'})
 
@@ -441,7 +550,8 @@ class Space(models.Model):
         """
         child = self.get_child_space()
         if hasattr(child, 'check_package_fixity'):
-            return child.check_package_fixity(package)
+            with self.limiter.operation():
+                return child.check_package_fixity(package)
         else:
             raise NotImplementedError(
                 _('Space %(protocol)s does not implement check_package_fixity') %
@@ -450,10 +560,13 @@ class Space(models.Model):
 
     # HELPER FUNCTIONS
 
-    def move_rsync(self, source, destination, try_mv_local=False, assume_rsync_daemon=False, rsync_password=None):
+    def move_rsync(self, source, destination, try_mv_local=False, assume_rsync_daemon=False, rsync_password=None, staging=False):
         """ Moves a file from source to destination.
 
-        By default, uses rsync to move files.
+        By default, uses rsync to move files between hosts, and copies local
+        files in parallel in this process with the same semantics (see
+        common.filecopy). Local files on the same filesystem are cloned if it
+        supports reflinks.
         All directories leading to destination must exist; Space.create_local_directory may be useful.
 
         If try_mv_local is True, will attempt to use os.rename, which only works on the same device.
@@ -464,6 +577,7 @@ class Space(models.Model):
         :param bool try_mv_local: If true, try moving/renaming instead of copying.  Should be False if source or destination specify a user@host.  Warning: this will not leave a copy at the source.
         :param bool assume_rsync_daemon: If true, will use rsync daemon-style commands instead of the default rsync with remote shell transport
         :param rsync_password: used if assume_rsync_daemon is true, to specify value of RSYNC_PASSWORD environment variable
+        :param bool staging: If true, destination is a staging copy that is not modified, and is hard linked to the source if settings.STAGING_HARDLINKS is set.
         """
         source = utils.coerce_str(source)
         destination = utils.coerce_str(destination)
@@ -472,13 +586,18 @@ class Space(models.Model):
         if source == destination:
             return
 
+        if try_mv_local and settings.STAGING_HARDLINKS and os.path.exists(source) and filecopy.has_links(source):
+            # Staging copies may be hard links to the original files; copy
+            # them instead of renaming so the destination does not share them
+            self._move_linked_local(source, destination)
+            return
+
         if try_mv_local:
-            # Try using mv, and if that fails, fallback to rsync
-            chmod_command = ['chmod', '--recursive', 'ug+rw,o+r', destination]
+            # Try using mv, and if that fails, fallback to copying
             try:
                 os.rename(source, destination)
                 # Set permissions (rsync does with --chmod=ugo+rw)
-                subprocess.call(chmod_command)
+                filecopy.chmod_tree(destination, LOCAL_MOVE_MODE)
                 return
             except OSError:
                 LOGGER.debug('os.rename failed, trying with normalized paths')
@@ -487,20 +606,45 @@ class Space(models.Model):
             try:
                 os.rename(source_norm, dest_norm)
                 # Set permissions (rsync does with --chmod=ugo+rw)
-                subprocess.call(chmod_command)
+                filecopy.chmod_tree(dest_norm, LOCAL_MOVE_MODE)
                 return
             except OSError:
-                LOGGER.debug('os.rename failed, falling back to rsync. Source: %s; Destination: %s', source_norm, dest_norm)
+                LOGGER.debug('os.rename failed, falling back to copying. Source: %s; Destination: %s', source_norm, dest_norm)
+
+        bucket = self._transfer_bucket(source)
+        if not (assume_rsync_daemon or is_remote_path(source) or is_remote_path(destination)):
+            try:
+                filecopy.copy_tree(
+                    source, destination,
+                    link=staging and settings.STAGING_HARDLINKS,
+                    throttle=bucket.consumer() if bucket.rate else None)
+            except (filecopy.CopyError, IOError, OSError) as e:
+                s = "Copy from {} to {} failed: {}".format(source, destination, e)
+                LOGGER.warning(s)
+                raise StorageException(s)
+            return
 
         # Rsync file over
         # TODO Do this asyncronously, with restarting failed attempts
         command = ['rsync', '-t', '-O', '--protect-args', '-vv',
-                   '--chmod=Fug+rw,o-rwx,Dug+rwx,o-rwx',
-                   '-r', source, destination]
-        LOGGER.info("rsync command: %s", command)
+                   '--chmod=Fug+rw,o-rwx,Dug+rwx,o-rwx']
+        # Parallel workers open their own connections to use several streams
+        sharded = self.rsync_workers > 1 and not is_remote_path(source) and os.path.isdir(source)
+        connection = ssh.get_path_connection(source) or ssh.get_path_connection(destination)
+        if connection and not assume_rsync_daemon:
+            command += ['--rsh', connection.rsh(shared=not sharded)]
+        if bucket.rate:
+            # In KiB/s, shared by the parallel workers
+            workers = self.rsync_workers if sharded else 1
+            command += ['--bwlimit={}'.format(max(1, bucket.rate // 1024 // workers))]
         kwargs = {'stdout': subprocess.PIPE, 'stderr': subprocess.STDOUT}
         if assume_rsync_daemon:
             kwargs['env'] = {'RSYNC_PASSWORD': rsync_password}
+        if sharded:
+            self._move_rsync_sharded(command, source, destination, kwargs)
+            return
+        command += ['-r', source, destination]
+        LOGGER.info("rsync command: %s", command)
         p = subprocess.Popen(command, **kwargs)
         stdout, _ = p.communicate()
         if p.returncode != 0:
@@ -508,6 +652,75 @@ class Space(models.Model):
             LOGGER.warning(s)
             raise StorageException(s)
 
+    def _transfer_bucket(self, source):
+        """ Returns the token bucket limiting a copy from source: writes to
+        this space if source is in its staging area, reads from it otherwise. """
+        if self.staging_path and source.startswith(utils.coerce_str(self.staging_path)):
+            return self.limiter.write
+        return self.limiter.read
+
+    def _move_rsync_sharded(self, command, source, destination, kwargs):
+        """ Copies the local directory source to destination with
+        self.rsync_workers rsync processes in parallel, each copying a list of
+        files of similar total size.
+
+        Fails like a single rsync: if any process fails, the others are
+        stopped and StorageException is raised.
+
+        :param list command: rsync command and options, without paths.
+        :param kwargs: Keyword arguments to subprocess.Popen.
+        """
+        root, shards = rsync_file_lists(source, self.rsync_workers)
+        # destination is a directory, like with rsync -r from a directory
+        destination = os.path.join(destination, '')
+        list_dir = tempfile.mkdtemp()
+        processes = []
+        try:
+            for i, paths in enumerate(shards):
+                list_path = os.path.join(list_dir, str(i))
+                with open(list_path, 'wb') as f:
+                    f.write(b'\0'.join(utils.coerce_str(p) for p in paths))
+                cmd = command + ['--from0', '--files-from', list_path, root, destination]
+                LOGGER.info("rsync command: %s", cmd)
+                processes.append(subprocess.Popen(cmd, **kwargs))
+            failures = []
+            with futures.ThreadPoolExecutor(max_workers=len(processes)) as executor:
+                jobs = {executor.submit(p.communicate): p for p in processes}
+                for job in futures.as_completed(jobs):
+                    p = jobs[job]
+                    stdout, _ = job.result()
+                    if p.returncode != 0 and not failures:
+                        failures.append((p.returncode, stdout))
+                        for other in processes:
+                            if other.poll() is None:
+                                other.kill()
+        finally:
+            for p in processes:
+                if p.poll() is None:
+                    p.kill()
+            shutil.rmtree(list_dir)
+        if failures:
+            returncode, stdout = failures[0]
+            s = "Rsync failed with status {}: {}".format(returncode, stdout)
+            LOGGER.warning(s)
+            raise StorageException(s)
+
+    def _move_linked_local(self, source, destination):
+        """ Moves source to destination like os.rename, by copying the files
+        and deleting source. """
+        if os.path.isdir(source):
+            source = os.path.join(source, '')
+        try:
+            filecopy.copy_tree(source, destination)
+        except (filecopy.CopyError, IOError, OSError) as e:
+            s = "Copy from {} to {} failed: {}".format(source, destination, e)
+            LOGGER.warning(s)
+            raise StorageException(s)
+        if os.path.isdir(source):
+            shutil.rmtree(source)
+        else:
+            os.remove(source)
+
     def create_local_directory(self, path, mode=None):
         """
         Creates directory structure for `path` with `mode` (default 775).
@@ -550,49 +763,73 @@ class Space(models.Model):
         :param user: Username on remote host
         :param host: Hostname of remote host
         """
-        # Assemble a set of directories to create on the remote server;
-        # these will be created one at a time
+        # Create the parent directory of destination_path and its missing
+        # parents with a single command over the shared SSH connection; umask
+        # gives them the mode ug=rwx,o=rx
+        directory = os.path.dirname(utils.coerce_str(destination_path))
+        if directory in ('', '/'):
+            return
+        connection = ssh.get_connection(user, host)
+        cmd = connection.command(
+            'umask 002 && mkdir -p -- {}'.format(shlex_quote(directory)))
+        LOGGER.info("ssh path creation command: %s", cmd)
+        try:
+            subprocess.check_call(cmd)
+        except subprocess.CalledProcessError as e:
+            # The account may only be allowed to run rsync
+            LOGGER.info("ssh path creation failed, using rsync: %s", e)
+            self._create_rsync_directory_with_rsync(
+                directory, user, host, connection)
+
+    def _create_rsync_directory_with_rsync(self, directory, user, host,
+                                           connection):
+        """ Creates the remote directory and its parents one at a time, by
+        rsyncing an empty directory into each of them. """
+        # Assemble a set of directories to create on the remote server
         directories = []
-        path = destination_path
+        path = directory
         while path != '' and path != '/':
             directories.insert(0, path)
             path = os.path.dirname(path)
 
         # Syncing an empty directory will ensure no files get transferred
         temp_dir = os.path.join(tempfile.mkdtemp(), '')
-
-        # Creates the destination_path directory without copying any files
-        # Dir must end in a / for rsync to create it
-        for directory in directories:
-            path = os.path.join(os.path.dirname(directory), '')
-            path = "{}@{}:{}".format(user, host, utils.coerce_str(path))
-            cmd = ['rsync', '-vv', '--protect-args', '--chmod=ug=rwx,o=rx', '--recursive', temp_dir, path]
-            LOGGER.info("rsync path creation command: %s", cmd)
-            try:
-                subprocess.check_call(cmd)
-            except subprocess.CalledProcessError as e:
-                shutil.rmtree(temp_dir)
-                LOGGER.warning("rsync path creation failed: %s", e)
-                raise
-
-        shutil.rmtree(temp_dir)
-
-    def browse_local(self, path):
+        try:
+            for path in directories:
+                # Dir must end in a / for rsync to create it
+                path = "{}@{}:{}".format(user, host, os.path.join(path, ''))
+                cmd = ['rsync', '-vv', '--protect-args', '--chmod=ug=rwx,o=rx',
+                       '--recursive', '--rsh', connection.rsh(), temp_dir, path]
+                LOGGER.info("rsync path creation command: %s", cmd)
+                try:
+                    subprocess.check_call(cmd)
+                except subprocess.CalledProcessError as e:
+                    LOGGER.warning("rsync path creation failed: %s", e)
+                    raise
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def browse_local(self, path, **options):
         """
         Returns browse results for a locally accessible filesystem.
 
         Properties provided:
         'size': Size of the object, as determined by os.path.getsize. May be misleading for directories, suggest use 'object count'
         'object count': Number of objects in the directory, including children
+
+        :param options: Pagination options, see Space.browse
         """
         if isinstance(path, six.text_type):
             path = str(path)
         if not os.path.exists(path):
             LOGGER.info('%s in %s does not exist', path, self)
-            return {'directories': [], 'entries': [], 'properties': {}}
-        return path2browse_dict(path)
+            result = {'directories': [], 'entries': [], 'properties': {}}
+            if options:
+                result['next_cursor'] = None
+            return result
+        return path2browse_dict(path, **options)
 
-    def browse_rsync(self, path, ssh_key=None, assume_rsync_daemon=False, rsync_password=None):
+    def browse_rsync(self, path, ssh_key=None, assume_rsync_daemon=False, rsync_password=None, **options):
         """
         Returns browse results for a ssh (rsync) accessible space.
 
@@ -606,6 +843,8 @@ class Space(models.Model):
         :param ssh_key: Path to the SSH key on disk. If None, will use default.
         :param bool assume_rsync_daemon: If true, will use rsync daemon-style commands instead of the default rsync with remote shell transport
         :param rsync_password: used if assume_rsync_daemon is true, to specify value of RSYNC_PASSWORD environment variable
+        :param options: Pagination options, see Space.browse. Properties are
+            only returned for paginated results.
         :return: See docstring for Space.browse
         """
         if ssh_key is None:
@@ -617,9 +856,14 @@ class Space(models.Model):
                    '--list-only',
                    '--exclude', '.*',  # Ignore hidden files
                    ]
-        if not assume_rsync_daemon:
-            # Specify identity file
-            command += ['--rsh', 'ssh -i ' + ssh_key]
+        if options.get('name_prefix'):
+            # Only list the matching entries
+            pattern = re.sub(r'([*?[\\])', r'\\\1', options['name_prefix'])
+            command += ['--include', pattern + '*', '--exclude', '*']
+        connection = ssh.get_path_connection(path, ssh_key)
+        if connection and not assume_rsync_daemon:
+            # Use the shared connection, with the identity file
+            command += ['--rsh', connection.rsh()]
         command += [path]
 
         LOGGER.info('rsync list command: %s', command)
@@ -631,41 +875,40 @@ class Space(models.Model):
             output = subprocess.check_output(command, env=env)
         except Exception as e:
             LOGGER.warning("rsync list failed: %s", e, exc_info=True)
-            entries = []
-            directories = []
+            output = ''
+        # Output is lines in format:
+        # <type><permissions>  <size>  <date> <time> <path>
+        # Eg: drwxrws---          4,096 2015/03/02 17:05:20 tmp
+        # Eg: -rw-r--r--            201 2013/05/13 13:26:48 LICENSE.md
+        # Eg: lrwxrwxrwx             78 2015/02/19 12:13:40 sharedDirectory
+        # Parse out the path and type
+        # Define groups for type, permissions, size, timestamp and name
+        regex = re.compile(r'^(?P<type>.)(?P<permissions>.{9}) +(?P<size>[\d,]+) (?P<timestamp>..../../.. ..:..:..) (?P<name>.*)$')
+        matches = (regex.match(e) for e in output.splitlines())
+        # Take the last entry. Ignore empty lines and '.'
+        matches = dict((e.group('name'), e) for e in matches
+                       if e and e.group('name') != '.')
+        if options:
+            entries, next_cursor = browse.paginate(matches, **options)
         else:
-            output = output.splitlines()
-            # Output is lines in format:
-            # <type><permissions>  <size>  <date> <time> <path>
-            # Eg: drwxrws---          4,096 2015/03/02 17:05:20 tmp
-            # Eg: -rw-r--r--            201 2013/05/13 13:26:48 LICENSE.md
-            # Eg: lrwxrwxrwx             78 2015/02/19 12:13:40 sharedDirectory
-            # Parse out the path and type
-            # Define groups for type, permissions, size, timestamp and name
-            regex = r'^(?P<type>.)(?P<permissions>.{9}) +(?P<size>[\d,]+) (?P<timestamp>..../../.. ..:..:..) (?P<name>.*)$'
-            matches = [re.match(regex, e) for e in output]
-            # Take the last entry. Ignore empty lines and '.'
-            entries = [e.group('name') for e in matches
-                if e and e.group('name') != '.']
-            # Only items whose type is not '-'. Links count as dirs.
-            directories = [e.group('name') for e in matches
-                if e and e.group('name') != '.' and e.group('type') != '-']
-            # Generate properties for each entry
-            properties = {}
-            for e in matches:
-                name = e.group('name')
-                if name not in entries:
-                    continue
-                properties[name] = {}
-                properties[name]['timestamp'] = datetime.datetime.strptime(e.group('timestamp'), '%Y/%m/%d %H:%M:%S').isoformat()
-                if name not in directories:
-                    properties[name]['size'] = int(e.group('size').replace(',', ''))
-
-        directories = sorted(directories, key=lambda s: s.lower())
-        entries = sorted(entries, key=lambda s: s.lower())
-        LOGGER.debug('entries: %s', entries)
-        LOGGER.debug('directories: %s', directories)
-        return {'directories': directories, 'entries': entries}
+            entries = sorted(matches, key=lambda s: s.lower())
+        # Only items whose type is not '-'. Links count as dirs.
+        directories = [name for name in entries
+                       if matches[name].group('type') != '-']
+        LOGGER.debug('entries: %s', entries[:100])
+        LOGGER.debug('directories: %s', directories[:100])
+        if not options:
+            return {'directories': directories, 'entries': entries}
+        # Generate properties for each entry
+        properties = {}
+        for name in entries:
+            e = matches[name]
+            properties[name] = {}
+            properties[name]['timestamp'] = datetime.datetime.strptime(e.group('timestamp'), '%Y/%m/%d %H:%M:%S').isoformat()
+            if e.group('type') == '-':
+                properties[name]['size'] = int(e.group('size').replace(',', ''))
+        return {'directories': directories, 'entries': entries,
+                'properties': properties, 'next_cursor': next_cursor}
 
     def _delete_path_local(self, delete_path):
         """
@@ -686,37 +929,195 @@ class PosixMoveUnsupportedError(Exception):
     pass
 
 
-def path2browse_dict(path):
+def rsync_file_lists(source, count):
+    """ Splits the files in the local directory source into at most count
+    lists of similar total size, to be copied with rsync --files-from.
+
+    Paths are relative to the returned root directory and copied like
+    rsync -r source would: if source does not end with /, they start with its
+    basename. The first list also contains all the directories, so empty
+    ones are copied. Symbolic links and special files are skipped.
+
+    :returns: Tuple of the root directory and the lists of paths.
+    """
+    if source.endswith('/'):
+        root, prefix = source, '.'
+    else:
+        root, prefix = os.path.dirname(source), os.path.basename(source)
+        root = os.path.join(root or '.', '')
+    directories = []
+    files = []
+    for dirpath, _dirnames, filenames in os.walk(source):
+        relative = os.path.normpath(os.path.join(prefix, os.path.relpath(dirpath, source)))
+        directories.append(relative)
+        for filename in filenames:
+            file_stat = os.lstat(os.path.join(dirpath, filename))
+            if stat.S_ISREG(file_stat.st_mode):
+                files.append((file_stat.st_size, os.path.join(relative, filename)))
+    # Assign the largest files first to the smallest list
+    heap = [(0, i, []) for i in range(max(1, min(count, len(files))))]
+    for size, path in sorted(files, reverse=True):
+        total, i, paths = heapq.heappop(heap)
+        paths.append(path)
+        heapq.heappush(heap, (total + size, i, paths))
+    shards = [shard[2] for shard in sorted(heap, key=lambda shard: shard[1])]
+    shards[0] = directories + shards[0]
+    return root, shards
+
+
+def path2browse_dict(path, **options):
     """Given a path on disk, return a dict with keys for directories, entries
     and properties.
+
+    The object counts of directories are computed in parallel. If
+    settings.OBJECT_COUNT_TIMEOUT is set, directories whose count is not
+    ready by then have no 'object count' property; the count is still
+    cached for the following requests.
+
+    :param options: Pagination options (see common.browse). Only the entries
+        in the page are stat'ed and counted.
     """
     properties = {}
-    # Sorted list of all entries in directory, excluding hidden files
-    entries = [name for name in os.listdir(path) if name[0] != '.']
-    entries = sorted(entries, key=lambda s: s.lower())
+    counting_disabled = utils.get_setting('object_counting_disabled', False)
+    # All entries in directory, excluding hidden files
+    entries = dict((entry.name, entry) for entry in scandir.scandir(path)
+                   if entry.name[0] != '.')
+    if options:
+        names, next_cursor = browse.paginate(entries, **options)
+    else:
+        names = sorted(entries, key=lambda s: s.lower())
     directories = []
-    for name in entries:
-        full_path = os.path.join(path, name)
-        properties[name] = {'size': os.path.getsize(full_path)}
-        if utils.get_setting('object_counting_disabled', False):
+    for name in names:
+        entry = entries[name]
+        try:
+            size = entry.stat().st_size
+        except OSError:  # Broken symlink
+            size = entry.stat(follow_symlinks=False).st_size
+        properties[name] = {'size': size}
+        if counting_disabled:
             properties[name]['object count'] = '0+'
-        elif os.path.isdir(full_path) and os.access(full_path, os.R_OK):
+        elif entry.is_dir() and os.access(entry.path, os.R_OK):
             directories.append(name)
-            properties[name]['object count'] = count_objects_in_directory(
-                full_path)
-    return {'directories': directories,
-            'entries': entries,
-            'properties': properties}
+    if directories:
+        counts = OBJECT_COUNTER.count_all(
+            [os.path.join(path, name) for name in directories],
+            timeout=settings.OBJECT_COUNT_TIMEOUT)
+        for name in directories:
+            count = counts.get(os.path.join(path, name))
+            if count is not None:
+                properties[name]['object count'] = count
+    result = {'directories': directories,
+              'entries': names,
+              'properties': properties}
+    if options:
+        result['next_cursor'] = next_cursor
+    return result
 
 
 def count_objects_in_directory(path):
     """
     Returns all the files in a directory, including children.
     """
-    total_files = 0
-    for root, dirs, files in os.walk(path):
-        total_files += len(files)
-        # Limit the number of files counted to keep it from being too slow
-        if total_files > 5000:
-            return '5000+'
-    return total_files
+    return OBJECT_COUNTER.count(path)
+
+
+class _ObjectCounter(object):
+    """
+    Counts the files in local directory trees, up to LIMIT.
+
+    The number of files and the subdirectories of each directory visited are
+    cached until its mtime changes, so counting a tree again only stats its
+    directories. The cache is per process and forgotten when it holds
+    MAX_DIRECTORIES directories.
+    """
+
+    LIMIT = 5000
+    MAX_DIRECTORIES = 100000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._directories = {}  # path: (stat signature, file count, subdirs)
+        self._executor = None
+        self._pending = {}  # path: future of the count in progress
+
+    def _scan(self, path):
+        """Return the number of files and the subdirectories of path."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return 0, []
+        signature = (st.st_ino, st.st_mtime)
+        with self._lock:
+            cached = self._directories.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+        files, subdirs = 0, []
+        try:
+            for entry in scandir.scandir(path):
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                # Like os.walk, symlinks to directories are neither counted
+                # nor followed
+                if not is_dir:
+                    files += 1
+                elif not entry.is_symlink():
+                    subdirs.append(entry.path)
+        except OSError:
+            pass
+        with self._lock:
+            if len(self._directories) >= self.MAX_DIRECTORIES:
+                self._directories.clear()
+            self._directories[path] = (signature, files, subdirs)
+        return files, subdirs
+
+    def count(self, path):
+        """
+        Return the number of files in path and its subdirectories, or
+        '<LIMIT>+' if there are more than LIMIT.
+        """
+        total = 0
+        pending = [path]
+        while pending:
+            files, subdirs = self._scan(pending.pop())
+            total += files
+            # Limit the number of files counted to keep it from being too slow
+            if total > self.LIMIT:
+                return '{}+'.format(self.LIMIT)
+            pending.extend(subdirs)
+        return total
+
+    def _submit(self, path):
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=settings.OBJECT_COUNT_CONCURRENCY)
+            future = self._pending.get(path)
+            if future is not None:
+                return future
+            future = self._pending[path] = self._executor.submit(
+                self.count, path)
+        # Outside of the lock, since the callback runs right away in this
+        # thread if the count is already done
+        future.add_done_callback(lambda future: self._done(path))
+        return future
+
+    def _done(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def count_all(self, paths, timeout=None):
+        """
+        Count the files in each of paths in parallel.
+
+        :param float timeout: Seconds to wait for the counts, or None to wait
+            until they are all done.
+        :returns: Dict of path: count, without the paths not counted in time.
+        """
+        jobs = dict((self._submit(path), path) for path in paths)
+        done, _not_done = futures.wait(jobs, timeout=timeout)
+        return dict((jobs[future], future.result()) for future in done)
+
+
+OBJECT_COUNTER = _ObjectCounter()
@@ -11,7 +11,7 @@ from django.utils.translation import ugettext_lazy as _
 import swiftclient
 
 # This project, alphabetical
-from common import utils
+from common import browse, throttle, utils
 
 # This module, alphabetical
 from . import StorageException
@@ -47,6 +47,9 @@ class Swift(models.Model):
         verbose_name = _("Swift")
         app_label = 'locations'
 
+    # Browse lists one page at a time (see Space.browse)
+    PAGINATED_BROWSE = True
+
     ALLOWED_LOCATION_PURPOSE = [
         Location.AIP_STORAGE,
         Location.DIP_STORAGE,
@@ -54,6 +57,8 @@ class Swift(models.Model):
         Location.BACKLOG,
     ]
 
+    BUFFER_SIZE = 1024 * 1024  # 1 MB
+
     def __init__(self, *args, **kwargs):
         super(Swift, self).__init__(*args, **kwargs)
         self._connection = None
@@ -71,7 +76,7 @@ class Swift(models.Model):
             )
         return self._connection
 
-    def browse(self, path):
+    def browse(self, path, **options):
         """
         Returns information about the files and simulated-folders in Duracloud.
 
@@ -84,6 +89,11 @@ class Swift(models.Model):
         # Can only browse directories. Add a trailing / to make Swift happy
         if not path.endswith('/'):
             path += '/'
+        if options.get('order_by') == '-name':
+            # Objects can only be listed in ascending order
+            return browse.paginate_results(self.browse(path), **options)
+        if options:
+            return self._browse_page(path, **options)
         _, content = self.connection.get_container(self.container, delimiter='/', prefix=path)
         # Replace path, strip trailing /, sort
         entries = []
@@ -111,6 +121,59 @@ class Swift(models.Model):
             'properties': properties,
         }
 
+    def _browse_page(self, path, limit=None, cursor=None, name_prefix=None,
+                     order_by='name'):
+        """
+        Return one page of the entries of ``path`` in name order, listing the
+        container only until the page is full.
+
+        The cursor is the last object name of the previous page, relative to
+        path.
+        """
+        path = utils.coerce_str(path)
+        marker = path + cursor if cursor else None
+        directories = []
+        entries = []
+        properties = {}
+        last = None
+        while True:
+            _, content = self.connection.get_container(
+                self.container, delimiter='/', prefix=path + (name_prefix or ''),
+                marker=marker, limit=limit and limit + 1)
+            if not content:
+                break
+            for entry in content:
+                if limit is not None and len(entries) == limit:
+                    return {
+                        'directories': directories,
+                        'entries': entries,
+                        'properties': properties,
+                        'next_cursor': last,
+                    }
+                if 'subdir' in entry:  # Directories
+                    marker = entry['subdir']
+                    basename = os.path.basename(marker.rstrip('/'))
+                    directories.append(basename)
+                    last = utils.coerce_str(basename) + browse.AFTER_DIRECTORY
+                elif 'name' in entry:  # Files
+                    marker = entry['name']
+                    basename = os.path.basename(marker)
+                    properties[basename] = {
+                        'size': entry['bytes'],
+                        'timestamp': entry['last_modified'],
+                    }
+                    last = utils.coerce_str(basename)
+                else:
+                    LOGGER.warning('%s is neither a file nor a directory.', entry)
+                    continue
+                entries.append(basename)
+        return {
+            'directories': directories,
+            'entries': entries,
+            'properties': properties,
+            'next_cursor': None,
+        }
+
     def delete_path(self, delete_path):
         # Try to delete object
         try:
@@ -136,11 +199,13 @@ class Swift(models.Model):
         :param str download_path: Full path to save the file to
         :raises: swiftclient.exceptions.ClientException may be raised and is not caught
         """
-        # TODO find a way to stream content to dest_path, instead of having to put it in memory
-        headers, content = self.connection.get_object(self.container, remote_path)
+        headers, content = self.connection.get_object(
+            self.container, remote_path, resp_chunk_size=self.BUFFER_SIZE)
         self.space.create_local_directory(download_path)
         with open(download_path, 'wb') as f:
-            f.write(content)
+            for data in content:
+                self.space.limiter.read.consume(len(data))
+                f.write(data)
         # Check ETag matches checksum of this file
         if 'etag' in headers:
             checksum = utils.generate_checksum(download_path)
@@ -174,6 +239,7 @@ class Swift(models.Model):
 
     def move_from_storage_service(self, source_path, destination_path, package=None):
         """ Moves self.staging_path/src_path to dest_path. """
+        consume = self.space.limiter.write.consume
         if os.path.isdir(source_path):
             # Both source and destination paths should end with /
             destination_path = os.path.join(destination_path, '')
@@ -187,7 +253,7 @@ class Swift(models.Model):
                         self.connection.put_object(
                             self.container,
                             obj=dest,
-                            contents=f,
+                            contents=throttle.ThrottledReader(f, consume),
                             etag=checksum.hexdigest(),
                             content_length=os.path.getsize(entry)
                         )
@@ -197,7 +263,7 @@ class Swift(models.Model):
                 self.connection.put_object(
                     self.container,
                     obj=destination_path,
-                    contents=f,
+                    contents=throttle.ThrottledReader(f, consume),
                     etag=checksum.hexdigest(),
                     content_length=os.path.getsize(source_path),
                 )
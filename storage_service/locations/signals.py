@@ -49,7 +49,7 @@ def _log_report(uuid, success, message=None):
     # imported in models.__init__.py and seems to cause a circular import error
     from . import models
     package = models.Package.objects.get(uuid=uuid)
-    models.FixityLog.objects.create(package=package, success=success, error_details=message)
+    package.record_fixity_check(success, message)
 
 
 @receiver(failed_fixity_check, dispatch_uid="fixity_check")
@@ -2,10 +2,14 @@ import base64
 import json
 import os
 import shutil
+import tempfile
+import mock
 import vcr
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.six.moves.urllib.parse import urlparse
 
 from locations import models
@@ -51,6 +55,24 @@ class TestSpaceAPI(TestCase):
         protocol_model = models.S3.objects.get(space_id=response_data['uuid'])
         assert protocol_model.endpoint_url == data['endpoint_url']
 
+    def test_browse_paginated(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for name in ('a', 'b', 'c'):
+            open(os.path.join(path, name), 'w').close()
+        url = '/api/v2/space/7d20c992-bc92-4f92-a794-7161ff2cc08b/browse/'
+
+        response = self.client.get(url, {'path': path, 'limit': 2})
+        first = json.loads(response.content)
+        response = self.client.get(url, {'path': path, 'limit': 2, 'cursor': first['next_cursor']})
+        second = json.loads(response.content)
+
+        assert map(base64.b64decode, first['entries']) == ['a', 'b']
+        assert map(base64.b64decode, second['entries']) == ['c']
+        assert second['next_cursor'] is None
+        response = self.client.get(url, {'path': path, 'order_by': 'size'})
+        assert response.status_code == 400
+
 
 class TestLocationAPI(TestCase):
 
@@ -236,6 +258,25 @@ class TestPackageAPI(TestCase):
         assert body[0]['relative_path'] == path
         assert body[0]['fileuuid'] == '86bfde11-e2a1-4ee7-b98d-9556b5f05198'
 
+    def test_file_data_searches_relative_path_prefix_by_page(self):
+        package = models.Package.objects.get(uuid='79245866-ca80-4f84-b904-a02b3e0ab621')
+        for name in ('test_sip/objects/a.txt', 'test_sip/objects/b.txt', 'test_sip_2/c.txt'):
+            models.File.objects.create(package=package, name=name, source_id='', checksum='')
+        names = []
+        data = {'relative_path_prefix': 'test_sip/objects/', 'limit': 2}
+        url = '/api/v2/file/metadata/'
+        while url:
+            response = self.client.get(url, data)
+            assert response.status_code == 200
+            names += [f['relative_path'] for f in json.loads(response.content)]
+            url = response.get('Link', '')[1:-len('>; rel="next"')]
+            data = None
+        assert sorted(names) == ['test_sip/objects/a.txt', 'test_sip/objects/b.txt',
+                                 'test_sip/objects/file.txt', 'test_sip/objects/file.txt']
+
+        response = self.client.get('/api/v2/file/metadata/', {'relative_path_prefix': 'test', 'limit': 'x'})
+        assert response.status_code == 400
+
     def test_file_data_returns_bad_response_with_no_accepted_parameters(self):
         response = self.client.post('/api/v2/file/metadata/')
         assert response.status_code == 400
@@ -248,7 +289,7 @@ class TestPackageAPI(TestCase):
         response = self.client.get('/api/v2/file/e0a41934-c1d7-45ba-9a95-a7531c063ed1/contents/')
         assert response.status_code == 200
         assert response['content-type'] == 'application/json'
-        body = json.loads(response.content)
+        body = json.loads(b''.join(response.streaming_content))
         assert body['success'] is True
         assert len(body['files']) == 1
         assert body['files'][0]['name'] == 'test_sip/objects/file.txt'
@@ -310,6 +351,61 @@ class TestPackageAPI(TestCase):
         assert response.status_code == 201
         assert p.file_set.count() == 2
 
+    def test_adding_files_to_package_in_batches(self):
+        p = models.Package.objects.get(uuid="79245866-ca80-4f84-b904-a02b3e0ab621")
+        body = [{
+            "relative_path": "transfer/{}.txt".format(i),
+            "fileuuid": "7bffcce7-63f5-4b2e-af57-d266bfa2e3eb",
+            "accessionid": "",
+            "sipuuid": "79245866-ca80-4f84-b904-a02b3e0ab621",
+            "origin": "36398145-6e49-4b5b-af02-209b127f2726",
+        } for i in range(5)]
+        url = '/api/v2/file/79245866-ca80-4f84-b904-a02b3e0ab621/contents/'
+
+        with mock.patch('locations.api.resources.FILE_BATCH_SIZE', 2):
+            # Nothing is added if a file is not valid
+            del body[4]['origin']
+            response = self.client.put(url, data=json.dumps(body),
+                                       content_type="application/json")
+            assert response.status_code == 400
+            assert p.file_set.count() == 0
+
+            body[4]['origin'] = "36398145-6e49-4b5b-af02-209b127f2726"
+            response = self.client.put(url, data=json.dumps(body),
+                                       content_type="application/json")
+            assert response.status_code == 201
+            assert p.file_set.count() == 5
+            assert len(set(p.file_set.values_list('uuid', flat=True))) == 5
+
+            response = self.client.get(url)
+            files = json.loads(b''.join(response.streaming_content))['files']
+            assert sorted(f['name'] for f in files) == sorted(f['relative_path'] for f in body)
+
+    def test_adding_files_to_package_async(self):
+        p = models.Package.objects.get(uuid="79245866-ca80-4f84-b904-a02b3e0ab621")
+        body = [{
+            "relative_path": "empty-transfer-79245866-ca80-4f84-b904-a02b3e0ab621/1.txt",
+            "fileuuid": "7bffcce7-63f5-4b2e-af57-d266bfa2e3eb",
+            "accessionid": "",
+            "sipuuid": "79245866-ca80-4f84-b904-a02b3e0ab621",
+            "origin": "36398145-6e49-4b5b-af02-209b127f2726",
+        }]
+        results = []
+
+        def run_task(task):
+            # Run in the test thread, which has the test database
+            results.append(task())
+            return models.Async.objects.create()
+
+        with mock.patch('locations.api.resources.AsyncManager.run_task', side_effect=run_task):
+            response = self.client.put('/api/v2/file/79245866-ca80-4f84-b904-a02b3e0ab621/contents/async/',
+                                       data=json.dumps(body),
+                                       content_type="application/json")
+        assert response.status_code == 202
+        assert '/api/v2/async/' in response['Location']
+        assert results == ['1 files created in package 79245866-ca80-4f84-b904-a02b3e0ab621']
+        assert p.file_set.count() == 1
+
     def test_removing_file_from_package(self):
         p = models.Package.objects.get(uuid="a59033c2-7fa7-41e2-9209-136f07174692")
         assert p.file_set.count() == 1
@@ -416,6 +512,62 @@ class TestPackageAPI(TestCase):
         assert j['error'] is True
         assert 'Error' in j['message'] and 'Arkivum' in j['message']
 
+    def test_list_paginated_by_cursor(self):
+        # The API requires an origin pipeline
+        models.Package.objects.update(origin_pipeline='7691b4bc-b76a-411c-b6a2-d16964018220')
+        ids = list(models.Package.objects.order_by('id').values_list('id', flat=True))
+        uuids = []
+        data = {'cursor': '', 'limit': 4}
+        while True:
+            response = self.client.get('/api/v2/file/', data)
+            assert response.status_code == 200
+            body = json.loads(response.content)
+            assert 'total_count' not in body['meta']
+            uuids += [package['uuid'] for package in body['objects']]
+            if body['meta']['next'] is None:
+                break
+            query = urlparse(body['meta']['next']).query
+            assert 'cursor=' + body['meta']['next_cursor'] in query
+            data['cursor'] = body['meta']['next_cursor']
+        assert uuids == [models.Package.objects.get(id=id_).uuid for id_ in ids]
+
+        response = self.client.get('/api/v2/file/', {'cursor': 'x'})
+        assert response.status_code == 400
+        response = self.client.get('/api/v2/file/', {'cursor': '', 'order_by': 'size'})
+        assert response.status_code == 400
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        # The API requires an origin pipeline
+        models.Package.objects.update(origin_pipeline='7691b4bc-b76a-411c-b6a2-d16964018220')
+        models.Package.objects.get(uuid='6aebdb24-1b6b-41ab-b4a3-df9a73726a34').related_packages.add(
+            models.Package.objects.get(uuid='e0a41934-c1d7-45ba-9a95-a7531c063ed1'))
+        # The first request also loads what is cached for the following ones
+        self.client.get('/api/v2/file/', {'cursor': '', 'limit': 1})
+        counts = []
+        for limit in (1, 9):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/v2/file/', {'cursor': '', 'limit': limit})
+            assert response.status_code == 200
+            assert len(json.loads(response.content)['objects']) == limit
+            counts.append(len(queries))
+        assert counts[0] == counts[1]
+
+    def test_list_filtered_by_latest_fixity_check(self):
+        # The API requires an origin pipeline
+        models.Package.objects.update(origin_pipeline='7691b4bc-b76a-411c-b6a2-d16964018220')
+        response = self.client.get('/api/v2/file/', {'latest_fixity_check_result': 'true'})
+        assert response.status_code == 200
+        objects = json.loads(response.content)['objects']
+        assert [p['uuid'] for p in objects] == ['e0a41934-c1d7-45ba-9a95-a7531c063ed1']
+        assert objects[0]['latest_fixity_check_result'] is True
+        assert objects[0]['fixity_failure_count'] == 0
+
+        response = self.client.get('/api/v2/file/', {
+            'latest_fixity_check_datetime__isnull': 'true'})
+        uuids = [p['uuid'] for p in json.loads(response.content)['objects']]
+        assert len(uuids) == models.Package.objects.count() - 1
+        assert 'e0a41934-c1d7-45ba-9a95-a7531c063ed1' not in uuids
+
 
 class TestSwordAPI(TestCase):
 
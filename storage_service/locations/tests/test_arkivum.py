@@ -1,3 +1,4 @@
+import mock
 import os
 import requests
 import shutil
@@ -178,3 +179,31 @@ class TestArkivum(TestCase):
         self.arkivum_object.update_package_status(self.uncompressed_package)
         # Verify UPLOADED
         assert self.uncompressed_package.status == models.Package.UPLOADED
+
+    def test_status_poller(self):
+        for package in (self.package, self.uncompressed_package):
+            package.misc_attributes.update({'arkivum_identifier': package.uuid})
+            package.save()
+        states = {
+            self.package.uuid: ['amber', 'amber', 'green'],
+            self.uncompressed_package.uuid: [None, 'amber', 'amber'],
+        }
+
+        def replication_state(arkivum, package, is_compressed):
+            state = states[package.uuid].pop(0)
+            return (state, None if state else 'error')
+
+        poller = models.arkivum.ArkivumStatusPoller(interval=10, max_interval=15)
+        with mock.patch.object(models.Package, 'is_compressed',
+                               new_callable=mock.PropertyMock, return_value=True), \
+                mock.patch.object(models.Arkivum, '_get_replication_state',
+                                  autospec=True, side_effect=replication_state):
+            assert poller.poll(now=0) == {'uploaded': 0, 'pending': 2, 'errors': 1}
+            # Not due yet
+            assert poller.poll(now=5) == {'uploaded': 0, 'pending': 2, 'errors': 0}
+            assert poller.poll(now=10) == {'uploaded': 0, 'pending': 2, 'errors': 0}
+            # The interval doubled, but is capped at max_interval
+            assert poller.poll(now=20) == {'uploaded': 0, 'pending': 2, 'errors': 0}
+            assert poller.poll(now=25) == {'uploaded': 1, 'pending': 1, 'errors': 0}
+        assert models.Package.objects.get(uuid=self.package.uuid).status == models.Package.UPLOADED
+        assert models.Package.objects.get(uuid=self.uncompressed_package.uuid).status == models.Package.STAGING
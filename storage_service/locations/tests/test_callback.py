@@ -0,0 +1,69 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+import mock
+import requests
+
+from locations import models
+from locations.models import event
+
+
+class TestCallback(TestCase):
+
+    def setUp(self):
+        self.callback = models.Callback.objects.create(
+            uri='http://example.com/api/file/<source_id>/',
+            event='post_store', method='post', expected_status=201)
+
+    def create_files(self, count):
+        return [models.File.objects.create(
+            name='file{}'.format(i), source_id='source{}'.format(i),
+            checksum='checksum{}'.format(i)) for i in range(count)]
+
+    @override_settings(HTTP_MAX_RETRIES=2, HTTP_RETRY_BACKOFF=0)
+    def test_execute_retries_connection_errors(self):
+        session = mock.Mock()
+        session.request.side_effect = [
+            requests.exceptions.ConnectionError('refused'),
+            requests.exceptions.ConnectTimeout('timed out'),
+            mock.Mock(status_code=201),
+        ]
+        with mock.patch('common.http_client.get_session', return_value=session):
+            self.callback.execute_with_retries()
+        assert session.request.call_count == 3
+
+        for error in (mock.Mock(status_code=503, text='unavailable'),
+                      requests.exceptions.ReadTimeout('timed out')):
+            session.request.reset_mock()
+            session.request.side_effect = [error, mock.Mock(status_code=201)]
+            with mock.patch('common.http_client.get_session', return_value=session):
+                with self.assertRaises(models.CallbackError) as cm:
+                    self.callback.execute_with_retries()
+            assert not cm.exception.retryable
+            assert session.request.call_count == 1
+
+    @override_settings(CALLBACK_CONCURRENCY=3)
+    def test_send_post_store_callbacks(self):
+        files = self.create_files(7)
+        failing = 'http://example.com/api/file/source3/'
+        progress = mock.Mock()
+
+        def execute(url):
+            if url == failing:
+                raise models.CallbackError('failed')
+
+        checksums = [f.checksum for f in files] * 2 + ['unknown']
+        with mock.patch.object(event, 'CHECKSUMS_PER_QUERY', 3), \
+                mock.patch.object(models.Callback, 'execute_with_retries', side_effect=execute) as execute_mock:
+            with self.assertNumQueries(6):
+                failures = models.send_post_store_callbacks(
+                    [self.callback], checksums, progress)
+
+        assert failures == 1
+        assert execute_mock.call_count == 7
+        assert set(models.File.objects.filter(stored=False).values_list('source_id', flat=True)) == {'source3'}
+        assert progress.call_args_list == [mock.call(3, 8), mock.call(6, 8), mock.call(8, 8)]
+
+        # Files already stored are skipped
+        with mock.patch.object(models.Callback, 'execute_with_retries') as execute_mock:
+            models.send_post_store_callbacks([self.callback], checksums)
+        execute_mock.assert_called_once_with(failing)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from django.test import TestCase
+import mock
 import os
 import shutil
 import vcr
@@ -99,6 +100,50 @@ class TestDataverse(TestCase):
         assert 'agents.json' in os.listdir(os.path.join(self.dest_path, 'metadata'))
         assert 'dataset.json' in os.listdir(os.path.join(self.dest_path, 'metadata'))
 
+    @vcr.use_cassette(os.path.join(FIXTURES_DIR, 'vcr_cassettes', 'dataverse_move_to.yaml'))
+    def test_move_to_checksum_mismatch(self):
+        """
+        It should retry files whose md5 does not match.
+        It should raise and remove the file if the md5 never matches.
+        """
+        # The other files are downloaded at the same time, so only the
+        # attempts of this one are counted
+        download_once = models.Dataverse._download_file_once
+        with mock.patch('time.sleep'), \
+                mock.patch.object(models.Dataverse, '_get_md5',
+                                  return_value='d41d8cd98f00b204e9800998ecf8427e'), \
+                mock.patch.object(models.Dataverse, '_download_file_once',
+                                  autospec=True, side_effect=download_once) as download:
+            with self.assertRaises(models.StorageException):
+                self.dataverse.space.move_to_storage_service('90', 'dataverse/', self.space)
+        attempts = [c for c in download.call_args_list
+                    if c[0][2].endswith('chelan 052.jpg')]
+        assert len(attempts) == models.Dataverse.RETRY_ATTEMPTS + 1
+        assert 'chelan 052.jpg' not in os.listdir(self.dest_path)
+
+    def test_download_file_retries(self):
+        """It should retry failed downloads and verify the md5."""
+        os.makedirs(self.dest_path)
+        download_path = os.path.join(self.dest_path, 'file.txt')
+        ok = mock.Mock(status_code=200, iter_content=lambda size: [b'abc', b'def'])
+        session = mock.Mock(**{'get.side_effect': [mock.Mock(status_code=503), ok]})
+        with mock.patch('time.sleep') as sleep, \
+                mock.patch.object(models.Dataverse, 'session', session):
+            self.dataverse._download_file(
+                'https://example.com/file', download_path, {},
+                md5='e80b5017098950fc58aad83c8c14978e')
+        sleep.assert_called_once_with(models.Dataverse.RETRY_BACKOFF)
+        with open(download_path) as f:
+            assert f.read() == 'abcdef'
+
+    def test_get_md5(self):
+        assert self.dataverse._get_md5({'md5': 'abc'}) == 'abc'
+        assert self.dataverse._get_md5(
+            {'checksum': {'type': 'MD5', 'value': 'abc'}}) == 'abc'
+        assert self.dataverse._get_md5(
+            {'checksum': {'type': 'SHA-1', 'value': 'abc'}}) is None
+        assert self.dataverse._get_md5({}) is None
+
     def test_get_query_and_subtree(self):
         """Test the function that we're using to construct parts of the
         Dataverse query from the relative_path string stored in the Storage
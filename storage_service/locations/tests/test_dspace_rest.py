@@ -364,7 +364,7 @@ def test_move_from_storage_service(mocker, package, ds_aip_collection,
     mocker.patch('__builtin__.open')
     mocker.patch('os.listdir', return_value=[AIP_METS_FILENAME])
 
-    # Patch ``requests.post``
+    # Patch ``requests.Session.post``
     def mock_requests_post(*args, **kwargs):
         if ((not ds_request_validity.is_valid) and
                 (ds_request_validity.url_substr in args[0])):
@@ -372,7 +372,7 @@ def test_move_from_storage_service(mocker, package, ds_aip_collection,
                 return FakeDSpaceRESTPOSTResponse(_raise=ds_request_validity.exc)
             raise ds_request_validity.exc
         return FakeDSpaceRESTPOSTResponse()
-    mocker.patch('requests.post', side_effect=mock_requests_post)
+    mocker.patch('requests.Session.post', side_effect=mock_requests_post)
 
     # Patch ``agentarchives.archivesspace.ArchivesSpaceClient``
     if ((not as_credentials_valid.is_valid) and
@@ -419,7 +419,7 @@ def test_move_from_storage_service(mocker, package, ds_aip_collection,
     dspace_rest_space.move_from_storage_service(
         package_source_path, AIP_DEST_PATH, package=package)
 
-    # Assertions about the 4 requests.post calls:
+    # Assertions about the 4 requests.Session.post calls:
     # 1. login to DSpace,
     # 2. create a DSpace item
     # 3. deposit a file to DSpace (.7z file for AIP; METS.xml file for DIP,
@@ -428,7 +428,7 @@ def test_move_from_storage_service(mocker, package, ds_aip_collection,
     (actual_login_call,
      (_, actual_create_item_args, actual_create_item_kwargs),
      (_, actual_bitstream_args, actual_bitstream_kwargs),
-     actual_logout_call) = requests.post.mock_calls
+     actual_logout_call) = requests.Session.post.mock_calls
     assert actual_login_call == mocker.call(
         DS_REST_LOGIN_URL,
         cookies=None,
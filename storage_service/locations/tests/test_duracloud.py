@@ -1,12 +1,16 @@
 
+import hashlib
 from lxml import etree
+import mock
 import os
 import requests
 
 from django.test import TestCase
+from django.test.utils import override_settings
 import vcr
 
 from locations import models
+from locations.models import duracloud
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 FIXTURES_DIR = os.path.abspath(os.path.join(THIS_DIR, '..', 'fixtures'))
@@ -19,6 +23,7 @@ class TestDuracloud(TestCase):
     def setUp(self):
         self.ds_object = models.Duracloud.objects.all()[0]
         self.auth = requests.auth.HTTPBasicAuth(self.ds_object.user, self.ds_object.password)
+        duracloud.LISTING_CACHE.clear()
 
         # Move to a location that is writeable
         self.old_dir = os.getcwd()
@@ -56,6 +61,62 @@ class TestDuracloud(TestCase):
         assert resp['directories'] == []
         assert resp['entries'] == ['chunked_image.jpg']
 
+    def test_listing_cache(self):
+        listing = etree.Element('space')
+        for path in ('dir/a.txt', 'dir/sub/b.txt', 'dir/sub/c.txt.dura-manifest',
+                     'dir/sub/c.txt.dura-chunk-0000', 'dir/sub/c.txt.dura-chunk-0001'):
+            etree.SubElement(listing, 'item').text = path
+        pages = [etree.tostring(listing), etree.tostring(etree.Element('space'))]
+
+        def get(url, params):
+            return mock.Mock(status_code=200, content=pages[1 if 'marker' in params else 0])
+        with mock.patch.object(self.ds_object.session, 'get', side_effect=get) as mock_get:
+            assert self.ds_object.browse('dir')['entries'] == ['a.txt', 'sub']
+            # Longer prefixes are answered from the listing of 'dir/'
+            assert self.ds_object.browse('dir/sub')['entries'] == ['b.txt', 'c.txt']
+            assert sorted(self.ds_object._get_files_list('dir/sub/c.txt')) == [
+                'dir/sub/c.txt.dura-chunk-0000', 'dir/sub/c.txt.dura-chunk-0001', 'dir/sub/c.txt.dura-manifest']
+            assert mock_get.call_count == 2
+            # Uploads and deletes are reflected without listing again
+            with mock.patch.object(self.ds_object.session, 'put', return_value=mock.Mock(status_code=201)):
+                self.ds_object.move_from_storage_service(os.path.join(FIXTURES_DIR, 'chunk_file.txt'), 'dir/new.txt')
+            with mock.patch.object(self.ds_object.session, 'delete', return_value=mock.Mock(status_code=204)):
+                self.ds_object.delete_path('dir/a.txt')
+            assert self.ds_object.browse('dir')['entries'] == ['new.txt', 'sub']
+            assert mock_get.call_count == 2
+            # Without the cache, the files are listed every time
+            with override_settings(DURACLOUD_LISTING_CACHE_TTL=0):
+                assert self.ds_object.browse('dir')['entries'] == ['a.txt', 'sub']
+            assert mock_get.call_count == 4
+
+    @override_settings(DURACLOUD_LISTING_CACHE_TTL=0)
+    def test_browse_paginated(self):
+        paths = ['dir/a.txt', 'dir/b-c.txt', 'dir/b.txt.dura-chunk-0000',
+                 'dir/b.txt.dura-manifest', 'dir/sub/c.txt', 'dir/sub/d.txt', 'dir/z.txt']
+        markers = []
+
+        def get(url, params):
+            markers.append(params.get('marker'))
+            listing = etree.Element('space')
+            for path in paths:
+                if path > params.get('marker', ''):
+                    etree.SubElement(listing, 'item').text = path
+            return mock.Mock(status_code=200, content=etree.tostring(listing))
+        with mock.patch.object(self.ds_object.session, 'get', side_effect=get):
+            first = self.ds_object.browse('dir', limit=3)
+            second = self.ds_object.browse('dir', limit=3, cursor=first['next_cursor'])
+
+        assert first['entries'] == ['a.txt', 'b-c.txt', 'b.txt']
+        assert first['next_cursor'] == 'b.txt.dura-manifest'
+        # Stops listing once the page is full
+        assert markers[:2] == [None, 'dir/b.txt.dura-manifest']
+        assert second == {
+            'entries': ['sub', 'z.txt'],
+            'directories': ['sub'],
+            'properties': {'sub': {'object count': 2}},
+            'next_cursor': None,
+        }
+
     @vcr.use_cassette(os.path.join(FIXTURES_DIR, 'vcr_cassettes', 'duracloud_delete_file.yaml'))
     def test_delete_file(self):
         # Verify exists
@@ -244,6 +305,107 @@ class TestDuracloud(TestCase):
         requests.delete('https://' + self.ds_object.host + '/durastore/' + self.ds_object.duraspace + '/chunked/chunked_image.txt.dura-chunk-0000', auth=self.auth)
         requests.delete('https://' + self.ds_object.host + '/durastore/' + self.ds_object.duraspace + '/chunked/chunked_image.txt.dura-chunk-0001', auth=self.auth)
 
+    @override_settings(DURACLOUD_CONCURRENCY=3)
+    def test_upload_chunked_file_concurrently(self):
+        file_path = os.path.join(FIXTURES_DIR, 'chunk_file.txt')
+        with open(file_path, 'rb') as f:
+            contents = f.read()
+        fixtures_before = sorted(os.listdir(FIXTURES_DIR))
+        self.ds_object.CHUNK_SIZE = 4 * 1024
+        uploaded = {}
+
+        def put(url, data):
+            uploaded[url] = data.read() if hasattr(data, 'read') else data
+            return mock.Mock(status_code=201)
+
+        url = self.ds_object.duraspace_url + 'chunked/chunked.txt'
+        with mock.patch.object(self.ds_object.session, 'put', side_effect=put):
+            self.ds_object.move_from_storage_service(file_path, 'chunked/chunked.txt')
+        # No temporary chunk or manifest files are left next to the source
+        assert sorted(os.listdir(FIXTURES_DIR)) == fixtures_before
+        chunks = [uploaded[url + '.dura-chunk-%04d' % i] for i in range(3)]
+        assert [len(c) for c in chunks] == [4096, 4096, 2845]
+        assert b''.join(chunks) == contents
+        # Manifest built from the hashes calculated while uploading
+        root = etree.fromstring(uploaded[url + '.dura-manifest'])
+        assert root.find('header/sourceContent/byteSize').text == '11037'
+        assert root.find('header/sourceContent/md5').text == hashlib.md5(contents).hexdigest()
+        for chunk, chunk_e in zip(chunks, root.find('chunks')):
+            assert chunk_e.find('byteSize').text == str(len(chunk))
+            assert chunk_e.find('md5').text == hashlib.md5(chunk).hexdigest()
+
+    def test_upload_chunk_retries_with_backoff(self):
+        self.ds_object.RETRY_BACKOFF = 0.5
+        responses = [mock.Mock(status_code=500), mock.Mock(status_code=500), mock.Mock(status_code=201)]
+        with mock.patch.object(self.ds_object.session, 'put', side_effect=responses) as put, \
+                mock.patch('time.sleep') as sleep:
+            self.ds_object._upload_chunk(self.ds_object.duraspace_url + 'test.txt', os.path.join(FIXTURES_DIR, 'chunk_file.txt'))
+        assert put.call_count == 3
+        assert sleep.mock_calls == [mock.call(0.5), mock.call(1.0)]
+
+    def _mock_chunked_get(self, url, chunks):
+        """Return a fake session.get serving ``chunks`` as a chunked file."""
+        manifest = etree.Element('{duracloud.org}chunksManifest', nsmap={'dur': 'duracloud.org'})
+        content = etree.SubElement(etree.SubElement(manifest, 'header'), 'sourceContent')
+        etree.SubElement(content, 'byteSize').text = str(len(b''.join(chunks)))
+        etree.SubElement(content, 'md5').text = hashlib.md5(b''.join(chunks)).hexdigest()
+        chunks_e = etree.SubElement(manifest, 'chunks')
+        responses = {url + '.dura-manifest': etree.tostring(manifest)}
+        for i, chunk in enumerate(chunks):
+            chunkid = 'chunked/chunked.txt.dura-chunk-%04d' % i
+            chunk_e = etree.SubElement(chunks_e, 'chunk', chunkId=chunkid)
+            etree.SubElement(chunk_e, 'byteSize').text = str(len(chunk))
+            etree.SubElement(chunk_e, 'md5').text = hashlib.md5(chunk).hexdigest()
+            responses[self.ds_object.duraspace_url + chunkid] = chunk
+        responses[url + '.dura-manifest'] = etree.tostring(manifest)
+
+        def get(url, stream=False):
+            if url not in responses:
+                return mock.Mock(status_code=404, ok=False)
+            data = responses[url]
+            return mock.Mock(status_code=200, ok=True, content=data,
+                             iter_content=lambda size: iter([data[i:i + size] for i in range(0, len(data), size)]))
+        return get
+
+    def test_download_chunked_file_resume(self):
+        chunks = [b'a' * 100, b'b' * 100, b'c' * 50]
+        url = self.ds_object.duraspace_url + 'chunked/chunked.txt'
+        get = mock.Mock(side_effect=self._mock_chunked_get(url, chunks))
+        # Interrupted download: first chunk is complete, second is not
+        os.mkdir('download_resume')
+        with open('download_resume/chunked.txt', 'wb') as f:
+            f.write(chunks[0] + b'b' * 10)
+        with mock.patch.object(self.ds_object.session, 'get', get):
+            self.ds_object.move_to_storage_service('chunked/chunked.txt', 'download_resume/chunked.txt', None)
+        with open('download_resume/chunked.txt', 'rb') as f:
+            assert f.read() == b''.join(chunks)
+        fetched = [c[1][0] for c in get.mock_calls]
+        assert url + '.dura-chunk-0000' not in fetched
+        assert url + '.dura-chunk-0001' in fetched
+        assert url + '.dura-chunk-0002' in fetched
+        # Cleanup
+        os.remove('download_resume/chunked.txt')
+        os.rmdir('download_resume')
+
+    def test_download_chunk_checksum_mismatch(self):
+        chunks = [b'a' * 100, b'b' * 100]
+        url = self.ds_object.duraspace_url + 'chunked/chunked.txt'
+        get = self._mock_chunked_get(url, chunks)
+
+        def corrupt_get(url, stream=False):
+            response = get(url, stream)
+            if url.endswith('.dura-chunk-0001'):
+                response.iter_content = lambda size: iter([b'x' * 100])
+            return response
+        self.ds_object.RETRY_ATTEMPTS = 1
+        with mock.patch.object(self.ds_object.session, 'get', side_effect=corrupt_get), \
+                mock.patch('time.sleep'):
+            with self.assertRaises(models.StorageException):
+                self.ds_object.move_to_storage_service('chunked/chunked.txt', 'download_mismatch/chunked.txt', None)
+        # Cleanup
+        os.remove('download_mismatch/chunked.txt')
+        os.rmdir('download_mismatch')
+
     @vcr.use_cassette(os.path.join(FIXTURES_DIR, 'vcr_cassettes', 'duracloud_move_to_ss_file.yaml'))
     def test_move_to_ss_file(self):
         # Test file
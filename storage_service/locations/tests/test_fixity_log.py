@@ -1,6 +1,9 @@
+import json
+
 from django.test import TestCase
+import mock
 
-from locations import models
+from locations import models, signals
 
 
 class TestFixityLog(TestCase):
@@ -16,3 +19,54 @@ class TestFixityLog(TestCase):
         assert self.fl_object.success
         assert self.fl_object.error_details
         assert self.fl_object.datetime_reported
+
+
+class TestLatestFixityCheck(TestCase):
+
+    fixtures = ['base.json', 'package.json']
+
+    uuid = '0d4e739b-bf60-4b87-bc20-67a379b28cea'
+
+    def send(self, signal, message=None):
+        signal.send(sender=None, uuid=self.uuid, location='/',
+                    report=json.dumps({'message': message}))
+        return models.Package.objects.get(uuid=self.uuid)
+
+    def test_signals_record_latest_fixity_check(self):
+        package = models.Package.objects.get(uuid=self.uuid)
+        assert package.latest_fixity_check_datetime is None
+        assert package.latest_fixity_check_result is None
+        assert models.Package.objects.filter(
+            latest_fixity_check_datetime__isnull=True, uuid=self.uuid).exists()
+
+        with mock.patch('locations.signals._notify_administrators'):
+            package = self.send(signals.failed_fixity_check, 'Bag invalid')
+        assert package.latest_fixity_check_result is False
+        assert package.fixity_failure_count == 1
+        failed_at = package.latest_fixity_check_datetime
+        assert failed_at is not None
+
+        package = self.send(signals.fixity_check_not_run, 'Unsupported')
+        assert package.latest_fixity_check_result is None
+        assert package.latest_fixity_check_datetime >= failed_at
+
+        package = self.send(signals.successful_fixity_check)
+        assert package.latest_fixity_check_result is True
+        assert package.fixity_failure_count == 1
+
+        latest = models.FixityLog.objects.filter(package=package) \
+            .order_by('-datetime_reported', '-id')[0]
+        assert latest.success is True
+        assert package.latest_fixity_check_datetime == latest.datetime_reported
+        assert models.FixityLog.objects.filter(package=package).count() == 3
+
+    def test_save_keeps_latest_fixity_check(self):
+        package = models.Package.objects.get(uuid=self.uuid)
+        self.send(signals.successful_fixity_check)
+        package.description = 'Saved after the check'
+        package.save()
+
+        package = models.Package.objects.get(uuid=self.uuid)
+        assert package.description == 'Saved after the check'
+        assert package.latest_fixity_check_result is True
+        assert package.latest_fixity_check_datetime is not None
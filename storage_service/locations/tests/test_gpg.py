@@ -7,6 +7,7 @@ import os
 import shutil
 import subprocess
 import tarfile
+import tempfile
 import unicodedata
 
 from django.test import TestCase
@@ -44,8 +45,6 @@ BROWSE_FAIL_DICT = {'directories': [], 'entries': [], 'properties': {}}
 
 
 FakeGPGRet = namedtuple('FakeGPGRet', 'ok status stderr')
-ExTarCase = namedtuple('ExTarCase', 'path isdir raises expected')
-CrTarCase = namedtuple('CrTarCase', 'path isfile istar raises expected')
 DecryptCase = namedtuple('DecryptCase',
                          'path isfile createsdecryptfile decryptret expected')
 EncryptCase = namedtuple('EncryptCase',
@@ -101,10 +100,14 @@ def test_move_to_storage_service(mocker, src_path, dst_path, src_exists1,
     mocker.patch.object(gpg_space.space, 'move_rsync')
     mocker.patch.object(gpg, '_gpg_decrypt')
     mocker.patch.object(gpg, '_gpg_encrypt')
-    mocker.patch.object(gpg, '_encr_path2key_fingerprint',
-                        return_value=SOME_FINGERPRINT)
+    extract_dir = '/x/y/tmpdir'
+    member_path = os.path.join(extract_dir, 'c', 'somefile.jpg')
+    mocker.patch.object(gpg, '_gpg_extract_member',
+                        return_value=member_path if src_exists2 else None)
+    mocker.patch.object(tempfile, 'mkdtemp', return_value=extract_dir)
+    mocker.patch.object(shutil, 'rmtree')
     mocker.patch.object(gpg, '_get_encrypted_path', return_value=encr_path)
-    mocker.patch.object(os.path, 'exists', side_effect=(src_exists1, src_exists2))
+    mocker.patch.object(os.path, 'exists', return_value=src_exists1)
     if expect == 'success':
         ret = gpg_space.move_to_storage_service(src_path, dst_path, None)
         assert ret is None
@@ -119,18 +122,25 @@ def test_move_to_storage_service(mocker, src_path, dst_path, src_exists1,
             assert ('Unable to move {}; this file/dir does not'
                     ' exist, not even in encrypted directory'
                     ' {}.'.format(src_path, encr_path) == str(excinfo.value))
-    if src_exists2 and encr_path:
-        gpg_space.space.move_rsync.assert_called_once_with(src_path, dst_path)
-    else:
-        assert not gpg_space.space.move_rsync.called
+    # The encrypted package is never re-encrypted
+    assert not gpg._gpg_encrypt.called
     if src_exists1:
+        gpg_space.space.move_rsync.assert_called_once_with(src_path, dst_path)
         gpg._gpg_decrypt.assert_called_once_with(dst_path)
-        assert not gpg._gpg_encrypt.called
+        assert not gpg._gpg_extract_member.called
     else:
+        assert not gpg._gpg_decrypt.called
         gpg._get_encrypted_path.assert_called_once_with(src_path)
         if encr_path:
-            gpg._gpg_encrypt.assert_called_once_with(encr_path, SOME_FINGERPRINT)
-            gpg._gpg_decrypt.assert_called_once_with(encr_path)
+            tempfile.mkdtemp.assert_called_once_with(dir='/x/y/z')
+            gpg._gpg_extract_member.assert_called_once_with(
+                encr_path, src_path, extract_dir)
+            shutil.rmtree.assert_called_once_with(extract_dir)
+        if src_exists2 and encr_path:
+            gpg_space.space.move_rsync.assert_called_once_with(
+                member_path, dst_path, try_mv_local=True)
+        else:
+            assert not gpg_space.space.move_rsync.called
     gpg_space.space.create_local_directory.assert_called_once_with(dst_path)
 
 
@@ -251,28 +261,140 @@ def test__gpg_encrypt(mocker, path, isdir, encr_path_is_file, encrypt_ret,
     mocker.patch.object(os.path, 'isdir', return_value=isdir)
     mocker.patch.object(os, 'remove')
     mocker.patch.object(os, 'rename')
-    mocker.patch.object(gpg, '_create_tar')
-    mocker.patch.object(gpg, '_extract_tar')
+    mocker.patch.object(shutil, 'rmtree')
+    mocker.patch.object(gpg, '_gpg_encrypt_dir',
+                        return_value=(encr_path, encrypt_ret))
     mocker.patch.object(gpgutils, 'gpg_encrypt_file',
                         return_value=(encr_path, encrypt_ret))
     mocker.patch.object(os.path, 'isfile', return_value=encr_path_is_file)
     if expected == 'success':
         ret = gpg._gpg_encrypt(path, SOME_FINGERPRINT)
-        os.remove.assert_called_once_with(path)
+        if isdir:
+            shutil.rmtree.assert_called_once_with(path)
+            assert not os.remove.called
+        else:
+            os.remove.assert_called_once_with(path)
+            assert not shutil.rmtree.called
         os.rename.assert_called_once_with(encr_path, path)
         assert ret == (path, encrypt_ret)
-        assert not gpg._extract_tar.called
     else:
         with pytest.raises(gpg.GPGException) as excinfo:
             gpg._gpg_encrypt(path, SOME_FINGERPRINT)
         assert 'An error occured when attempting to encrypt {}'.format(
             path) == str(excinfo.value)
-        if isdir:
-            gpg._extract_tar.assert_called_once_with(path)
+        # The unencrypted package is left untouched
+        assert not shutil.rmtree.called
+        assert not os.rename.called
+        if encr_path_is_file:
+            os.remove.assert_called_once_with(encr_path)
     os.path.isdir.assert_called_once_with(path)
-    os.path.isfile.assert_called_once_with(encr_path)
     if isdir:
-        gpg._create_tar.assert_called_once_with(path)
+        gpg._gpg_encrypt_dir.assert_called_once_with(path, SOME_FINGERPRINT)
+        assert not gpgutils.gpg_encrypt_file.called
+    else:
+        gpgutils.gpg_encrypt_file.assert_called_once_with(path, SOME_FINGERPRINT)
+
+
+class FakeCrypt(object):
+    """Mutable stand-in for the Python-GnuPG result objects."""
+
+    def __init__(self, ok=True, status=SUCCESS_STATUS):
+        self.ok = ok
+        self.status = status
+        self.stderr = ''
+
+
+def fake_encrypt_stream(stream, recipient_fingerprint, encr_path):
+    """Encrypt with the identity cipher."""
+    with open(encr_path, 'wb') as f:
+        shutil.copyfileobj(stream, f)
+    return FakeCrypt()
+
+
+def fake_decrypt_file(path, decr_path):
+    """Decrypt with the identity cipher. ``decr_path`` may be a named pipe."""
+    with open(path, 'rb') as src:
+        with open(decr_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    return FakeCrypt()
+
+
+def test_encrypt_decrypt_dir_streams(mocker, tmpdir):
+    """Packages directories are tarred and extracted on the fly."""
+    mocker.patch.object(gpgutils, 'gpg_encrypt_stream',
+                        side_effect=fake_encrypt_stream)
+    mocker.patch.object(gpgutils, 'gpg_decrypt_file',
+                        side_effect=fake_decrypt_file)
+    package = tmpdir.mkdir('package-uuid')
+    package.mkdir('data').join('file.txt').write('contents')
+    path = str(package)
+    assert gpg._gpg_encrypt(path, SOME_FINGERPRINT)[0] == path
+    assert os.path.isfile(path)
+    assert tarfile.is_tarfile(path)
+    assert sorted(os.listdir(str(tmpdir))) == ['package-uuid']
+
+    assert gpg._gpg_decrypt(path) == path
+    assert os.path.isdir(path)
+    assert package.join('data', 'file.txt').read() == 'contents'
+    assert sorted(os.listdir(str(tmpdir))) == ['package-uuid']
+
+
+def test_decrypt_stream_not_tar(mocker, tmpdir):
+    """Extensionless files that are not tarfiles are decrypted as is."""
+    mocker.patch.object(gpgutils, 'gpg_decrypt_file',
+                        side_effect=fake_decrypt_file)
+    encrypted = tmpdir.join('package-uuid')
+    encrypted.write('not a tarfile')
+    assert gpg._gpg_decrypt(str(encrypted)) == str(encrypted)
+    assert encrypted.read() == 'not a tarfile'
+    assert sorted(os.listdir(str(tmpdir))) == ['package-uuid']
+
+
+def test_decrypt_stream_fail(mocker, tmpdir):
+    """Failures leave the encrypted file and no decrypted data behind."""
+    mocker.patch.object(gpgutils, 'gpg_decrypt_file',
+                        return_value=FakeCrypt(ok=False,
+                                               status=DECRYPT_RET_FAIL_STATUS))
+    encrypted = tmpdir.join('package-uuid')
+    encrypted.write('ciphertext')
+    with pytest.raises(gpg.GPGException) as excinfo:
+        gpg._gpg_decrypt(str(encrypted))
+    assert 'Failed to decrypt {}. Reason: {}'.format(
+        encrypted, DECRYPT_RET_FAIL_STATUS) == str(excinfo.value)
+    assert encrypted.read() == 'ciphertext'
+    assert sorted(os.listdir(str(tmpdir))) == ['package-uuid']
+
+
+def test_extract_member(mocker, tmpdir):
+    """Single files and dirs are extracted without decrypting the package."""
+    mocker.patch.object(gpgutils, 'gpg_encrypt_stream',
+                        side_effect=fake_encrypt_stream)
+    mocker.patch.object(gpgutils, 'gpg_decrypt_file',
+                        side_effect=fake_decrypt_file)
+    package = tmpdir.mkdir('package-uuid')
+    package.mkdir('data').join('file.txt').write('contents')
+    package.join('data', 'other.txt').write('other contents')
+    path = str(package)
+    gpg._gpg_encrypt(path, SOME_FINGERPRINT)
+    ciphertext = package.read('rb')
+
+    extract_dir = tmpdir.mkdir('extract')
+    member_path = gpg._gpg_extract_member(
+        path, os.path.join(path, 'data', 'file.txt'), str(extract_dir))
+    assert member_path == str(extract_dir.join('package-uuid', 'data', 'file.txt'))
+    assert extract_dir.join('package-uuid', 'data', 'file.txt').read() == 'contents'
+    assert not extract_dir.join('package-uuid', 'data', 'other.txt').check()
+
+    member_path = gpg._gpg_extract_member(
+        path, os.path.join(path, 'data/'), str(extract_dir))
+    assert member_path == str(extract_dir.join('package-uuid', 'data')) + '/'
+    assert extract_dir.join('package-uuid', 'data', 'other.txt').read() == 'other contents'
+
+    assert gpg._gpg_extract_member(
+        path, os.path.join(path, 'missing.txt'), str(extract_dir)) is None
+    # The encrypted package is untouched
+    assert package.read('rb') == ciphertext
+    assert sorted(os.listdir(str(tmpdir))) == ['extract', 'package-uuid']
 
 
 def test__get_encrypted_path(monkeypatch):
@@ -302,11 +424,11 @@ def test_escape(inp, outp):
 @pytest.mark.parametrize(
     'path, isfile, will_create_decrypt_file, decrypt_ret, expected',
     [
-        DecryptCase(path='/a/b/c', isfile=True, createsdecryptfile=True,
+        DecryptCase(path='/a/b/c.7z', isfile=True, createsdecryptfile=True,
                     decryptret=DECRYPT_RET_SUCCESS, expected='success'),
-        DecryptCase(path='/x/y/z', isfile=False, createsdecryptfile=False,
+        DecryptCase(path='/x/y/z.7z', isfile=False, createsdecryptfile=False,
                     decryptret=DECRYPT_RET_FAIL, expected='fail'),
-        DecryptCase(path='/a/b/c', isfile=True, createsdecryptfile=False,
+        DecryptCase(path='/a/b/c.7z', isfile=True, createsdecryptfile=False,
                     decryptret=DECRYPT_RET_FAIL, expected='fail'),
     ]
 )
@@ -314,24 +436,17 @@ def test__gpg_decrypt(mocker, path, isfile, will_create_decrypt_file,
                       decrypt_ret, expected):
     mocker.patch('os.remove')
     mocker.patch('os.rename')
-    mocker.patch.object(tarfile, 'is_tarfile', return_value=True)
     mocker.patch.object(gpgutils, 'gpg_decrypt_file', return_value=decrypt_ret)
-    mocker.patch.object(gpg, '_extract_tar')
-
-    def isfilemock(path_):
-        if path_ == path:
-            return isfile
-        return will_create_decrypt_file
-
-    mocker.patch.object(os.path, 'isfile', side_effect=isfilemock)
+    mocker.patch.object(gpg, '_gpg_decrypt_stream')
+    mocker.patch.object(os.path, 'isfile', return_value=isfile)
+    mocker.patch.object(os.path, 'exists',
+                        return_value=will_create_decrypt_file)
     assert not gpgutils.gpg_decrypt_file.called
     decr_path = '{}.decrypted'.format(path)
     if expected == 'success':
         ret = gpg._gpg_decrypt(path)
         os.remove.assert_called_once_with(path)
         os.rename.assert_called_once_with(decr_path, path)
-        tarfile.is_tarfile.assert_called_once_with(path)
-        gpg._extract_tar.assert_called_once_with(path)
         assert ret == path
     else:
         with pytest.raises(gpg.GPGException) as excinfo:
@@ -344,8 +459,8 @@ def test__gpg_decrypt(mocker, path, isfile, will_create_decrypt_file,
                 path) == str(excinfo.value)
         assert not os.remove.called
         assert not os.rename.called
-        assert not tarfile.is_tarfile.called
-        assert not gpg._extract_tar.called
+    # Compressed packages are not streamed through tar
+    assert not gpg._gpg_decrypt_stream.called
     if isfile:
         gpgutils.gpg_decrypt_file.assert_called_once_with(
             path, decr_path)
@@ -381,91 +496,6 @@ def test_create_encryption_event(mocker):
     subprocess.check_output.assert_called_once_with(['gpg', '--version'])
 
 
-@pytest.mark.parametrize(
-    'path, will_be_dir, sp_raises, expected',
-    [
-        ExTarCase(path='/a/b/c', isdir=True, raises=False, expected='success'),
-        ExTarCase(path='/a/b/d', isdir=False, raises=False, expected='fail'),
-        ExTarCase(path='/a/b/c', isdir=True, raises=True, expected='fail')
-    ]
-)
-def test__extract_tar(mocker, path, will_be_dir, sp_raises, expected):
-    if sp_raises:
-        mocker.patch.object(subprocess, 'check_output',
-                            side_effect=OSError('gotcha!'))
-    else:
-        mocker.patch.object(subprocess, 'check_output')
-    mocker.patch.object(os, 'rename')
-    mocker.patch.object(os, 'remove')
-    if will_be_dir:
-        mocker.patch.object(os.path, 'isdir', return_value=True)
-    else:
-        mocker.patch.object(os.path, 'isdir', return_value=False)
-    tarpath_ext = '{}.tar'.format(path)
-    dirname = os.path.dirname(tarpath_ext)
-    if expected == 'success':
-        ret = gpg._extract_tar(path)
-        assert ret is None
-        os.remove.assert_called_once_with(tarpath_ext)
-    else:
-        with pytest.raises(gpg.GPGException) as excinfo:
-            ret = gpg._extract_tar(path)
-        assert ('Failed to extract {} to a directory at the same'
-                ' location.'.format(path) == str(excinfo.value))
-        os.rename.assert_any_call(tarpath_ext, path)
-        assert not os.remove.called
-    os.rename.assert_any_call(path, tarpath_ext)
-    subprocess.check_output.assert_called_once_with(
-        ['tar', '-xf', tarpath_ext, '-C', dirname])
-
-
-@pytest.mark.parametrize(
-    'path, will_be_file, will_be_tar, sp_raises, expected',
-    [
-        CrTarCase(path='/a/b/c', isfile=True, istar=True, raises=False,
-                  expected='success'),
-        CrTarCase(path='/a/b/c/', isfile=True, istar=True, raises=False,
-                  expected='success'),
-        CrTarCase(path='/a/b/c', isfile=True, istar=False, raises=False,
-                  expected='fail'),
-        CrTarCase(path='/a/b/c', isfile=False, istar=True, raises=False,
-                  expected='fail'),
-        CrTarCase(path='/a/b/c', isfile=False, istar=False, raises=True,
-                  expected='fail')
-    ]
-)
-def test__create_tar(mocker, path, will_be_file, will_be_tar, sp_raises,
-                     expected):
-    if sp_raises:
-        mocker.patch.object(subprocess, 'check_output',
-                            side_effect=OSError('gotcha!'))
-    else:
-        mocker.patch.object(subprocess, 'check_output')
-    mocker.patch.object(os.path, 'isfile', return_value=will_be_file)
-    mocker.patch.object(tarfile, 'is_tarfile', return_value=will_be_tar)
-    mocker.patch.object(os, 'rename')
-    mocker.patch.object(shutil, 'rmtree')
-    fixed_path = path.rstrip('/')
-    tarpath = '{}.tar'.format(fixed_path)
-    if expected == 'success':
-        ret = gpg._create_tar(path)
-        shutil.rmtree.assert_called_once_with(fixed_path)
-        os.rename.assert_called_once_with(tarpath, fixed_path)
-        tarfile.is_tarfile.assert_any_call(fixed_path)
-        assert ret is None
-    else:
-        with pytest.raises(gpg.GPGException) as excinfo:
-            ret = gpg._create_tar(path)
-        assert 'Failed to create a tarfile at {} for dir at {}'.format(
-            tarpath, fixed_path) == str(excinfo.value)
-        assert not shutil.rmtree.called
-        assert not os.rename.called
-    if not sp_raises:
-        os.path.isfile.assert_called_once_with(tarpath)
-        if will_be_file:
-            tarfile.is_tarfile.assert_any_call(tarpath)
-
-
 class TestGPG(TestCase):
 
     fixtures = ['base.json', 'package.json', 'gpg.json']
@@ -496,3 +526,18 @@ class TestGPG(TestCase):
             gpg._encr_path2key_fingerprint(encr_path)
         assert 'Unable to find package matching encrypted path {}'.format(
             encr_path) in str(excinfo.value)
+
+    def test__encr_path2key_fingerprint_single_query(self):
+        encr_path = ('/abs/path/to/some/relative/path/to/'
+                     'images-transfer-abcdabcd-97dd-48e0-8417-03be78359531/'
+                     'data/objects/somefile.jpg')
+        with self.assertNumQueries(1):
+            assert gpg._encr_path2key_fingerprint(encr_path) == EXP_FINGERPRINT
+
+
+def test__encr_path_candidates():
+    assert gpg._encr_path_candidates('a/b') == set(
+        ['a', 'a/', 'b', 'b/', 'a/b', 'a/b/'])
+    assert gpg._encr_path_candidates('/a/b/') == set(
+        ['a', 'a/', 'b', 'b/', 'a/b', 'a/b/',
+         '/a', '/a/', '/a/b', '/a/b/'])
@@ -48,6 +48,11 @@ class TestPackage(TestCase):
         assert self.package.file_set.count() == 12  # 11 from this METS, plus the one the fixture is already assigned
         assert self.package.file_set.get(name='images-transfer-de1b31fa-97dd-48e0-8417-03be78359531/objects/pictures/Landing_zone.jpg').source_id == '742f10b0-768a-4158-b255-94847a97c465'
 
+    def test_files_are_not_added_twice(self):
+        self.package.index_file_data_from_transfer_mets(prefix=self.mets_path)
+        self.package.index_file_data_from_transfer_mets(prefix=self.mets_path)
+        assert self.package.file_set.count() == 12
+
     def test_fixity_success(self):
         """
         It should return success.
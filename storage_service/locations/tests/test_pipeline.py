@@ -1,5 +1,6 @@
 import os
 
+from django.conf import settings
 from django.test import TestCase
 from django.utils.six.moves.urllib.parse import ParseResult, urlparse
 
@@ -35,7 +36,7 @@ class TestPipeline(TestCase):
         assert pipeline.parse_and_fix_url(url) == \
             urlparse(url)
 
-    @mock.patch('requests.request')
+    @mock.patch('requests.Session.request')
     def test_request_api(self, request):
         pipeline = models.Pipeline.objects.get(pk=1)
 
@@ -43,11 +44,14 @@ class TestPipeline(TestCase):
         url = 'http://127.0.0.1/api/processing-configuration/default'
         headers = {'Authorization': 'ApiKey None:None'}
 
+        timeout = (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
         pipeline._request_api(method, 'processing-configuration/default')
         request.assert_called_with(method, url,
                                    allow_redirects=True,
                                    data=None,
                                    headers=headers,
+                                   timeout=timeout,
                                    verify=True)
 
         with self.settings(INSECURE_SKIP_VERIFY=True):
@@ -56,6 +60,7 @@ class TestPipeline(TestCase):
                                        allow_redirects=True,
                                        data=None,
                                        headers=headers,
+                                       timeout=timeout,
                                        verify=False)
 
     @vcr.use_cassette(os.path.join(
@@ -0,0 +1,46 @@
+import datetime
+
+import mock
+
+from locations import models
+
+
+def test_browse_paginated():
+    s3 = models.S3(space_id='7d20c992-bc92-4f92-a794-7161ff2cc08b')
+    modified = datetime.datetime(2018, 1, 1)
+    pages = [
+        {
+            'CommonPrefixes': [{'Prefix': 'aips/b/'}],
+            'Contents': [
+                {'Key': 'aips/a.7z', 'Size': 1, 'LastModified': modified, 'ETag': '"1"'},
+                {'Key': 'aips/c.7z', 'Size': 3, 'LastModified': modified, 'ETag': '"3"'},
+            ],
+        },
+        {
+            'Contents': [
+                {'Key': 'aips/d.7z', 'Size': 4, 'LastModified': modified, 'ETag': '"4"'},
+            ],
+        },
+    ]
+    with mock.patch.object(s3, '_client') as client:
+        client.get_paginator.return_value.paginate.return_value = pages
+        result = s3.browse('/aips', limit=3)
+
+    params = client.get_paginator.return_value.paginate.call_args[1]
+    assert params['Prefix'] == 'aips/'
+    assert params['Delimiter'] == '/'
+    assert 'StartAfter' not in params
+    assert result['entries'] == ['a.7z', 'b', 'c.7z']
+    assert result['directories'] == ['b']
+    assert result['properties']['c.7z']['size'] == 3
+    assert result['next_cursor'] == 'c.7z'
+
+    with mock.patch.object(s3, '_client') as client:
+        client.get_paginator.return_value.paginate.return_value = pages[1:]
+        result = s3.browse('/aips', limit=3, cursor='c.7z', name_prefix='d')
+
+    params = client.get_paginator.return_value.paginate.call_args[1]
+    assert params['Prefix'] == 'aips/d'
+    assert params['StartAfter'] == 'aips/c.7z'
+    assert result['entries'] == ['d.7z']
+    assert result['next_cursor'] is None
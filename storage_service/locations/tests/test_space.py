@@ -0,0 +1,287 @@
+import os
+import subprocess
+import threading
+
+from concurrent import futures
+import mock
+import pytest
+
+from common import ssh
+from locations.models import Space, StorageException
+from locations.models.space import (
+    OBJECT_COUNTER, _ObjectCounter, path2browse_dict, rsync_file_lists)
+
+
+@pytest.fixture(autouse=True)
+def clean_connections():
+    ssh.close_connections()
+    yield
+    ssh.close_connections()
+
+
+@pytest.fixture
+def package(tmpdir):
+    package = tmpdir.mkdir('package')
+    package.mkdir('empty')
+    objects = package.mkdir('data').mkdir('objects')
+    for name, size in (('a', 500), ('b', 400), ('c', 300), ('d', 200), ('e', 100)):
+        objects.join(name).write('x' * size)
+    package.join('bag-info.txt').write('x' * 50)
+    os.symlink('bag-info.txt', str(package.join('link')))
+    return str(package)
+
+
+def test_rsync_file_lists_are_balanced(package):
+    root, shards = rsync_file_lists(package, 2)
+
+    assert root == os.path.join(os.path.dirname(package), '')
+    assert sorted(shards[0][:4]) == [
+        'package', 'package/data', 'package/data/objects', 'package/empty']
+    files = [sorted(shard[4:] if i == 0 else shard) for i, shard in enumerate(shards)]
+    assert files == [
+        ['package/data/objects/a', 'package/data/objects/d', 'package/data/objects/e'],
+        ['package/bag-info.txt', 'package/data/objects/b', 'package/data/objects/c'],
+    ]
+
+
+def test_rsync_file_lists_of_directory_contents(package):
+    root, shards = rsync_file_lists(package + '/', 10)
+
+    assert root == package + '/'
+    assert len(shards) == 6
+    assert '.' in shards[0]
+    assert 'data/objects/a' in shards[0]
+    assert 'link' not in sum(shards, [])
+
+
+def _rsync_process(returncode):
+    process = mock.Mock(returncode=returncode)
+    process.communicate.return_value = ('output', None)
+    process.poll.return_value = returncode
+    return process
+
+
+def test_move_rsync_sharded(package):
+    file_lists = []
+
+    def popen(command, **kwargs):
+        with open(command[command.index('--files-from') + 1]) as f:
+            file_lists.append(f.read().split('\0'))
+        return _rsync_process(0)
+
+    space = Space(rsync_workers=3)
+    with mock.patch('subprocess.Popen', side_effect=popen) as Popen:
+        space.move_rsync(package, 'user@example.com:/var/aips')
+
+    assert Popen.call_count == 3
+    command = Popen.call_args[0][0]
+    assert command[-2:] == [os.path.dirname(package) + '/', 'user@example.com:/var/aips/']
+    assert '--from0' in command
+    rsh = command[command.index('--rsh') + 1]
+    assert rsh == ssh.get_connection('user', 'example.com').rsh(shared=False)
+    assert len(sum(file_lists, [])) == 10
+
+
+def test_move_rsync_sharded_fails_if_a_worker_fails(package):
+    processes = [_rsync_process(0), _rsync_process(23), _rsync_process(None)]
+    # The last worker runs until it is killed
+    killed = threading.Event()
+    processes[2].kill.side_effect = killed.set
+    processes[2].communicate.side_effect = lambda: (
+        killed.wait(5) and processes[2].configure_mock(returncode=-9) or ('', None))
+
+    space = Space(rsync_workers=3)
+    with mock.patch('subprocess.Popen', side_effect=processes):
+        with pytest.raises(StorageException) as excinfo:
+            space.move_rsync(package, 'user@example.com:/var/aips')
+
+    assert 'status 23' in str(excinfo.value)
+    processes[2].kill.assert_called()
+
+
+def test_move_rsync_not_sharded_for_files(package):
+    space = Space(rsync_workers=3)
+    with mock.patch('subprocess.call', return_value=0), \
+            mock.patch('subprocess.Popen', return_value=_rsync_process(0)) as Popen:
+        space.move_rsync(os.path.join(package, 'bag-info.txt'), 'user@example.com:/var/aips/')
+
+    Popen.assert_called_once()
+    assert Popen.call_args[0][0][-3] == '-r'
+
+
+def test_path2browse_dict(package):
+    with mock.patch('common.utils.get_setting', return_value=False) as get_setting:
+        result = path2browse_dict(package)
+
+    get_setting.assert_called_once()
+    assert result['entries'] == ['bag-info.txt', 'data', 'empty', 'link']
+    assert result['directories'] == ['data', 'empty']
+    assert result['properties']['bag-info.txt'] == {'size': 50}
+    assert result['properties']['link'] == {'size': 50}
+    assert result['properties']['data']['object count'] == 5
+    assert result['properties']['empty']['object count'] == 0
+
+
+def test_create_rsync_directory_runs_one_command():
+    with mock.patch('subprocess.call', return_value=0), \
+            mock.patch('subprocess.check_call') as check_call:
+        Space().create_rsync_directory("/var/aips/a/b c/pkg.7z", 'user', 'example.com')
+        Space().create_rsync_directory('pkg.7z', 'user', 'example.com')
+
+    check_call.assert_called_once()
+    command = check_call.call_args[0][0]
+    assert command[0] == 'ssh'
+    assert command[-2:] == ['user@example.com', "umask 002 && mkdir -p -- '/var/aips/a/b c'"]
+
+
+def test_create_rsync_directory_falls_back_to_rsync():
+    connection = ssh.get_connection('user', 'example.com')
+    error = subprocess.CalledProcessError(1, 'ssh')
+    with mock.patch('subprocess.call', return_value=0), \
+            mock.patch('subprocess.check_call', side_effect=[error, 0, 0]) as check_call:
+        Space().create_rsync_directory('/var/aips/pkg.7z', 'user', 'example.com')
+
+    commands = [c[0][0] for c in check_call.call_args_list]
+    assert commands[0][0] == 'ssh'
+    assert [c[0] for c in commands[1:]] == ['rsync', 'rsync']
+    assert commands[1][commands[1].index('--rsh') + 1] == connection.rsh()
+    assert [c[-1] for c in commands[1:]] == [
+        'user@example.com:/var/', 'user@example.com:/var/aips/']
+
+
+def test_object_counts_are_cached_until_directories_change(package):
+    counter = _ObjectCounter()
+    objects = os.path.join(package, 'data', 'objects')
+    assert counter.count(package) == 7
+
+    with mock.patch('scandir.scandir') as scandir:
+        assert counter.count(package) == 7
+    assert not scandir.called
+
+    open(os.path.join(objects, 'f'), 'w').close()
+    os.utime(objects, (0, 0))  # mtime may not change within a second
+    assert counter.count(package) == 8
+
+
+def test_object_count_limit(package):
+    counter = _ObjectCounter()
+    counter.LIMIT = 3
+    assert counter.count(package) == '3+'
+
+
+def test_object_count_of_removed_directory(tmpdir):
+    counter = _ObjectCounter()
+    path = str(tmpdir.mkdir('removed'))
+    tmpdir.join('removed').remove()
+
+    class ImmediateExecutor(object):
+        """Count synchronously, so the count is done when submitted."""
+        def submit(self, fn, *args):
+            future = futures.Future()
+            future.set_result(fn(*args))
+            return future
+
+    counter._executor = ImmediateExecutor()
+    counts = {}
+    thread = threading.Thread(
+        target=lambda: counts.update(counter.count_all([path], timeout=5)))
+    thread.daemon = True
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert counts == {path: 0}
+    assert counter._pending == {}
+
+
+def test_path2browse_dict_does_not_wait_for_counts(package, settings):
+    settings.OBJECT_COUNT_TIMEOUT = 0
+    started = threading.Event()
+    release = threading.Event()
+    count = OBJECT_COUNTER.count
+
+    def slow_count(path):
+        if path.endswith('data'):
+            started.set()
+            release.wait(5)
+        return count(path)
+
+    with mock.patch('common.utils.get_setting', return_value=False), \
+            mock.patch.object(OBJECT_COUNTER, 'count', side_effect=slow_count):
+        result = path2browse_dict(package)
+        started.wait(5)
+        release.set()
+
+    assert result['directories'] == ['data', 'empty']
+    assert 'object count' not in result['properties']['data']
+
+
+def test_path2browse_dict_paginated(package):
+    with mock.patch('common.utils.get_setting', return_value=False):
+        first = path2browse_dict(package, limit=2)
+        second = path2browse_dict(package, limit=2, cursor=first['next_cursor'])
+
+    assert first['entries'] == ['bag-info.txt', 'data']
+    assert first['directories'] == ['data']
+    assert sorted(first['properties']) == ['bag-info.txt', 'data']
+    assert second == {
+        'entries': ['empty', 'link'],
+        'directories': ['empty'],
+        'properties': {'empty': mock.ANY, 'link': {'size': 50}},
+        'next_cursor': None,
+    }
+
+
+def test_browse_paginates_complete_listings():
+    space = Space(access_protocol='ARKIVUM')
+    child = mock.Mock(spec=['browse'])
+    child.browse.return_value = {
+        'entries': ['c', 'a', 'b'], 'directories': ['a'], 'properties': {}}
+    with mock.patch.object(Space, 'get_child_space', return_value=child):
+        result = space.browse('/path', limit=2, order_by='-name')
+
+    child.browse.assert_called_once_with('/path')
+    assert result['entries'] == ['c', 'b']
+    assert result['next_cursor'] == 'b'
+    with pytest.raises(ValueError):
+        space.browse('/path', order_by='size')
+
+
+def test_browse_rsync_paginated():
+    output = '\n'.join([
+        'drwxrws---          4,096 2015/03/02 17:05:20 .',
+        'drwxrws---          4,096 2015/03/02 17:05:20 transfer2',
+        '-rw-r--r--            201 2013/05/13 13:26:48 transfer1.zip',
+        '-rw-r--r--             10 2013/05/13 13:26:48 transfer3.zip',
+    ])
+    with mock.patch('subprocess.check_output', return_value=output) as check_output:
+        result = Space().browse_rsync(
+            'host::module/', assume_rsync_daemon=True, limit=2,
+            name_prefix='transfer')
+
+    command = check_output.call_args[0][0]
+    assert command[command.index('--include') + 1] == 'transfer*'
+    assert result['entries'] == ['transfer1.zip', 'transfer2']
+    assert result['directories'] == ['transfer2']
+    assert result['properties']['transfer1.zip']['size'] == 201
+    assert result['next_cursor'] == 'transfer2'
+
+
+def test_browse_cached(settings):
+    settings.BROWSE_CACHE_TTL = 60
+    space = Space(access_protocol='ARKIVUM', browse_cache_ttl=None)
+    child = mock.Mock(spec=['browse', 'delete_path'])
+    child.browse.side_effect = lambda path: {
+        'entries': ['a'], 'directories': [], 'properties': {}}
+    with mock.patch.object(Space, 'get_child_space', return_value=child):
+        space.browse('/space/dir/')
+        space.browse('/space/dir/')
+        assert child.browse.call_count == 1
+        space.browse('/space/dir/', use_cache=False)
+        assert child.browse.call_count == 2
+        space.delete_path('/space/dir/a')
+        space.browse('/space/dir/')
+        assert child.browse.call_count == 3
+
+        space.browse_cache_ttl = 0
+        space.browse('/space/dir/')
+        assert child.browse.call_count == 4
@@ -3,6 +3,7 @@ import os
 import shutil
 
 from django.test import TestCase
+import mock
 import pytest
 import vcr
 
@@ -141,3 +142,25 @@ class TestSwift(TestCase):
         # Verify deleted
         resp = self.swift_object.browse('transfers/SampleTransfers/')
         assert 'test' not in resp['directories']
+
+    def test_browse_paginated(self):
+        listing = [
+            {'name': 'transfers/a.txt', 'bytes': 1, 'last_modified': '2018'},
+            {'subdir': 'transfers/b/'},
+            {'name': 'transfers/c.txt', 'bytes': 3, 'last_modified': '2018'},
+        ]
+
+        def get_container(container, marker=None, limit=None, **kwargs):
+            entries = [e for e in listing if e.get('name', e.get('subdir')) > (marker or '')]
+            return {}, entries[:limit]
+        with mock.patch.object(self.swift_object, '_connection') as connection:
+            connection.get_container.side_effect = get_container
+            first = self.swift_object.browse('transfers', limit=2)
+            second = self.swift_object.browse('transfers', limit=2, cursor=first['next_cursor'])
+
+        assert first['entries'] == ['a.txt', 'b']
+        assert first['directories'] == ['b']
+        assert first['properties'] == {'a.txt': {'size': 1, 'timestamp': '2018'}}
+        assert connection.get_container.call_args_list[1][1]['marker'].startswith('transfers/b/')
+        assert second['entries'] == ['c.txt']
+        assert second['next_cursor'] is None
@@ -0,0 +1,80 @@
+import json
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from locations import models
+
+FIXITY_PACKAGE = 'e0a41934-c1d7-45ba-9a95-a7531c063ed1'
+
+
+class TestPackageTables(TestCase):
+
+    fixtures = ['base.json', 'package.json', 'fixity_log.json']
+
+    def setUp(self):
+        self.client.login(username='test', password='test')
+
+    def get_json(self, url, **params):
+        response = self.client.get(url, params)
+        assert response.status_code == 200
+        return json.loads(response.content)
+
+    def test_package_list_is_paged_server_side(self):
+        response = self.client.get(reverse('package_list'))
+        assert response.status_code == 200
+        assert 'packages' not in response.context
+
+        url = reverse('package_list_json')
+        total = models.Package.objects.count()
+        data = self.get_json(url, sEcho=3, iDisplayStart=0, iDisplayLength=2,
+                             iSortCol_0=1, sSortDir_0='desc')
+        assert data['sEcho'] == 3
+        assert data['iTotalRecords'] == data['iTotalDisplayRecords'] == total
+        assert len(data['aaData']) == 2
+        descriptions = list(models.Package.objects.order_by('-description', '-pk')
+                            .values_list('description', flat=True)[:2])
+        assert [row[1] for row in data['aaData']] == descriptions
+
+        data = self.get_json(url, iDisplayLength=10, sSearch='small ZIPPED')
+        assert data['iTotalRecords'] == total
+        assert data['iTotalDisplayRecords'] == 1
+        assert data['aaData'][0][0] == '6aebdb24-1b6b-41ab-b4a3-df9a73726a34'
+
+        data = self.get_json(url, iSortCol_0=10, sSortDir_0='desc')
+        row = data['aaData'][0]
+        assert row[0] == FIXITY_PACKAGE
+        assert row[11] == '<a href="{}">Success</a>'.format(
+            reverse('package_fixity', args=[FIXITY_PACKAGE]))
+
+    def test_package_list_query_count_does_not_depend_on_page_size(self):
+        url = reverse('package_list_json')
+        self.get_json(url, iDisplayLength=1)
+        with self.assertNumQueries(5):
+            self.get_json(url, iDisplayLength=1)
+        with self.assertNumQueries(5):
+            data = self.get_json(url, iDisplayLength=100)
+        assert len(data['aaData']) == models.Package.objects.count()
+
+    def test_package_list_of_location(self):
+        location = models.Package.objects.get(uuid=FIXITY_PACKAGE).current_location
+        response = self.client.get(reverse('location_detail', args=[location.uuid]))
+        assert response.context['has_packages']
+        assert 'location={}'.format(location.uuid) in response.content
+
+        data = self.get_json(reverse('package_list_json'), location=location.uuid)
+        assert data['iTotalRecords'] == models.Package.objects.filter(
+            current_location=location).count()
+
+    def test_package_fixity(self):
+        response = self.client.get(reverse('package_fixity', args=[FIXITY_PACKAGE]))
+        assert response.context['has_log_entries']
+
+        data = self.get_json(reverse('package_fixity_json', args=[FIXITY_PACKAGE]),
+                             iSortCol_0=0, sSortDir_0='desc')
+        assert data['iTotalRecords'] == 1
+        assert data['aaData'][0][1] == 'Checksum failed.'
+
+    def test_invalid_parameters(self):
+        response = self.client.get(reverse('package_list_json'), {'iDisplayStart': 'a'})
+        assert response.status_code == 400
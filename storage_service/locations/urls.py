@@ -19,6 +19,8 @@ urlpatterns = [
     # Packages
     url(r'^packages/$', views.package_list,
         name='package_list'),
+    url(r'^packages/json/$', views.package_list_json,
+        name='package_list_json'),
     url(r'^packages/package_delete_request/$', views.package_delete_request,
         name='package_delete_request'),
     url(r'^packages/(?P<uuid>' + UUID + ')/update_status/$', views.package_update_status,
@@ -31,6 +33,8 @@ urlpatterns = [
     # Fixity check results
     url(r'^fixity/(?P<package_uuid>' + UUID + ')/$', views.package_fixity,
         name='package_fixity'),
+    url(r'^fixity/(?P<package_uuid>' + UUID + ')/json/$', views.package_fixity_json,
+        name='package_fixity_json'),
 
     # Pipelines
     url(r'^pipelines/$', views.pipeline_list,
@@ -10,11 +10,16 @@ from django.http import HttpResponse
 from django.forms.models import model_to_dict
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template import RequestContext
+from django.template.defaultfilters import filesizeformat
+from django.utils import formats, timezone
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import ugettext as _
 from django.views.decorators.csrf import csrf_exempt
 from tastypie.models import ApiKey
 
+from common import datatables
 from common import decorators
+from common import http_client
 from common import utils
 from common import gpgutils
 from .models import Callback, Space, Location, Package, Event, Pipeline, LocationPipeline, StorageException, FixityLog, GPG
@@ -46,21 +51,146 @@ def get_delete_context_dict(request, model, object_uuid, default_cancel='/'):
 
 # ######################## FILES ##########################
 
+# Field each column of snippets/packages_table.html is sorted by
+PACKAGE_COLUMNS = ('uuid', 'description', 'origin_pipeline__description',
+                   'current_path', 'size', 'package_type', None, None, None,
+                   'status', 'latest_fixity_check_datetime',
+                   'latest_fixity_check_result', None)
+PACKAGE_SEARCH_FIELDS = ('uuid', 'description', 'current_path')
+
+
 def package_list(request):
     api_key = ApiKey.objects.get(user=request.user).key
-    context = {'packages': Package.objects.all(),
+    context = {'has_packages': Package.objects.exists(),
                'user': request.user,
                'api_key': api_key,
                'uri': request.build_absolute_uri('/')}
     return render(request, 'locations/package_list.html', context)
 
 
+def package_list_json(request):
+    """ Return one page of the packages table, for DataTables.
+
+    Lists the packages in the location with UUID `location` if provided.
+    The query count does not depend on the number of packages. """
+    packages = Package.objects.select_related(
+        'current_location__space', 'origin_pipeline', 'replicated_package'
+    ).prefetch_related('replicas')
+    location_uuid = request.GET.get('location')
+    if location_uuid:
+        packages = packages.filter(current_location__uuid=location_uuid)
+    next_url = request.GET.get('next', reverse('package_list'))
+    return datatables.page_response(
+        request, packages, PACKAGE_COLUMNS, PACKAGE_SEARCH_FIELDS,
+        lambda page: _package_rows(page, next_url))
+
+
+def _datetime_display(value):
+    """ Format a datetime like the templates do. """
+    return formats.localize(timezone.template_localtime(value))
+
+
+def _package_rows(packages, next_url):
+    """ Return the cells of the rows of snippets/packages_table.html. """
+    rows = []
+    for package in packages:
+        if package.origin_pipeline:
+            pipeline = format_html(
+                '<a href="{}">{}</a>',
+                reverse('pipeline_detail', args=[package.origin_pipeline.uuid]),
+                package.origin_pipeline)
+        else:
+            pipeline = _('None')
+        replicas = package.replicas.all()
+        if replicas:
+            replicas = format_html('<ul>{}</ul>', format_html_join(
+                '', '<li>{}</li>', ((r.uuid,) for r in replicas)))
+        else:
+            replicas = ''
+        if package.pointer_file_location_id:
+            pointer_file = format_html(
+                '<a href="{}">{}</a>',
+                reverse('pointer_file_request', args=['v2', 'file', package.uuid]),
+                _('Pointer File'))
+        else:
+            pointer_file = _('None')
+        status = format_html('{}', package.get_status_display())
+        if package.status not in (Package.DELETED, Package.FAIL):
+            status = format_html(
+                '{} (<a href="{}?next={}">{}</a>)', status,
+                reverse('package_update_status', args=[package.uuid]),
+                next_url, _('Update Status'))
+
+        if package.latest_fixity_check_datetime is None:
+            fixity_date = ''
+        else:
+            fixity_date = _datetime_display(package.latest_fixity_check_datetime)
+        if package.latest_fixity_check_result is None:
+            fixity_result = ''
+        else:
+            fixity_result = _('Success') if package.latest_fixity_check_result else _('Failed')
+        fixity_result = format_html(
+            '<a href="{}">{}</a>',
+            reverse('package_fixity', args=[package.uuid]), fixity_result)
+
+        actions = [format_html(
+            '<a href="{}">{}</a>',
+            reverse('download_request', args=['v2', 'file', package.uuid]),
+            _('Download'))]
+        # Replicas should not be re-ingestible
+        if package.package_type in (Package.AIP, Package.AIC) and not package.replicated_package_id:
+            actions.append(format_html(
+                '<a href="{}?next={}">{}</a>',
+                reverse('aip_reingest', args=[package.uuid]), next_url,
+                _('Re-ingest')))
+        if package.package_type in Package.PACKAGE_TYPE_CAN_DELETE:
+            actions.append(format_html(
+                '<a href="#" class="request-delete" data-package-uuid="{}"'
+                ' data-package-pipeline="{}">{}</a>',
+                package.uuid,
+                package.origin_pipeline.uuid if package.origin_pipeline else '',
+                _('Request Deletion')))
+
+        rows.append([
+            format_html('{}', package.uuid),
+            format_html('{}', package.description or _('None')),
+            pipeline,
+            format_html(
+                '<a href="{}">{}</a>',
+                reverse('location_detail', args=[package.current_location.uuid]),
+                package.full_path),
+            filesizeformat(package.size),
+            format_html('{}', package.get_package_type_display()),
+            replicas,
+            format_html('{}', package.replicated_package.uuid if package.replicated_package else ''),
+            pointer_file,
+            status,
+            fixity_date,
+            fixity_result,
+            ' '.join(actions),
+        ])
+    return rows
+
+
 def package_fixity(request, package_uuid):
-    log_entries = FixityLog.objects.filter(package__uuid=package_uuid).order_by('-datetime_reported')
-    context = {'log_entries': log_entries}
+    context = {
+        'package_uuid': package_uuid,
+        'has_log_entries': FixityLog.objects.filter(package__uuid=package_uuid).exists(),
+    }
     return render(request, 'locations/fixity_results.html', context)
 
 
+def package_fixity_json(request, package_uuid):
+    """ Return one page of the fixity checks of a package, for DataTables. """
+    log_entries = FixityLog.objects.filter(package__uuid=package_uuid)
+    return datatables.page_response(
+        request, log_entries, ('datetime_reported', 'error_details'),
+        ('error_details',),
+        lambda page: [[_datetime_display(entry.datetime_reported),
+                       format_html('{}', entry.error_details or '')]
+                      for entry in page])
+
+
 class PackageRequestHandlerConfig(object):
     event_type = ''                 # Event type being handled
     approved_status = ''            # Event status, if approved
@@ -203,7 +333,8 @@ def _handle_package_request_remote_result_notification(config, event, success):
             auth = None
 
         # Make request and set response message, if included in notification request response body
-        notification_response = requests.post(request_notification_url, auth=auth, data=payload, headers=headers)
+        session = http_client.get_session('notification', request_notification_url)
+        notification_response = session.post(request_notification_url, auth=auth, data=payload, headers=headers)
         try:
             responseData = json.loads(notification_response.content)
             response_message = responseData['message']
@@ -316,7 +447,7 @@ def location_detail(request, location_uuid):
         messages.warning(request, _('Location %(uuid)s does not exist.') % {'uuid': location_uuid})
         return redirect('location_list')
     pipelines = Pipeline.objects.filter(location=location)
-    packages = Package.objects.filter(current_location=location)
+    has_packages = Package.objects.filter(current_location=location).exists()
     return render(request, 'locations/location_detail.html', locals())
 
 
@@ -1,34 +1,50 @@
 
 $(document).ready(function() {
-    $('.datatable').dataTable({
-      // List of language strings from https://datatables.net/reference/option/language
-      oLanguage: {
-          sDecimal:        "",
-          sEmptyTable:     gettext("No data available in table"),
-          sInfo:           gettext("Showing _START_ to _END_ of _TOTAL_ entries"),
-          sInfoEmpty:      gettext("Showing 0 to 0 of 0 entries"),
-          sInfoFiltered:   gettext("(filtered from _MAX_ total entries)"),
-          sInfoPostFix:    "",
-          sThousands:      ",",
-          sLengthMenu:     gettext("Show _MENU_ entries"),
-          sLoadingRecords: gettext("Loading..."),
-          sProcessing:     gettext("Processing..."),
-          sSearch:         gettext("Search:"),
-          sZeroRecords:    gettext("No matching records found"),
-          oPaginate: {
-              sFirst:      gettext("First"),
-              sLast:       gettext("Last"),
-              sNext:       gettext("Next"),
-              sPrevious:   gettext("Previous")
-          },
-          oAria: {
-              sSortAscending:  gettext(": activate to sort column ascending"),
-              sSortDescending: gettext(": activate to sort column descending"),
-          },
+    // List of language strings from https://datatables.net/reference/option/language
+    var dataTableLanguage = {
+        sDecimal:        "",
+        sEmptyTable:     gettext("No data available in table"),
+        sInfo:           gettext("Showing _START_ to _END_ of _TOTAL_ entries"),
+        sInfoEmpty:      gettext("Showing 0 to 0 of 0 entries"),
+        sInfoFiltered:   gettext("(filtered from _MAX_ total entries)"),
+        sInfoPostFix:    "",
+        sThousands:      ",",
+        sLengthMenu:     gettext("Show _MENU_ entries"),
+        sLoadingRecords: gettext("Loading..."),
+        sProcessing:     gettext("Processing..."),
+        sSearch:         gettext("Search:"),
+        sZeroRecords:    gettext("No matching records found"),
+        oPaginate: {
+            sFirst:      gettext("First"),
+            sLast:       gettext("Last"),
+            sNext:       gettext("Next"),
+            sPrevious:   gettext("Previous")
+        },
+        oAria: {
+            sSortAscending:  gettext(": activate to sort column ascending"),
+            sSortDescending: gettext(": activate to sort column descending"),
+        },
+    };
+
+    $('.datatable').each(function() {
+      var $table = $(this);
+      var options = {oLanguage: dataTableLanguage};
+      // Tables with a data source load one page of rows at a time from it,
+      // paged, sorted and searched by the server
+      if ($table.data('source')) {
+        options.bServerSide = true;
+        options.bProcessing = true;
+        options.sAjaxSource = $table.data('source');
+        options.aoColumnDefs = [{bSortable: false, aTargets: ['no-sort']}];
+      }
+      if ($table.data('sorting')) {
+        options.aaSorting = $table.data('sorting');
       }
+      $table.dataTable(options);
     });
 
-    $("a.request-delete").click(function() {
+    // Rows of server-side tables are added after the page is loaded
+    $(document).on('click', 'a.request-delete', function() {
         var self = $(this);
         var uuid = self.data('package-uuid');
         var pipeline = self.data('package-pipeline');
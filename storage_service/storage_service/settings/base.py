@@ -5,6 +5,7 @@
 import json
 import logging
 import logging.config
+from multiprocessing import cpu_count
 from os import environ
 from os.path import abspath, basename, dirname, isfile, join, normpath
 from sys import path
@@ -408,6 +409,79 @@ except ValueError:
 
 GNUPG_HOME_PATH = environ.get('SS_GNUPG_HOME_PATH', None)
 
+# Maximum number of GnuPG processes encrypting or decrypting packages at the
+# same time in each Storage Service process.
+try:
+    GPG_CONCURRENCY = int(environ.get('SS_GPG_CONCURRENCY', cpu_count()))
+except ValueError:
+    GPG_CONCURRENCY = cpu_count()
+
+# Number of files copied at the same time when moving packages between local
+# paths.
+try:
+    COPY_CONCURRENCY = int(environ.get('SS_COPY_CONCURRENCY', 4))
+except ValueError:
+    COPY_CONCURRENCY = 4
+
+# Number of directories whose objects are counted at the same time when a
+# local path is browsed.
+try:
+    OBJECT_COUNT_CONCURRENCY = int(environ.get('SS_OBJECT_COUNT_CONCURRENCY', 4))
+except ValueError:
+    OBJECT_COUNT_CONCURRENCY = 4
+
+# Seconds browsing a local path waits for the object counts of its
+# directories. None waits for all of them.
+try:
+    OBJECT_COUNT_TIMEOUT = float(environ['SS_OBJECT_COUNT_TIMEOUT'])
+except (KeyError, ValueError):
+    OBJECT_COUNT_TIMEOUT = None
+
+# Number of seconds the results of browsing a space are cached, unless the
+# space sets its own. 0 disables caching.
+try:
+    BROWSE_CACHE_TTL = int(environ.get('SS_BROWSE_CACHE_TTL', 0))
+except ValueError:
+    BROWSE_CACHE_TTL = 0
+
+# Hard link the files copied to the staging area from a local path on the same
+# filesystem instead of copying them. Only safe if the staging copies are not
+# modified in place.
+STAGING_HARDLINKS = is_true(environ.get('SS_STAGING_HARDLINKS', ''))
+
+# Seconds an SSH master connection to a remote host is kept open after the
+# last rsync or ssh command using it.
+try:
+    SSH_CONTROL_PERSIST = int(environ.get('SS_SSH_CONTROL_PERSIST', 600))
+except ValueError:
+    SSH_CONTROL_PERSIST = 600
+
+# Number of chunks of a file transferred to or from DuraCloud at the same time.
+try:
+    DURACLOUD_CONCURRENCY = int(environ.get('SS_DURACLOUD_CONCURRENCY', 4))
+except ValueError:
+    DURACLOUD_CONCURRENCY = 4
+
+# Seconds a listing of the files in a DuraCloud space is reused for browsing
+# and resuming uploads. 0 disables the cache.
+try:
+    DURACLOUD_LISTING_CACHE_TTL = int(environ.get('SS_DURACLOUD_LISTING_CACHE_TTL', 300))
+except ValueError:
+    DURACLOUD_LISTING_CACHE_TTL = 300
+
+# Number of packages whose replication state is requested from Arkivum at the
+# same time by the poll_arkivum_status command.
+try:
+    ARKIVUM_STATUS_CONCURRENCY = int(environ.get('SS_ARKIVUM_STATUS_CONCURRENCY', 4))
+except ValueError:
+    ARKIVUM_STATUS_CONCURRENCY = 4
+
+# Number of files of a Dataverse dataset downloaded at the same time.
+try:
+    DATAVERSE_CONCURRENCY = int(environ.get('SS_DATAVERSE_CONCURRENCY', 4))
+except ValueError:
+    DATAVERSE_CONCURRENCY = 4
+
 # SS uses a Python HTTP library called requests. If this setting is set to True,
 # we will skip the SSL certificate verification process. Read more here:
 # http://docs.python-requests.org/en/master/user/advanced/#ssl-cert-verification
@@ -415,3 +489,33 @@ GNUPG_HOME_PATH = environ.get('SS_GNUPG_HOME_PATH', None)
 # - locations.models.pipeline
 # - locations.models.dspace
 INSECURE_SKIP_VERIFY = is_true(environ.get('SS_INSECURE_SKIP_VERIFY', ''))
+
+# Connections to remote services (Arkivum, DSpace, Dataverse, pipelines,
+# callbacks...) are made through the shared sessions in common.http_client.
+# Timeouts are in seconds. Idempotent requests are retried HTTP_MAX_RETRIES
+# times, waiting HTTP_RETRY_BACKOFF * 2 ^ (retry - 1) seconds between them.
+try:
+    HTTP_CONNECT_TIMEOUT = float(environ.get('SS_HTTP_CONNECT_TIMEOUT', 10))
+    HTTP_READ_TIMEOUT = float(environ.get('SS_HTTP_READ_TIMEOUT', 300))
+except ValueError:
+    HTTP_CONNECT_TIMEOUT = 10
+    HTTP_READ_TIMEOUT = 300
+try:
+    HTTP_MAX_RETRIES = int(environ.get('SS_HTTP_MAX_RETRIES', 3))
+except ValueError:
+    HTTP_MAX_RETRIES = 3
+HTTP_RETRY_BACKOFF = 0.5
+# Default number of connections kept open to each remote host
+HTTP_POOL_SIZE = 10
+# Seconds between the summaries of the requests made to each remote service
+# logged by common.http_client. 0 disables them.
+try:
+    HTTP_METRICS_LOG_INTERVAL = int(environ.get('SS_HTTP_METRICS_LOG_INTERVAL', 300))
+except ValueError:
+    HTTP_METRICS_LOG_INTERVAL = 300
+# Number of callbacks executed at the same time, e.g. the post-store
+# callbacks of the files of an AIP
+try:
+    CALLBACK_CONCURRENCY = int(environ.get('SS_CALLBACK_CONCURRENCY', 10))
+except ValueError:
+    CALLBACK_CONCURRENCY = 10